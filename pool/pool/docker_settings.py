@@ -25,4 +25,7 @@ CACHES["page"]["LOCATION"] = "redis://redis:6379/1"
 
 VIEW_CACHE_TIME = 1
 MAX_SUBSTITUTIONS = 2
-STATIC_ROOT = '/usr/local/pool-stats-static'
\ No newline at end of file
+STATIC_ROOT = '/usr/local/pool-stats-static'
+
+# every worker has to hear about every change
+LIVE_UPDATES['broker'] = 'stats.live.RedisBroker'
@@ -51,13 +51,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'stats.middleware.query_budget.QueryBudget',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'stats.middleware.downstream_caching.Disable',
+    'stats.middleware.downstream_caching.Policy',
 ]
 
 ROOT_URLCONF = 'pool.urls'
@@ -218,3 +219,48 @@ LEAGUE = {
 }
 
 VIEW_CACHE_TIME = 86400
+
+# live score updates, see stats/live.py; the local broker only reaches pages served by the same process. Each stream
+# holds a worker, so pages only follow them for sessions that turn on the live_updates feature
+LIVE_UPDATES = {
+    'broker': 'stats.live.LocalBroker',
+    # seconds between keep-alive comments, and before a browser reconnects
+    'keepalive': 15,
+    # seconds before a stream is ended, and the browser reconnects
+    'max_age': 600,
+}
+
+# threads rendering a season's pages into the page cache after its stats are updated, see stats/warming.py
+CACHE_WARMING_WORKERS = 4
+
+# how cached page fragments are rendered, see stats/fragments.py
+FRAGMENT_RENDERING = {
+    # change this when a fragment's template changes, so the fragments rendered before are re-rendered
+    'version': 2,
+    # seconds after which a fragment is rendered again in the background, even if nothing it shows changed
+    'soft_timeout': 3600,
+    # threads rendering stale fragments in the background, in each process
+    'refresh_workers': 2,
+    # seconds before a lock left by a request that died is ignored
+    'lock_timeout': 30,
+    # seconds a request waits for another to render a fragment, then renders it itself
+    'wait': 5,
+    # seconds between checks for the fragment, while waiting
+    'poll': 0.05,
+}
+
+# how long browsers and proxies may keep pages, see stats/middleware/downstream_caching.py
+DOWNSTREAM_CACHING = {
+    # seconds, for the pages of seasons before the current one, which only change if their stats are recomputed
+    'archived_max_age': 86400,
+    # seconds, for other public pages, which are then revalidated
+    'current_max_age': 60,
+}
+
+# seconds between checks of whether the game orders or play positions changed, by each process; see
+# stats/models/league_config.py
+LEAGUE_CONFIG_CHECK_INTERVAL = 10
+
+# seconds without progress from a running stats update job before it's taken for dead, and queued again; longer than
+# any one phase of an update, or chunk of ratings, see stats/models/job.py
+JOB_STALE_AFTER = 1800
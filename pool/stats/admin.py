@@ -7,8 +7,8 @@ from django.utils.safestring import mark_safe
 from django.contrib.admin import SimpleListFilter
 from django.shortcuts import redirect
 
-from .utils import update_season_stats, expire_caches
-from .models import Division, GameOrder, Match, Player, PlayPosition, WeekDivisionMatchup
+from .utils import expire_caches
+from .models import Division, GameOrder, Job, Match, Player, PlayPosition, WeekDivisionMatchup
 from .models import ScoreAdjustment, ScoreSheet, Season, Sponsor, Table, Team, Week
 from .forms import MatchForm, TeamForm, ScoreAdjustmentAdminForm
 from .views.season import get_default_season
@@ -53,6 +53,20 @@ def find_duplicate_table_assignments(obj, request, week):
         )
 
 
+def queue_stats_update(obj, request, season_id):
+    job, created = Job.enqueue(season_id)
+    obj.message_user(
+        request,
+        level='INFO',
+        message=format_html(
+            'Stats update {} as <a href="{}">job {}</a>; its cached pages are refreshed when it is done.',
+            'queued' if created else 'was already queued',
+            reverse('admin:stats_job_change', args=(job.id,)),
+            job.id,
+        ),
+    )
+
+
 class SeasonFilter(SimpleListFilter):
     # a custom filter that defaults to the 'default' season, instead of a 'All'
     # cribbed/modified from https://stackoverflow.com/questions/851636/default-filter-in-django-admin
@@ -156,31 +170,68 @@ class SeasonAdmin(admin.ModelAdmin):
             return False
 
     def update_stats(self, request, queryset):
-        # We need to redirect to this path later, because when we want to expire the cache,
-        # we have to change the path of the request object, resulting in a redirect to the player page
-        # of the last object expired, which is confusing. We can't copy.deepcopy() the request object,
-        # due to a "TypeError: cannot serialize '_io.BufferedReader' object" error.
-        redirect_to = request.get_full_path()
         if len(queryset) == 1:
-            season_id = queryset[0].id
-            update_season_stats(season_id)
-            expire_caches()
-            self.message_user(
-                request,
-                level='INFO',
-                message='Stats updated and caches expired.',
-            )
+            queue_stats_update(self, request, queryset[0].id)
         else:
             self.message_user(
                 request,
                 level='ERROR',
                 message='You must select exactly one season to update stats for.',
             )
-        # see comment about redirect_to above
-        return redirect(redirect_to)
 
 
 admin.site.register(Season, SeasonAdmin)
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'season', 'status', 'progress', 'requests', 'queued', 'waited', 'took', 'queries']
+    list_filter = ['status', 'season']
+    fields = ['season', 'status', 'progress', 'requests', 'queued', 'started', 'heartbeat', 'finished', 'phases',
+              'warming', 'error']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @staticmethod
+    def waited(obj):
+        return '{:.1f}s'.format(obj.waited()) if obj.waited() is not None else ''
+
+    @staticmethod
+    def took(obj):
+        return '{:.1f}s'.format(obj.took()) if obj.took() is not None else ''
+
+    @staticmethod
+    def queries(obj):
+        return obj.report['queries'] if obj.report else ''
+
+    @staticmethod
+    def phases(obj):
+        if not obj.report:
+            return ''
+        return format_html(
+            '<table><tr><th>phase</th><th>seconds</th><th>queries</th></tr>{}</table>',
+            mark_safe(''.join([format_html(
+                '<tr><td>{}</td><td>{}</td><td>{}</td></tr>', p['name'], '{:.2f}'.format(p['seconds']), p['queries']
+            ) for p in obj.report['phases']]))
+        )
+
+    @staticmethod
+    def warming(obj):
+        if not obj.report or 'warming' not in obj.report:
+            return ''
+        return format_html(
+            '<table><tr><th>page</th><th>seconds</th><th>error</th></tr>{}</table>',
+            mark_safe(''.join([format_html(
+                '<tr><td>{}</td><td>{}</td><td>{}</td></tr>', p['page'], '{:.2f}'.format(p['seconds']), p['error'] or ''
+            ) for p in obj.report['warming']]))
+        )
+
+
+admin.site.register(Job, JobAdmin)
 admin.site.register(Sponsor)
 
 
@@ -471,7 +522,10 @@ admin.site.register(PlayPosition, PlayPositionAdmin)
 
 
 def make_official(modeladmin, request, queryset):
-    queryset.update(official=1)
+    # save each score sheet, rather than queryset.update(), so their stats are applied
+    for score_sheet in queryset.exclude(official=1):
+        score_sheet.official = 1
+        score_sheet.save()
 
 
 def lint_score_sheets(modeladmin, request, queryset):
@@ -510,11 +564,7 @@ class BlankScoreSheetFilter(admin.SimpleListFilter):
         # to decide how to filter the queryset.
         # return queryset.filter(birthday__gte=date(1990, 1, 1),)
         if self.value() == 'blank':
-            blank = []
-            for s in queryset:
-                if s.away_wins() == 0 and s.home_wins() == 0:
-                    blank.append(s.id)
-            return ScoreSheet.objects.filter(id__in=blank)
+            return queryset.filter(away_wins=0, home_wins=0)
         else:
             return queryset
 
@@ -535,29 +585,14 @@ class ScoreSheetAdmin(admin.ModelAdmin):
         return mark_safe(score_sheet_links)
 
     def update_stats(self, request, queryset):
-        # We need to redirect to this path later, because when we want to expire the cache,
-        # we have to change the path of the request object, resulting in a redirect to the player page
-        # of the last player updated, which is confusing. We can't copy.deepcopy() the request object,
-        # due to a "TypeError: cannot serialize '_io.BufferedReader' object" error.
-        redirect_to = request.get_full_path()
-        # we'll assume the season is the same for all the score sheets and use the first one
-        update_season_id = queryset[0].match.season.id
         if len(queryset) == 1:
-            update_season_stats(update_season_id)
-            expire_caches()
-            self.message_user(
-                request,
-                level='INFO',
-                message='Stats updated and caches expired.',
-            )
+            queue_stats_update(self, request, queryset[0].match.season_id)
         else:
             self.message_user(
                 request,
                 level='ERROR',
                 message='You must select exactly one score sheet to update stats for.',
             )
-        # see comment about redirect_to above
-        return redirect(redirect_to)
 
 
 admin.site.register(ScoreSheet, ScoreSheetAdmin)
@@ -0,0 +1,154 @@
+import datetime
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.test import Client
+from django.urls import reverse
+
+from .instrumentation import QueryCounter
+from .management.commands.generate_league import SPONSOR_NAME
+from .models import Match, Player, ScoreSheet, Season, Sponsor, Team, Week
+from .models.player_rating import rate_games, truncate_ratings
+from .utils import expire_caches, update_season_stats
+
+
+def generated_database():
+    """
+    :return: whether generate_league generated a league in this database; the benchmark replays the ratings
+    and rewrites the season's stats, which isn't to be done to a real league's
+    """
+    return Sponsor.objects.filter(name=SPONSOR_NAME).exists()
+
+
+class Benchmark(object):
+    """
+    Time the stats updates and the main pages for a season, and count their queries:
+
+        results = Benchmark(season_id).run()
+
+    Each case is run `repeat` times, after its setup; the page caches are expired before each view is fetched,
+    so the views are timed rendering from the database.
+    """
+
+    def __init__(self, season_id, repeat=3, cases=None):
+        self.season = Season.objects.get(id=season_id)
+        self.repeat = repeat
+        self.case_names = cases
+        self.client = Client(SERVER_NAME=self.host())
+
+    @staticmethod
+    def host():
+        for host in settings.ALLOWED_HOSTS:
+            if host not in ['*', '.localhost'] and not host.startswith('.'):
+                return host
+        return 'localhost'
+
+    def cases(self):
+        """
+        :return: a list of (name, setup function, function to time)
+        """
+        season_id = self.season.id
+        score_sheet = ScoreSheet.objects.filter(match__season=self.season, official=1).order_by('id').first()
+        first_game = score_sheet.games.order_by('id').first() if score_sheet else None
+        team = Team.objects.filter(season=self.season).order_by('ranking').first()
+        player = Player.objects.filter(playerseasonsummary__season=self.season).order_by('id').first()
+        week = Week.objects.filter(season=self.season, match__scoresheets__official=1).order_by('date').first()
+        match = Match.objects.filter(season=self.season).order_by('id').first()
+
+        def rerate():
+            truncate_ratings(first_game.id if first_game else None)
+
+        def get(url_name, kwargs=None, data=None):
+            return lambda: self.get(reverse(url_name, kwargs=kwargs), data)
+
+        cases = [
+            ('update_season_stats', None, lambda: update_season_stats(season_id)),
+            ('rate_games', rerate, rate_games),
+            ('Team.update_rankings', None, lambda: Team.update_rankings(season_id)),
+            ('view:teams', expire_caches, get('teams', {'season_id': season_id})),
+            ('view:players', expire_caches, get('players', {'season_id': season_id})),
+            ('view:divisions', expire_caches, get('divisions', {'season_id': season_id})),
+        ]
+        if week is not None:
+            cases.append(('view:week', expire_caches, get('week', {'week_id': week.id})))
+        if team is not None:
+            cases.append(('view:team', expire_caches, get('team', {'team_id': team.id})))
+        if player is not None:
+            cases.append(
+                ('view:player', expire_caches, get('player', {'player_id': player.id, 'season_id': season_id}))
+            )
+            cases.append(('view:rating', expire_caches, get('rating', {'player_id': player.id})))
+        if score_sheet is not None:
+            cases.append(('view:score_sheet', expire_caches, get('score_sheet', {'score_sheet_id': score_sheet.id})))
+        if match is not None:
+            cases.append(('view:matchup', expire_caches, get('matchup', data={'kind': 'match', 'thing': match.id})))
+        if self.case_names:
+            cases = [c for c in cases if c[0] in self.case_names]
+        return cases
+
+    def get(self, url, data=None):
+        response = self.client.get(url, data)
+        if response.status_code != 200:
+            raise RuntimeError('GET {} returned {}'.format(url, response.status_code))
+        return response
+
+    def run_case(self, setup, function):
+        runs = []
+        queries = 0
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = time.monotonic()
+            with QueryCounter() as counter:
+                function()
+            runs.append(time.monotonic() - start)
+            queries = counter.count
+        return {
+            'seconds': min(runs),
+            'median_seconds': statistics.median(runs),
+            'runs': runs,
+            'queries': queries,
+        }
+
+    def run(self, progress=None):
+        # views that need a season in the session get it from here
+        self.client.get(reverse('set_season', kwargs={'season_id': self.season.id}))
+        results = {}
+        for name, setup, function in self.cases():
+            results[name] = self.run_case(setup, function)
+            if progress is not None:
+                progress(name, results[name])
+        return {
+            'season_id': self.season.id,
+            'season': str(self.season),
+            'started': datetime.datetime.now().isoformat(),
+            'repeat': self.repeat,
+            'cases': results,
+        }
+
+
+def compare(earlier, later):
+    """
+    :param earlier: a Benchmark.run() result
+    :param later: another
+    :return: a list of (case name, earlier seconds, later seconds, earlier queries, later queries) for the cases in both
+    """
+    return [
+        (
+            name, earlier['cases'][name]['seconds'], later['cases'][name]['seconds'],
+            earlier['cases'][name]['queries'], later['cases'][name]['queries'],
+        )
+        for name in later['cases'] if name in earlier['cases']
+    ]
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
@@ -1,14 +1,21 @@
 from .models import Season
+from .views.season import request_seasons
 from django.conf import settings
 
 
 def season(request):
-    try:
-        _season = Season.objects.get(id=request.session['season_id'])
-    except (Season.DoesNotExist, KeyError):
-        _season = Season.objects.get(is_default=True)
+    seasons = request_seasons(request)
+    _season = None
+    for s in seasons:
+        if s.id == request.session.get('season_id'):
+            _season = s
+    if _season is None:
+        default_seasons = [s for s in seasons if s.is_default]
+        if not default_seasons:
+            raise Season.DoesNotExist('there is no default season')
+        _season = default_seasons[0]
     return {
-        'seasons': Season.objects.order_by('-pub_date')[0:4],
+        'seasons': seasons[0:4],
         'season': _season
     }
 
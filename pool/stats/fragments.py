@@ -0,0 +1,239 @@
+"""
+Fragments of pages, kept in the page cache, tagged with the seasons, teams and players they show.
+
+A change invalidates just the tags it affects, instead of clearing the page cache: a fragment is only used if
+none of its tags were invalidated after it started rendering, so, eg, updating this season's stats leaves
+past seasons' pages cached. What came after what is told by a sequence number kept in the page cache, incremented
+by each invalidation, rather than by the clocks of the processes involved.
+
+    def render():
+        players = the_players()
+        return render_the_table(players), [season_tag(season_id)] + [player_tag(p.id) for p in players]
+
+    table = Fragment('players_table.{}'.format(season_id)).get_or_render(render)
+
+A fragment is stale once any of its tags is invalidated, it's past its soft expiry, or it was rendered by an
+older version of the fragments. A stale copy is served as it is, while one request renders it again in the
+background, so a stats update doesn't slow down the pages showing it. Only a fragment that isn't cached at all is
+rendered in the request, by just one request at a time: the others wait for it, instead of all of them rendering
+it at once.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from .models.globals import logger
+
+
+page_cache = caches['page']
+
+_refresh_executor = None
+_refresh_executor_lock = threading.Lock()
+# the background renderings that haven't finished
+refreshes = set()
+# whether this thread served a stale fragment, since reset_served_stale()
+_served = threading.local()
+
+
+def season_tag(season_id):
+    return 'season.{}'.format(season_id)
+
+
+def team_tag(team_id):
+    return 'team.{}'.format(team_id)
+
+
+def player_tag(player_id):
+    return 'player.{}'.format(player_id)
+
+
+def ratings_tag():
+    # the players' current ratings, in every season
+    return 'ratings'
+
+
+def tag_key(tag):
+    return 'tag.{}'.format(tag)
+
+
+def lock_key(key):
+    return 'lock.{}'.format(key)
+
+
+SEQUENCE_KEY = 'tags.sequence'
+
+
+def sequence():
+    """
+    :return: the invalidation sequence number; a fragment that starts rendering now is newer than the
+    invalidations up to this one
+    """
+    number = page_cache.get(SEQUENCE_KEY)
+    if number is None:
+        # a new sequence, eg after the page cache was cleared, starts after where the last one is likely to have
+        # got to, so the versions of the pages downstream aren't used again
+        page_cache.add(SEQUENCE_KEY, int(time.time() * 1000), timeout=None)
+        number = page_cache.get(SEQUENCE_KEY)
+    return number
+
+
+def next_sequence():
+    try:
+        return page_cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        sequence()
+        return page_cache.incr(SEQUENCE_KEY)
+
+
+def invalidate(tags):
+    """
+    Invalidate every fragment tagged with any of tags.
+    """
+    number = next_sequence()
+    page_cache.set_many({tag_key(t): number for t in tags}, timeout=None)
+
+
+def invalidated(tags, missing=None):
+    """
+    :param missing: the sequence number to record for tags that haven't been invalidated, or were forgotten, eg
+    after the page cache was cleared; the next one, if not given, as anything tagged with them might be out of
+    date.
+    :return: {tag: the sequence number of its last invalidation}
+    """
+    keys = {tag_key(t): t for t in tags}
+    numbers = page_cache.get_many(keys.keys())
+    for key in keys:
+        if key not in numbers:
+            page_cache.add(key, next_sequence() if missing is None else missing, timeout=None)
+            numbers[key] = page_cache.get(key)
+    return {keys[k]: v for k, v in numbers.items()}
+
+
+def refresh_executor():
+    global _refresh_executor
+    with _refresh_executor_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(
+                max_workers=settings.FRAGMENT_RENDERING['refresh_workers'], thread_name_prefix='fragment-refresh'
+            )
+    return _refresh_executor
+
+
+def wait_for_refreshes(timeout=None):
+    """
+    Wait for the fragments being rendered again in the background, eg before checking they're cached.
+    """
+    wait(list(refreshes), timeout=timeout)
+
+
+def reset_served_stale():
+    _served.stale = False
+
+
+def served_stale():
+    """
+    :return: whether this thread served a stale fragment since reset_served_stale(), eg for the response not to
+    be cached downstream
+    """
+    return getattr(_served, 'stale', False)
+
+
+class Fragment(object):
+
+    def __init__(self, key):
+        self.key = key
+        # the fragment is only as new as the data read after this
+        self.started = sequence()
+        # the background rendering of a stale fragment, if get_or_render started one
+        self.refresh = None
+
+    def lookup(self):
+        """
+        :return: (the cached entry, or None, whether it is fresh: none of its tags were invalidated since it
+        was rendered, it was rendered by this version of the fragments, and it isn't past its soft expiry)
+        """
+        entry = page_cache.get(self.key)
+        if entry is None:
+            return None, False
+        if entry.get('version') != settings.FRAGMENT_RENDERING['version'] or \
+                entry.get('expires', 0) <= time.time():
+            return entry, False
+        return entry, max(list(invalidated(entry['tags']).values()) + [0]) <= entry['started']
+
+    def get(self):
+        """
+        :return: the fragment, or None if it isn't cached, or isn't fresh
+        """
+        entry, fresh = self.lookup()
+        return entry['value'] if fresh else None
+
+    def get_or_render(self, render, stale=True):
+        """
+        The fragment, if it's fresh. A stale copy is served as it is, while the request that gets the
+        fragment's lock renders it again in the background. Without one, the request that gets the lock renders
+        it, and the others wait up to FRAGMENT_RENDERING['wait'] seconds for it, then render it themselves.
+        :param render: a function that returns (the fragment, its tags)
+        :param stale: whether a stale copy may be served; if not, the fragment is rendered like it isn't cached
+        """
+        entry, fresh = self.lookup()
+        if fresh:
+            return entry['value']
+
+        lock, token = lock_key(self.key), uuid.uuid4().hex
+        locked = page_cache.add(lock, token, timeout=settings.FRAGMENT_RENDERING['lock_timeout'])
+        if entry is not None and stale:
+            if locked:
+                self.refresh = refresh_executor().submit(self.render_in_background, render, lock, token)
+                refreshes.add(self.refresh)
+                self.refresh.add_done_callback(refreshes.discard)
+            _served.stale = True
+            return entry['value']
+
+        if not locked:
+            deadline = time.monotonic() + settings.FRAGMENT_RENDERING['wait']
+            while not locked and time.monotonic() < deadline:
+                time.sleep(settings.FRAGMENT_RENDERING['poll'])
+                value = self.get()
+                if value is not None:
+                    return value
+                # the lock is gone without a fragment, eg the rendering request failed
+                locked = page_cache.add(lock, token, timeout=settings.FRAGMENT_RENDERING['lock_timeout'])
+
+        return self.render_and_set(render, lock if locked else None, token)
+
+    def render_and_set(self, render, lock, token):
+        # rendered now, the fragment is as new as the data read from here on
+        self.started = sequence()
+        try:
+            value, tags = render()
+            self.set(value, tags)
+        finally:
+            if lock is not None and page_cache.get(lock) == token:
+                page_cache.delete(lock)
+        return value
+
+    def render_in_background(self, render, lock, token):
+        try:
+            return self.render_and_set(render, lock, token)
+        except Exception:
+            logger.exception('rendering {} failed'.format(self.key))
+        finally:
+            # each thread has its own database connection
+            connections.close_all()
+
+    def set(self, value, tags):
+        tags = sorted(set(tags))
+        # tags that aren't known yet were not invalidated while this was rendering
+        invalidated(tags, missing=0)
+        page_cache.set(self.key, {
+            'value': value,
+            'tags': tags,
+            'started': self.started,
+            'version': settings.FRAGMENT_RENDERING['version'],
+            'expires': time.time() + settings.FRAGMENT_RENDERING['soft_timeout'],
+        })
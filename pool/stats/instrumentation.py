@@ -0,0 +1,42 @@
+import time
+
+from django.db import connections
+
+
+class QueryCounter(object):
+    """
+    Count the queries run on a database connection, and how long they took, while the counter is active:
+
+        with QueryCounter() as counter:
+            do_things()
+        print(counter.count, counter.duration)
+    """
+
+    def __init__(self, using='default'):
+        self.connection = connections[using]
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = None
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.monotonic() - start
+            self.count += 1
+            self.duration += elapsed
+            if elapsed >= self.slowest_duration:
+                self.slowest_duration = elapsed
+                self.slowest_sql = sql
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+        self._wrapper = None
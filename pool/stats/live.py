@@ -0,0 +1,194 @@
+"""
+Live score updates: changes to score sheets are published to channels, one per score sheet and one per week,
+and streamed to the pages watching them as server-sent events, so watching costs no database queries.
+
+The broker is set by LIVE_UPDATES['broker']: LocalBroker only reaches watchers served by the same process,
+which is fine for development; RedisBroker reaches every process, through redis pub/sub.
+"""
+import json
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+from .models.globals import logger
+
+
+def score_sheet_channel(score_sheet_id):
+    return 'stats.live.score_sheet.{}'.format(score_sheet_id)
+
+
+def week_channel(week_id):
+    return 'stats.live.week.{}'.format(week_id)
+
+
+class LocalBroker(object):
+    """
+    Delivers messages to subscribers in this process, through a queue per subscriber.
+    """
+
+    class Subscription(object):
+
+        def __init__(self, broker, channels):
+            self.broker = broker
+            self.channels = channels
+            self.queue = queue.Queue()
+
+        def get(self, timeout):
+            """
+            :return: the next message, or None if there wasn't one within timeout seconds
+            """
+            try:
+                return self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+
+        def close(self):
+            self.broker.unsubscribe(self)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, []))
+        for subscription in subscriptions:
+            subscription.queue.put(message)
+
+    def subscribe(self, channels):
+        subscription = self.Subscription(self, channels)
+        with self.lock:
+            for channel in channels:
+                self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions.get(channel, set()).discard(subscription)
+                if not self.subscriptions.get(channel):
+                    self.subscriptions.pop(channel, None)
+
+
+class RedisBroker(object):
+    """
+    Delivers messages through redis pub/sub, on the default cache's redis server.
+    """
+
+    class Subscription(object):
+
+        def __init__(self, pubsub):
+            self.pubsub = pubsub
+
+        def get(self, timeout):
+            message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+            if message is None:
+                return None
+            return message['data'].decode() if isinstance(message['data'], bytes) else message['data']
+
+        def close(self):
+            self.pubsub.close()
+
+    @staticmethod
+    def connection():
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+
+    def publish(self, channel, message):
+        self.connection().publish(channel, message)
+
+    def subscribe(self, channels):
+        pubsub = self.connection().pubsub()
+        pubsub.subscribe(*channels)
+        return self.Subscription(pubsub)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.LIVE_UPDATES['broker'])()
+    return _broker
+
+
+def publish(channels, message):
+    """
+    Publish a message, once the transaction it was made in, if any, is committed; a broker that is down is
+    logged, rather than failing the change.
+    """
+    data = json.dumps(message, cls=DjangoJSONEncoder)
+
+    def send():
+        for channel in channels:
+            try:
+                get_broker().publish(channel, data)
+            except Exception as e:
+                logger.warning('could not publish to {}: {}'.format(channel, e))
+
+    transaction.on_commit(send)
+
+
+def publish_games(score_sheet, games):
+    """
+    Publish games' results, and the score sheet's totals, to the score sheet's and its week's channels.
+    """
+    totals = {
+        'score_sheet': score_sheet.id,
+        'away_wins': score_sheet.away_wins,
+        'home_wins': score_sheet.home_wins,
+    }
+    publish([score_sheet_channel(score_sheet.id)], dict(totals, type='games', games=[{
+        'id': g.id,
+        'winner': g.winner,
+        'forfeit': g.forfeit,
+        'table_run': g.table_run,
+        'timestamp': g.timestamp,
+    } for g in games]))
+    publish([week_channel(score_sheet.match.week_id)], dict(totals, type='score'))
+
+
+def publish_lineup(score_sheet):
+    """
+    Tell the score sheet's watchers its players changed; there is too much in a lineup to make a useful
+    delta, so they reload the summary.
+    """
+    publish([score_sheet_channel(score_sheet.id)], {'type': 'lineup', 'score_sheet': score_sheet.id})
+
+
+def stream(channels):
+    """
+    :return: a response streaming the messages published to channels, as server-sent events; it ends after
+    LIVE_UPDATES['max_age'] seconds, and the browser reconnects, so long-lived workers are not tied up forever.
+    """
+    keepalive = settings.LIVE_UPDATES['keepalive']
+    max_age = settings.LIVE_UPDATES['max_age']
+
+    def events():
+        # subscribed here rather than in the view, so a response that is never read doesn't subscribe
+        subscription = get_broker().subscribe(channels)
+        try:
+            yield 'retry: {}\n\n'.format(keepalive * 1000)
+            end = time.monotonic() + max_age
+            while time.monotonic() < end:
+                message = subscription.get(timeout=keepalive)
+                if message is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield 'data: {}\n\n'.format(message)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    # nginx buffers responses, unless told not to
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...benchmark import Benchmark, compare, generated_database, load, save
+from ...views.season import get_default_season
+
+
+class Command(BaseCommand):
+    help = 'Time the stats updates and the main pages for a season, and compare with an earlier run. This ' \
+           'deletes and replays ratings, and rewrites the season\'s stats, so it only runs on a database with a ' \
+           'league from generate_league in it, unless --i-know-this-is-destructive is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--season', type=int, default=None, help='the season id; the default season if not given')
+        parser.add_argument('--repeat', type=int, default=3, help='how many times to run each case')
+        parser.add_argument('--case', dest='cases', action='append', default=None,
+                            help='run only this case; can be given more than once')
+        parser.add_argument('--output', default='benchmark.json', help='the file to write the results to')
+        parser.add_argument('--compare', default=None, help='the results of an earlier run to compare with')
+        parser.add_argument('--i-know-this-is-destructive', dest='destructive', default=False, action='store_true',
+                            help='run on a database without a generated league, eg a copy of the real one')
+
+    def handle(self, *args, **options):
+
+        if not options['destructive'] and not generated_database():
+            raise CommandError('there is no generated league in this database, and the benchmark deletes and '
+                               'replays its ratings; use --i-know-this-is-destructive to run it anyway')
+
+        def progress(name, result):
+            self.stdout.write('{:<24} {:>9.3f}s {:>7} queries'.format(name, result['seconds'], result['queries']))
+
+        benchmark = Benchmark(options['season'] or get_default_season(), options['repeat'], options['cases'])
+        results = benchmark.run(progress=progress)
+        save(results, options['output'])
+        self.stdout.write(self.style.SUCCESS('results written to {}'.format(options['output'])))
+
+        if options['compare']:
+            self.stdout.write('{:<24} {:>10} {:>10} {:>8} {:>8} {:>8}'.format(
+                'case', 'before', 'after', 'change', 'queries', 'after'
+            ))
+            for name, before, after, before_queries, after_queries in compare(load(options['compare']), results):
+                change = (after - before) / before * 100 if before else 0.0
+                self.stdout.write('{:<24} {:>9.3f}s {:>9.3f}s {:>7.1f}% {:>8} {:>8}'.format(
+                    name, before, after, change, before_queries, after_queries
+                ))
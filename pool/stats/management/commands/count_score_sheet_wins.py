@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ...models import ScoreSheet
+
+
+class Command(BaseCommand):
+    help = 'Recount the score sheets\' win totals from their games'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--season', type=int, default=None, help='only this season\'s score sheets')
+
+    def handle(self, *args, **options):
+        score_sheets = ScoreSheet.objects.all()
+        if options['season'] is not None:
+            score_sheets = score_sheets.filter(match__season_id=options['season'])
+        count = ScoreSheet.update_wins_for(score_sheets)
+        self.stdout.write(self.style.SUCCESS('counted the wins of {} score sheets'.format(count)))
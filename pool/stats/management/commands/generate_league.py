@@ -0,0 +1,196 @@
+import datetime
+import math
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import AwaySubstitution, Division, HomeSubstitution, Match, Participant, Player, ScoreSheet, Season, \
+    Sponsor, Table, Team, Tournament, TournamentMatchup, Week, league_config
+from ...models.globals import away_home
+from ...models.player_rating import rate_games
+
+
+FIRST_NAMES = [
+    'Alex', 'Bo', 'Charlie', 'Dana', 'Eddie', 'Frankie', 'Gale', 'Harper', 'Izzy', 'Jo', 'Kim', 'Lee',
+    'Max', 'Noel', 'Ollie', 'Pat', 'Quinn', 'Robin', 'Sam', 'Terry', 'Val', 'Wes', 'Yan', 'Zee',
+]
+# the sponsor of every generated league; the benchmark command looks for it, see stats.benchmark
+SPONSOR_NAME = 'Synthetic Sponsor'
+
+LAST_NAMES = [
+    'Banks', 'Corner', 'Diamond', 'Eight', 'Felt', 'Kiss', 'Masse', 'Nine', 'Pocket', 'Rack', 'Rail', 'Spin',
+]
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic league, with played and official score sheets, for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seasons', type=int, default=2)
+        parser.add_argument('--divisions', type=int, default=2, help='per season')
+        parser.add_argument('--teams', type=int, default=8, help='per division')
+        parser.add_argument('--roster', type=int, default=6, help='players per team')
+        parser.add_argument('--weeks', type=int, default=12, help='per season')
+        parser.add_argument('--tournaments', type=int, default=1, help='singles tournaments per season')
+        parser.add_argument('--substitution-rate', dest='substitution_rate', type=float, default=0.2,
+                            help='the chance of a team making a substitution on a score sheet')
+        parser.add_argument('--forfeit-rate', dest='forfeit_rate', type=float, default=0.02,
+                            help='the chance of a game being a forfeit')
+        parser.add_argument('--start', type=datetime.date.fromisoformat, default=datetime.date(2001, 1, 2),
+                            help='the date of the first week of the first season, like 2001-01-02')
+        parser.add_argument('--default', default=False, action='store_true',
+                            help='make the last season generated the default season')
+        parser.add_argument('--seed', type=int, default=None, help='for the random number generator')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.positions = league_config.play_positions(tiebreaker=False)
+        self.game_orders = league_config.game_orders(tiebreaker=False)
+        if not len(self.positions) or not len(self.game_orders):
+            raise CommandError('there are no play positions or game orders; load them first, eg with the '
+                               'sample_game_setup fixture')
+        if options['roster'] < len(self.positions):
+            raise CommandError('rosters need at least {} players'.format(len(self.positions)))
+        # each player has a hidden skill, that decides who wins their games
+        self.skills = {}
+
+        sponsor = Sponsor.objects.create(name=SPONSOR_NAME, address='1 Synthetic St.', link='')
+        team_count = options['divisions'] * options['teams']
+        tables = [Table.objects.create(name='Table {}'.format(i + 1), venue=sponsor) for i in range(team_count)]
+        rosters = [[self.create_player() for _ in range(options['roster'])] for _ in range(team_count)]
+
+        season = None
+        for season_number in range(options['seasons']):
+            start = options['start'] + datetime.timedelta(weeks=26 * season_number)
+            season = self.create_season(season_number, start, tables, rosters)
+            self.stdout.write('generated season {}'.format(season))
+            # a few players move on between seasons
+            for roster in rosters:
+                roster[self.random.randrange(len(roster))] = self.create_player()
+        if options['default'] and season is not None:
+            Season.objects.filter(is_default=True).update(is_default=False)
+            season.is_default = True
+            season.save()
+
+        rated = rate_games()
+        self.stdout.write(self.style.SUCCESS('generated {} seasons, rated {} games'.format(options['seasons'], rated)))
+
+    def create_player(self):
+        player = Player.objects.create(
+            first_name=self.random.choice(FIRST_NAMES),
+            last_name='{} {}'.format(self.random.choice(LAST_NAMES), Player.objects.count() + 1),
+        )
+        self.skills[player.id] = self.random.gauss(0, 1)
+        return player
+
+    def create_season(self, season_number, start, tables, rosters):
+        options = self.options
+        season = Season.objects.create(
+            name='Synthetic {} {}'.format(season_number + 1, start.year),
+            pub_date=start,
+            minimum_games=len(self.game_orders) // len(self.positions),
+        )
+        teams = []
+        for division_number in range(options['divisions']):
+            division = Division.objects.create(season=season, name='Division {}'.format(division_number + 1))
+            for team_number in range(options['teams']):
+                index = division_number * options['teams'] + team_number
+                team = Team.objects.create(
+                    season=season, division=division, table=tables[index],
+                    name='Team {} {}'.format(index + 1, season.name),
+                )
+                team.players.add(*rosters[index])
+                team.captain = rosters[index][0]
+                team.save()
+                teams.append(team)
+
+        for week_number, pairs in enumerate(self.schedule(teams)):
+            week = Week.objects.create(
+                season=season, date=start + datetime.timedelta(weeks=week_number),
+                name='Week {}'.format(week_number + 1),
+            )
+            for away_team, home_team in pairs:
+                match = Match.objects.create(season=season, week=week, away_team_id=away_team.id,
+                                             home_team_id=home_team.id)
+                with transaction.atomic():
+                    self.play_score_sheet(match, {'away': away_team, 'home': home_team})
+
+        for tournament_number in range(options['tournaments']):
+            self.play_tournament(season, tournament_number)
+        return season
+
+    def schedule(self, teams):
+        """
+        Round-robin the teams, with the circle method, for as many weeks as asked for
+        :return: for each week, a list of (away team, home team)
+        """
+        teams = list(teams)
+        if len(teams) % 2:
+            teams.append(None)
+        weeks = []
+        for week_number in range(self.options['weeks']):
+            pairs = []
+            for i in range(len(teams) // 2):
+                pair = (teams[i], teams[-i - 1]) if week_number % 2 else (teams[-i - 1], teams[i])
+                if None not in pair:
+                    pairs.append(pair)
+            weeks.append(pairs)
+            teams.insert(1, teams.pop())
+        return weeks
+
+    def play_score_sheet(self, match, teams):
+        score_sheet = ScoreSheet(match=match)
+        score_sheet.save()
+        score_sheet.initialize_lineup()
+        score_sheet.initialize_games()
+
+        for ah in away_home:
+            players = list(teams[ah].players.all())
+            self.random.shuffle(players)
+            for lineup_entry, player in zip(getattr(score_sheet, '{}_lineup'.format(ah)).all(), players):
+                lineup_entry.player = player
+                lineup_entry.save()
+            bench = players[len(self.positions):]
+            if len(bench) and self.random.random() < self.options['substitution_rate']:
+                substitution_class = AwaySubstitution if ah == 'away' else HomeSubstitution
+                substitution = substitution_class(
+                    game_order=self.random.choice(self.game_orders),
+                    player=self.random.choice(bench),
+                )
+                substitution.save()
+                getattr(score_sheet, '{}_substitutions'.format(ah)).add(substitution)
+        score_sheet.set_games()
+
+        for game in score_sheet.games.all():
+            away_chance = 1 / (1 + math.exp(self.skills[game.home_player_id] - self.skills[game.away_player_id]))
+            game.winner = 'away' if self.random.random() < away_chance else 'home'
+            game.forfeit = self.random.random() < self.options['forfeit_rate']
+            game.table_run = not game.forfeit and self.random.random() < 0.03
+            game.save()
+        score_sheet.official = 1
+        score_sheet.save()
+
+    def play_tournament(self, season, tournament_number):
+        # the players are seeded by their season stats, so they have to have played
+        players = list(Player.objects.filter(playerseasonsummary__season=season).order_by('id'))
+        if len(players) < 2:
+            return
+        tournament = Tournament.objects.create(
+            name='{} singles {}'.format(season.name, tournament_number + 1),
+            type='singles', elimination='single', season=season, seeded=True,
+        )
+        for player in self.random.sample(players, min(16, 2 ** int(math.log(len(players), 2)))):
+            Participant.objects.create(tournament=tournament, type='player', player=player)
+        tournament.update_seeds()
+        tournament.build_brackets()
+        for matchup in TournamentMatchup.objects.filter(
+                round__bracket__tournament=tournament).order_by('round__number', 'number'):
+            matchup.refresh_from_db()
+            if matchup.participant_a is None or matchup.participant_b is None:
+                continue
+            matchup.winner = self.random.choice([matchup.participant_a, matchup.participant_b])
+            matchup.save()
+            matchup.update_affected_matchups()
+        tournament.update_places()
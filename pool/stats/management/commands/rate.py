@@ -1,10 +1,46 @@
 from django.core.management.base import BaseCommand
 
-from ...models.player_rating import rate_games
+from ...models.player_rating import RATING_CHUNK_SIZE, check_bookmark_initialized, get_unrated_games, \
+    rate_chunks, truncate_dirty_ratings, truncate_ratings
 
 
 class Command(BaseCommand):
+    help = 'Rate the games played since the last run, or rebuild the ratings from a game onwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', default=False, action='store_true',
+            help='delete the existing ratings and re-rate the games, from --since-game if given',
+        )
+        parser.add_argument(
+            '--since-game', dest='since_game', type=int, default=None,
+            help='with --rebuild, the first game id to re-rate',
+        )
+        parser.add_argument(
+            '--chunk-size', dest='chunk_size', type=int, default=RATING_CHUNK_SIZE,
+            help='how many games to rate between commits',
+        )
 
     def handle(self, *args, **options):
 
-        rate_games()
+        check_bookmark_initialized()
+        if options['rebuild']:
+            truncate_ratings(options['since_game'])
+            self.stdout.write('deleted ratings from game {}'.format(options['since_game'] or 'one'))
+        elif options['since_game'] is not None:
+            self.stderr.write('--since-game needs --rebuild')
+            return
+        else:
+            # games corrected since they were rated are replayed, as rate_games() does
+            dirty_from_game = truncate_dirty_ratings()
+            if dirty_from_game is not None:
+                self.stdout.write('deleted ratings from corrected game {}'.format(dirty_from_game))
+
+        # the bookmark is moved after each chunk, which makes it the checkpoint for an interrupted run:
+        # running this command again, without --rebuild, picks up where it left off.
+        unrated_games = get_unrated_games()
+        total = unrated_games.count()
+        rated = 0
+        for rated in rate_chunks(unrated_games, options['chunk_size']):
+            self.stdout.write('rated {} of {} games'.format(rated, total))
+        self.stdout.write(self.style.SUCCESS('rated {} games'.format(rated)))
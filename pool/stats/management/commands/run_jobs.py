@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...models import Job
+
+
+class Command(BaseCommand):
+    help = 'Run the queued season stats updates; keeps polling for more, unless --once is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', default=False, action='store_true',
+                            help='run the jobs queued now, then exit')
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help='seconds to wait between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        while True:
+            job = Job.claim()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            self.stdout.write('running job {}: {}'.format(job.id, job))
+            job.run()
+            if job.status == Job.DONE:
+                self.stdout.write(self.style.SUCCESS('job {} done in {:.1f}s'.format(job.id, job.took())))
+            else:
+                self.stderr.write('job {} failed:\n{}'.format(job.id, job.error))
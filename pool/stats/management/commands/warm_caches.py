@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Season
+from ...warming import warm_season
+
+
+class Command(BaseCommand):
+    help = 'Render a season\'s players tables, divisions and team players tables into the page cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--season', type=int, default=None, help='the default season, if not given')
+        parser.add_argument('--workers', type=int, default=None, help='threads rendering pages')
+
+    def handle(self, *args, **options):
+        season_id = options['season'] or Season.objects.get(is_default=True).id
+        for page in warm_season(season_id, workers=options['workers']):
+            if page['error']:
+                self.stderr.write('{}: {}'.format(page['page'], page['error']))
+            else:
+                self.stdout.write('{:.2f}s {}'.format(page['seconds'], page['page']))
@@ -1,12 +1,116 @@
-from django.utils.cache import add_never_cache_headers
+"""
+What browsers and proxies may keep, by URL name.
 
+A season's divisions, teams and players pages only change when its stats are updated or its teams or their rosters
+are changed, or, with ratings shown, when players are rated, so they're public, with an ETag from the invalidation
+sequence numbers of the season's page fragments, or the ratings, see stats.fragments; they're kept for
+DOWNSTREAM_CACHING['archived_max_age'] seconds if the season is before the current one, and
+DOWNSTREAM_CACHING['current_max_age'] otherwise, then revalidated. A conditional GET for one that hasn't changed is
+answered with a 304, without running the view. A response with a stale fragment in it, being rendered again in the
+background, isn't cached, as its content is older than its version.
 
-class Disable(object):
+Pages that aren't anyone's in particular, like the sponsors, are public too, without validators. Everything else,
+pages showing the session's things, editing pages, and pages that change as games are played, is never cached.
+"""
+from django.conf import settings
+from django.utils.cache import (
+    add_never_cache_headers, get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import quote_etag
+
+from ..fragments import invalidated, ratings_tag, reset_served_stale, season_tag, served_stale
+from ..views.season import request_seasons
+
+
+# pages of a season's stats, by the season_id in the URL
+SEASON = 'season'
+# pages that aren't anyone's in particular, and rarely change
+PUBLIC = 'public'
+# the rest
+PRIVATE = 'private'
+
+CACHE_CLASSES = {
+    'divisions': SEASON,
+    'players': SEASON,
+    'teams': SEASON,
+    'seasons': PUBLIC,
+    'sponsor': PUBLIC,
+    'sponsors': PUBLIC,
+}
+
+
+def season_archived(request, season_id):
+    """
+    :return: whether the season is before the default season, or None if there is no such season
+    """
+    seasons = {s.id: s for s in request_seasons(request)}
+    if season_id not in seasons:
+        return None
+    default_seasons = [s for s in seasons.values() if s.is_default]
+    return bool(default_seasons) and seasons[season_id].pub_date < default_seasons[0].pub_date
+
+
+def season_etag(request, season_id, version):
+    # the menu shows the session's season, and the players tables its rating setting
+    return quote_etag('{}-{}-{}-{}-{:d}'.format(
+        season_id, version, settings.FRAGMENT_RENDERING['version'],
+        request.session.get('season_id', 0), bool(request.session.get('rating', False))
+    ))
+
+
+def season_policy(request, season_id):
+    archived = season_archived(request, season_id)
+    if archived is None:
+        return None
+    tags = [season_tag(season_id)] + ([ratings_tag()] if request.session.get('rating', False) else [])
+    version = max(invalidated(tags).values())
+    return {
+        'max_age': settings.DOWNSTREAM_CACHING['archived_max_age' if archived else 'current_max_age'],
+        'season_id': season_id,
+        'version': version,
+        'etag': season_etag(request, season_id, version),
+    }
+
+
+def cache_policy(request, view_kwargs):
+    """
+    :return: {'max_age': seconds, and for a season's pages, 'season_id', 'version' and 'etag'}, or None if the
+    response is not to be cached
+    """
+    if request.method not in ('GET', 'HEAD') or request.resolver_match is None:
+        return None
+    cache_class = CACHE_CLASSES.get(request.resolver_match.url_name, PRIVATE)
+    if cache_class == PUBLIC:
+        return {'max_age': settings.DOWNSTREAM_CACHING['current_max_age']}
+    if cache_class == SEASON and view_kwargs.get('season_id'):
+        return season_policy(request, int(view_kwargs['season_id']))
+    return None
+
+
+class Policy(object):
 
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
         response = self.get_response(request)
-        add_never_cache_headers(response)
+        policy = getattr(request, 'cache_policy', None)
+        if policy is None or response.status_code not in (200, 304) or response.has_header('Cache-Control') or \
+                served_stale():
+            add_never_cache_headers(response)
+            return response
+
+        patch_cache_control(response, public=True, max_age=policy['max_age'])
+        # the pages are rendered for the session, so they can't be shared between sessions
+        patch_vary_headers(response, ['Cookie'])
+        if 'etag' in policy:
+            # the view may have changed the session, eg set its season
+            response['ETag'] = season_etag(request, policy['season_id'], policy['version'])
         return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        reset_served_stale()
+        request.cache_policy = cache_policy(request, view_kwargs)
+        if request.cache_policy is not None and 'etag' in request.cache_policy:
+            return get_conditional_response(request, etag=request.cache_policy['etag'])
+        return None
@@ -0,0 +1,51 @@
+import json
+import logging
+
+from django.conf import settings
+
+from ..instrumentation import QueryCounter
+
+
+logger = logging.getLogger(__name__)
+
+# keep the headers and log lines a sensible size
+SLOWEST_SQL_LENGTH = 500
+
+
+class QueryBudget(object):
+    """
+    Count the queries each request runs, how long they took, and which was slowest. In DEBUG these are
+    added to the response as X-Query-* headers; otherwise they are logged, as JSON, keyed by URL name.
+    They are also left on the response as `query_stats`, for tests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        stats = {
+            'view': resolver_match.url_name if resolver_match else None,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': counter.count,
+            'db_ms': round(counter.duration * 1000, 2),
+            'slowest_ms': round(counter.slowest_duration * 1000, 2),
+            'slowest_sql': (counter.slowest_sql or '')[:SLOWEST_SQL_LENGTH],
+        }
+        response.query_stats = stats
+
+        if settings.DEBUG:
+            response['X-Query-View'] = stats['view'] or ''
+            response['X-Query-Count'] = stats['queries']
+            response['X-Query-Time-Ms'] = stats['db_ms']
+            response['X-Query-Slowest-Ms'] = stats['slowest_ms']
+            # header values have to be one line of latin-1
+            response['X-Query-Slowest'] = ' '.join(stats['slowest_sql'].split()).encode(
+                'latin-1', 'replace').decode('latin-1')
+        else:
+            logger.info(json.dumps(stats))
+        return response
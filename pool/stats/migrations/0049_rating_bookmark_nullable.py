@@ -0,0 +1,19 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0048_score_adjustments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='playerratingbookmark',
+            name='game',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='stats.game'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0049_rating_bookmark_nullable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playerratingbookmark',
+            name='dirty_from_game',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
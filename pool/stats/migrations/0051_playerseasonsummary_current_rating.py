@@ -0,0 +1,48 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+def copy_latest_ratings(apps, schema_editor):
+    PlayerRating = apps.get_model('stats', 'PlayerRating')
+    PlayerSeasonSummary = apps.get_model('stats', 'PlayerSeasonSummary')
+    # each player's rating from their latest game, as get_latest_player_ratings() picks it
+    latest_rating = PlayerRating.objects.filter(
+        player_id=models.OuterRef('player_id')
+    ).order_by('-game_id').values('id')[:1]
+    ratings = {r.player_id: r for r in PlayerRating.objects.filter(id=models.Subquery(latest_rating))}
+    summaries = list(PlayerSeasonSummary.objects.filter(player_id__in=ratings.keys()))
+    for summary in summaries:
+        rating = ratings[summary.player_id]
+        summary.current_mu = rating.mu
+        summary.current_sigma = rating.sigma
+        summary.rating_game_id = rating.game_id
+    PlayerSeasonSummary.objects.bulk_update(
+        summaries, ['current_mu', 'current_sigma', 'rating_game_id'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0050_rating_dirty_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playerseasonsummary',
+            name='current_mu',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerseasonsummary',
+            name='current_sigma',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerseasonsummary',
+            name='rating_game_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(copy_latest_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0051_playerseasonsummary_current_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=8)),
+                ('requests', models.IntegerField(default=1)),
+                ('progress', models.CharField(blank=True, max_length=64)),
+                ('queued', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('report', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('season', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='stats.season')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:04
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_wins(apps, schema_editor):
+    ScoreSheet = apps.get_model('stats', 'ScoreSheet')
+    totals = ScoreSheet.objects.order_by().values('id').annotate(
+        away=Count('games', filter=Q(games__winner='away')),
+        home=Count('games', filter=Q(games__winner='home')),
+        away_forfeit=Count('games', filter=Q(games__winner='away', games__forfeit=True)),
+        home_forfeit=Count('games', filter=Q(games__winner='home', games__forfeit=True)),
+    )
+    score_sheets = [
+        ScoreSheet(
+            id=t['id'], away_wins=t['away'], home_wins=t['home'],
+            away_forfeit_wins=t['away_forfeit'], home_forfeit_wins=t['home_forfeit'],
+        ) for t in totals
+    ]
+    ScoreSheet.objects.bulk_update(
+        score_sheets, ['away_wins', 'home_wins', 'away_forfeit_wins', 'home_forfeit_wins'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0052_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scoresheet',
+            name='away_forfeit_wins',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scoresheet',
+            name='away_wins',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scoresheet',
+            name='home_forfeit_wins',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scoresheet',
+            name='home_wins',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_wins, migrations.RunPython.noop),
+    ]
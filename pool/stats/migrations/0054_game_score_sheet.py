@@ -0,0 +1,60 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def copy_score_sheets(apps, schema_editor):
+    Game = apps.get_model('stats', 'Game')
+    ScoreSheet = apps.get_model('stats', 'ScoreSheet')
+    ScoreSheetGames = ScoreSheet._meta.get_field('games').remote_field.through
+    # one UPDATE ... SET score_sheet_id = (SELECT ...) for all the games; a game is only ever on one score sheet
+    Game.objects.update(score_sheet_id=Subquery(
+        ScoreSheetGames.objects.filter(game_id=OuterRef('id')).order_by('scoresheet_id').values('scoresheet_id')[:1]
+    ))
+    # the foreign key can't be required with games that aren't on a score sheet; they can't be shown or counted
+    # anywhere, but they are left to be looked at, and deleted, by hand, rather than deleted here
+    orphans = list(Game.objects.filter(score_sheet_id__isnull=True).values_list('id', flat=True))
+    if orphans:
+        raise RuntimeError('games {} are not on a score sheet; delete them, then migrate again'.format(
+            ', '.join([str(o) for o in orphans])
+        ))
+
+
+def copy_score_sheets_back(apps, schema_editor):
+    Game = apps.get_model('stats', 'Game')
+    ScoreSheet = apps.get_model('stats', 'ScoreSheet')
+    ScoreSheetGames = ScoreSheet._meta.get_field('games').remote_field.through
+    ScoreSheetGames.objects.bulk_create([
+        ScoreSheetGames(scoresheet_id=score_sheet_id, game_id=game_id)
+        for game_id, score_sheet_id in Game.objects.values_list('id', 'score_sheet_id')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0053_scoresheet_wins'),
+    ]
+
+    operations = [
+        # named so it doesn't clash with the many-to-many until that is gone
+        migrations.AddField(
+            model_name='game',
+            name='score_sheet',
+            field=models.ForeignKey(
+                null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='stats.scoresheet'
+            ),
+        ),
+        migrations.RunPython(copy_score_sheets, copy_score_sheets_back),
+        migrations.RemoveField(
+            model_name='scoresheet',
+            name='games',
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='score_sheet',
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, related_name='games', to='stats.scoresheet'
+            ),
+        ),
+    ]
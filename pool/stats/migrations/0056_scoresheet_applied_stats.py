@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0055_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scoresheet',
+            name='applied_stats',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
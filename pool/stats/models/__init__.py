@@ -1,5 +1,7 @@
 from .division import Division
 from .game import Game
+from .job import Job
+from .league_config import league_config
 from .lineup import GameOrder, LineupEntry, AwayLineupEntry, HomeLineupEntry
 from .lineup import Substitution, AwaySubstitution, HomeSubstitution
 from .match import Match
@@ -2,10 +2,12 @@ from django.db import models
 from django.utils import timezone
 
 from .player import AwayPlayer, HomePlayer
+from .league_config import league_config
 from .lineup import GameOrder
 
 
 class Game(models.Model):
+    score_sheet = models.ForeignKey('ScoreSheet', on_delete=models.CASCADE, related_name='games')
     away_player = models.ForeignKey(
         AwayPlayer,
         null=True,
@@ -26,36 +28,87 @@ class Game(models.Model):
     forfeit = models.BooleanField(default=False)
     timestamp = models.DateTimeField(default=None, blank=True, null=True)
 
+    # changing any of these in a game that has been rated means the ratings from it on need replaying
+    RATED_FIELDS = ['winner', 'forfeit', 'away_player_id', 'home_player_id']
+
+    # changing any of these changes the score sheet's win totals
+    WINS_FIELDS = ['winner', 'forfeit']
+
+    # changing any of these changes the season's stats, if the score sheet is official
+    STATS_FIELDS = RATED_FIELDS + ['table_run']
+
     __original_winner = None
+    __original_stats_values = None
 
     def __init__(self, *args, **kwargs):
         super(Game, self).__init__(*args, **kwargs)
         self.__original_winner = self.winner
+        self.__original_stats_values = self.stats_values()
 
-    def save(self, force_insert=False, force_update=False, using=None,
-             update_fields=None):
+    def stats_values(self):
+        # skip deferred fields, so instances loaded with only() don't each cost a query
+        deferred_fields = self.get_deferred_fields()
+        return {f: getattr(self, f) for f in self.STATS_FIELDS if f not in deferred_fields}
+
+    def changed_stats_fields(self):
+        stats_values = self.stats_values()
+        return set([
+            f for f in stats_values
+            if f in self.__original_stats_values and stats_values[f] != self.__original_stats_values[f]
+        ])
+
+    def changed_rated_fields(self):
+        return self.changed_stats_fields().intersection(self.RATED_FIELDS)
 
+    def rated_values_changed(self):
+        return len(self.changed_rated_fields()) > 0
+
+    def update_timestamp(self):
+        # a game is timestamped when it gets a winner, and not again when the winner changes
         if self.winner in [None, '']:
             self.timestamp = None
         else:
             if self.__original_winner in [None, '']:
                 self.timestamp = timezone.now()
 
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+
+        self.update_timestamp()
+        adding = self.pk is None
+        changed_fields = self.changed_stats_fields() if not adding else set()
         super(Game, self).save(force_insert=force_insert, force_update=force_update)
         self.__original_winner = self.winner
+        self.__original_stats_values = self.stats_values()
+
+        if changed_fields.intersection(self.WINS_FIELDS):
+            self.score_sheet.update_wins()
+        else:
+            # update_wins() does this too
+            from .scoresheet import ScoreSheet
+            ScoreSheet.content_changed([self.score_sheet_id])
+
+        if len(changed_fields) or (adding and self.winner not in [None, '']):
+            self.score_sheet.games_changed()
+        if len(changed_fields.intersection(self.RATED_FIELDS)):
+            # imported here, as player_rating depends on this module
+            from .player_rating import mark_game_changed
+            mark_game_changed(self)
 
     def as_dict(self):
 
+        # the game order, with its positions, without a query
+        order = league_config.game_order(self.order_id)
         game_data = {
             'id': self.id,
-            'order': self.order.as_dict(),
+            'order': order.as_dict(),
             'away_player': self.away_player.as_dict() if self.away_player is not None else None,
             'home_player': self.home_player.as_dict() if self.home_player is not None else None,
             'winner': self.winner,
             'table_run': self.table_run,
             'forfeit': self.forfeit,
             'timestamp': self.timestamp,
-            'home_breaks': self.order.home_breaks,
+            'home_breaks': order.home_breaks,
         }
 
         return game_data
@@ -0,0 +1,134 @@
+import datetime
+import traceback
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .season import Season
+from .globals import logger
+
+
+class Job(models.Model):
+    """
+    A season stats update, queued from the admin and run by the run_jobs worker command, so the
+    admin request doesn't wait for it.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    season = models.ForeignKey(Season, on_delete=models.CASCADE)
+    status = models.CharField(max_length=8, choices=STATUSES, default=QUEUED, db_index=True)
+    # how many times this update was asked for, while it was queued
+    requests = models.IntegerField(default=1)
+    progress = models.CharField(max_length=64, blank=True)
+    queued = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    # when the worker running the job last reported progress
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    report = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return 'update stats for {} ({})'.format(self.season, self.status)
+
+    @classmethod
+    def enqueue(cls, season_id):
+        """
+        Queue a stats update for a season; if one is already queued, that is the job, and this request is
+        counted on it. A job that is already running doesn't count, it may have read the season before the change
+        this update is for.
+        :return: (the job, whether it was created)
+        """
+        with transaction.atomic():
+            job = cls.objects.select_for_update().filter(season_id=season_id, status=cls.QUEUED).first()
+            if job is not None:
+                cls.objects.filter(id=job.id).update(requests=F('requests') + 1)
+                job.refresh_from_db()
+                return job, False
+            return cls.objects.create(season_id=season_id), True
+
+    @classmethod
+    def recover_stale(cls):
+        """
+        Fail the running jobs whose worker hasn't reported progress for JOB_STALE_AFTER seconds, eg as it was
+        killed, and queue their updates again.
+        :return: the jobs that were failed
+        """
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.JOB_STALE_AFTER)
+        stale = Q(status=cls.RUNNING) & (Q(heartbeat__lt=cutoff) | Q(heartbeat__isnull=True, started__lt=cutoff))
+        failed = []
+        for job in cls.objects.filter(stale):
+            if cls.objects.filter(stale, id=job.id).update(
+                status=cls.FAILED, finished=timezone.now(), error='the worker stopped reporting progress'
+            ):
+                logger.warning('job {} was left running, and is queued again'.format(job.id))
+                cls.enqueue(job.season_id)
+                failed.append(job)
+        return failed
+
+    @classmethod
+    def claim(cls):
+        """
+        Take the oldest queued job, for this worker; the status update only succeeds for one worker. Jobs left
+        running by a worker that stopped are queued again first.
+        :return: the job, now running, or None if there is nothing queued
+        """
+        cls.recover_stale()
+        for job in cls.objects.filter(status=cls.QUEUED).order_by('id'):
+            now = timezone.now()
+            if cls.objects.filter(id=job.id, status=cls.QUEUED).update(status=cls.RUNNING, started=now, heartbeat=now):
+                job.refresh_from_db()
+                return job
+        return None
+
+    def set_progress(self, phase_name, phases_done, phase_count):
+        self.progress = '{} ({} of {})'.format(phase_name, phases_done + 1, phase_count)
+        self.heartbeat = timezone.now()
+        Job.objects.filter(id=self.id).update(progress=self.progress, heartbeat=self.heartbeat)
+
+    def run(self):
+        # imported here as utils depends on the models
+        from ..utils import update_season_stats
+        from ..warming import warm_season
+        from .season_stats import SeasonStatsRecompute
+
+        # the recompute's phases, then warming the caches
+        phase_count = SeasonStatsRecompute(self.season_id).phase_count() + 1
+        try:
+            self.report = update_season_stats(
+                self.season_id,
+                progress=lambda name, done: self.set_progress(name, done, phase_count),
+            )
+            self.set_progress('warming caches', phase_count - 1, phase_count)
+            self.report['warming'] = warm_season(self.season_id)
+            self.status = Job.DONE
+            self.progress = 'done'
+        except Exception:
+            logger.exception('job {} failed'.format(self.id))
+            self.status = Job.FAILED
+            self.error = traceback.format_exc()
+        self.finished = timezone.now()
+        self.save()
+        return self
+
+    def waited(self):
+        return (self.started - self.queued).total_seconds() if self.started else None
+
+    def took(self):
+        return (self.finished - self.started).total_seconds() if self.finished and self.started else None
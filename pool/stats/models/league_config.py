@@ -0,0 +1,104 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+
+from .lineup import GameOrder
+from .playposition import AwayPlayPosition, HomePlayPosition, PlayPosition
+
+
+VERSION_KEY = 'league_config.version'
+
+
+class Config(object):
+    """
+    The game orders and play positions, as loaded at one version.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.game_orders = list(GameOrder.objects.select_related('away_position', 'home_position'))
+        self.game_orders_by_id = {g.id: g for g in self.game_orders}
+        self.play_positions = list(PlayPosition.objects.order_by('id'))
+
+
+class LeagueConfig(object):
+    """
+    A process-local copy of the game orders and play positions, which hardly ever change but are needed all
+    the time. It is loaded once per process, and again when the version in the default cache changes; saving
+    or deleting a game order or play position, in the admin or anywhere else, changes the version, for every
+    process. The version is checked at most every LEAGUE_CONFIG_CHECK_INTERVAL seconds, so other processes
+    see a change within that long.
+
+    The instances are shared, so don't change them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.config = None
+        # when the version was last checked, by time.monotonic()
+        self.checked = None
+
+    @staticmethod
+    def current_version():
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            # a new value, never one a process could already have loaded, eg after the cache was cleared
+            cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def load(self):
+        """
+        :return: the Config, loaded again if the version changed
+        """
+        config, checked, now = self.config, self.checked, time.monotonic()
+        if config is not None and checked is not None and now - checked < settings.LEAGUE_CONFIG_CHECK_INTERVAL:
+            return config
+        version = self.current_version()
+        self.checked = now
+        if config is None or config.version != version:
+            with self.lock:
+                config = self.config
+                if config is None or config.version != version:
+                    config = Config(version)
+                    # replaced in one assignment, so other threads get the old config or the new one, not a mix
+                    self.config = config
+        return config
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        # this process sees the change straight away
+        self.checked = None
+
+    def game_orders(self, tiebreaker=None):
+        """
+        :param tiebreaker: True or False for only the tie-breaker, or only the regular, game orders
+        :return: the game orders, in order
+        """
+        return [g for g in self.load().game_orders if tiebreaker is None or g.tiebreaker == tiebreaker]
+
+    def game_order(self, game_order_id):
+        return self.load().game_orders_by_id.get(game_order_id)
+
+    def play_positions(self, tiebreaker=None):
+        return [p for p in self.load().play_positions if tiebreaker is None or p.tiebreaker == tiebreaker]
+
+
+league_config = LeagueConfig()
+
+
+def invalidate_league_config(sender, **kwargs):
+    league_config.invalidate()
+
+
+for model in [GameOrder, PlayPosition, AwayPlayPosition, HomePlayPosition]:
+    post_save.connect(
+        invalidate_league_config, sender=model, dispatch_uid='league_config_save_{}'.format(model.__name__)
+    )
+    post_delete.connect(
+        invalidate_league_config, sender=model, dispatch_uid='league_config_delete_{}'.format(model.__name__)
+    )
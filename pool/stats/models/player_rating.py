@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 
+from ..fragments import invalidate, player_tag, ratings_tag
 from .game import Game
 from .player import Player
 
@@ -12,6 +13,9 @@ DEFAULT_MU = 1000
 DEFAULT_SIGMA = 333
 DEFAULT_BETA = 162
 
+# how many games to rate between writes of the new ratings and the bookmark
+RATING_CHUNK_SIZE = 500
+
 trueskill_env = TrueSkill(
     draw_probability=0.00,
     mu=DEFAULT_MU,
@@ -28,7 +32,7 @@ class PlayerRatingException(Exception):
 
 def check_unofficial_games():
     unofficial_games = Game.objects.filter(
-        models.Q(scoresheet__official=False)
+        models.Q(score_sheet__official=False)
     ).filter(
         forfeit=False
     )
@@ -48,24 +52,103 @@ def get_current_rating(player_id):
         return Rating(mu=player_rating.mu, sigma=player_rating.sigma)
 
 
+def get_latest_player_ratings(player_ids):
+    """
+    The latest PlayerRating for each of a set of players, from one query
+    :param player_ids:
+    :return: {player_id: PlayerRating}; players who have never been rated are not included
+    """
+    latest_rating = PlayerRating.objects.filter(
+        player_id=models.OuterRef('player_id')
+    ).order_by('-game_id').values('id')[:1]
+    player_ratings = PlayerRating.objects.filter(
+        player_id__in=player_ids,
+        id=models.Subquery(latest_rating),
+    )
+    return {r.player_id: r for r in player_ratings}
+
+
+def get_current_ratings(player_ids):
+    """
+    :return: {player_id: Rating}; players who have never been rated are not included
+    """
+    return {
+        player_id: Rating(mu=r.mu, sigma=r.sigma) for player_id, r in get_latest_player_ratings(player_ids).items()
+    }
+
+
+def update_summary_ratings(player_ids):
+    """
+    Copy the players' latest ratings to all their season summaries, for the player tables to read.
+    """
+    # imported here, as playersummary imports this module
+    from .playersummary import PlayerSeasonSummary
+    latest_ratings = get_latest_player_ratings(player_ids)
+    summaries = list(PlayerSeasonSummary.objects.filter(player_id__in=player_ids))
+    for summary in summaries:
+        summary.set_rating(latest_ratings.get(summary.player_id))
+    PlayerSeasonSummary.objects.bulk_update(summaries, ['current_mu', 'current_sigma', 'rating_game_id'])
+    # in every season they played, not just this one
+    invalidate([player_tag(player_id) for player_id in player_ids] + ([ratings_tag()] if summaries else []))
+
+
 def get_initial_game():
-    return Game.objects.filter(scoresheet__official=True).order_by('id').first()
+    return Game.objects.filter(score_sheet__official=True).order_by('id').first()
 
 
 def check_bookmark_initialized():
-    if not PlayerRatingBookmark.load():
-        PlayerRatingBookmark(game=get_initial_game()).save()
+    # a bookmark without a game means no games have been rated yet
+    PlayerRatingBookmark.load()
+
+
+def mark_ratings_dirty(game_id):
+    """
+    Lower the dirty watermark to game_id, if it has already been rated; the next rate_games() run
+    replays the ratings from there on.
+    """
+    bookmark = PlayerRatingBookmark.load()
+    if bookmark.game_id is None or game_id > bookmark.game_id:
+        return  # not rated yet, so nothing to replay
+    if bookmark.dirty_from_game is not None and bookmark.dirty_from_game <= game_id:
+        return
+    # update, rather than save, so a concurrent lower watermark is not overwritten
+    PlayerRatingBookmark.objects.filter(pk=bookmark.pk).filter(
+        models.Q(dirty_from_game__isnull=True) | models.Q(dirty_from_game__gt=game_id)
+    ).update(dirty_from_game=game_id)
+    PlayerRatingBookmark.objects.get(pk=bookmark.pk).set_cache()
+
+
+def mark_game_changed(game):
+    """
+    A game's winner, players or forfeit flag changed; if it is official and already rated,
+    its ratings, and everything rated after it, are stale.
+    """
+    bookmark = PlayerRatingBookmark.load()
+    if bookmark.game_id is None or game.id > bookmark.game_id:
+        return
+    if Game.objects.filter(id=game.id, score_sheet__official=1).exists():
+        mark_ratings_dirty(game.id)
+
+
+def mark_score_sheet_changed(score_sheet):
+    """
+    A score sheet became official, or stopped being official; any of its games before the bookmark
+    were either rated and should not be now, or should be rated and were skipped.
+    """
+    first_game = score_sheet.games.order_by('id').values_list('id', flat=True).first()
+    if first_game is not None:
+        mark_ratings_dirty(first_game)
 
 
 def get_unrated_games():
 
-    last_rated_game = PlayerRatingBookmark.load().game
+    last_rated_game_id = PlayerRatingBookmark.load().game_id or 0
     games = Game.objects.filter(
-        models.Q(scoresheet__official=True)
+        models.Q(score_sheet__official=True)
     ).filter(
         forfeit=False
     ).filter(
-        id__gt=last_rated_game.id
+        id__gt=last_rated_game_id
     ).filter(
         away_player__isnull=False
     ).filter(
@@ -79,28 +162,93 @@ def get_unrated_games():
     return games
 
 
-def rate_game(game):
+def rate_game(game, ratings):
+    """
+    Rate one game, updating the ratings in-place
+    :param game:
+    :param ratings: {player_id: Rating} for (at least) both players in the game
+    :return: the new, unsaved PlayerRatings for the game
+    """
     try:
-        away_rating = get_current_rating(game.away_player_id)
-        home_rating = get_current_rating(game.home_player_id)
+        away_rating = ratings.get(game.away_player_id, Rating())
+        home_rating = ratings.get(game.home_player_id, Rating())
         if game.winner == 'away':
             new_away_rating, new_home_rating = rate_1vs1(away_rating, home_rating)
         else:
             new_home_rating, new_away_rating = rate_1vs1(home_rating, away_rating)
-
-        PlayerRating(game=game, player=game.away_player, mu=new_away_rating.mu, sigma=new_away_rating.sigma).save()
-        PlayerRating(game=game, player=game.home_player, mu=new_home_rating.mu, sigma=new_home_rating.sigma).save()
+        ratings[game.away_player_id] = new_away_rating
+        ratings[game.home_player_id] = new_home_rating
+        return [
+            PlayerRating(game_id=game.id, player_id=game.away_player_id,
+                         mu=new_away_rating.mu, sigma=new_away_rating.sigma),
+            PlayerRating(game_id=game.id, player_id=game.home_player_id,
+                         mu=new_home_rating.mu, sigma=new_home_rating.sigma),
+        ]
     except Exception:  # noqa
-        print("failed rating game between {} and {}".format(game.away_player, game.home_player))
-
-
-def rate_games():
+        print("failed rating game between {} and {}".format(game.away_player_id, game.home_player_id))
+        return []
+
+
+def rate_chunks(games, chunk_size=RATING_CHUNK_SIZE, ratings=None):
+    """
+    Rate games in order, keeping the players' current ratings in memory. The new ratings are written,
+    and the bookmark moved, once per chunk of games, in a transaction.
+    :param games: a queryset of the games to rate, in order
+    :param chunk_size:
+    :param ratings: {player_id: Rating}, the players' current ratings; loaded as needed when not provided
+    :return: a generator of the count of games rated so far, yielded after each chunk is written
+    """
+    if ratings is None:
+        ratings = {}
+    games = games.only('id', 'winner', 'away_player_id', 'home_player_id').order_by('id')
+    rated = 0
+    last_game_id = 0
+    while True:
+        # paging on the game id, rather than holding a cursor open, keeps memory use flat on MySQL,
+        # which does not stream query results.
+        chunk = list(games.filter(id__gt=last_game_id)[:chunk_size])
+        if not chunk:
+            break
+        last_game_id = chunk[-1].id
+        chunk_players = set([g.away_player_id for g in chunk] + [g.home_player_id for g in chunk])
+        ratings.update(get_current_ratings(chunk_players - set(ratings.keys())))
+        new_ratings = []
+        for game in chunk:
+            new_ratings += rate_game(game, ratings)
+        with transaction.atomic():
+            PlayerRating.objects.bulk_create(new_ratings)
+            update_summary_ratings(chunk_players)
+            update_bookmark(chunk[-1])
+        rated += len(chunk)
+        yield rated
+
+
+def truncate_dirty_ratings():
+    """
+    Delete the ratings from the earliest corrected game on, if any game was corrected since it was rated, so
+    they're replayed by rating the unrated games.
+    :return: the earliest corrected game's id, or None
+    """
+    dirty_from_game = PlayerRatingBookmark.load().dirty_from_game
+    if dirty_from_game is not None:
+        truncate_ratings(dirty_from_game)
+    return dirty_from_game
+
+
+def rate_games(chunk_size=RATING_CHUNK_SIZE, progress=None):
+    """
+    :param progress: if given, called with the count of games rated so far after each chunk, eg so a worker can
+    report that it's still rating
+    :return: the count of games rated
+    """
     # check_unofficial_games()
     check_bookmark_initialized()
-    unrated_games = get_unrated_games()
-    for game in unrated_games:
-        rate_game(game)
-        update_bookmark(game)
+    truncate_dirty_ratings()
+    rated = 0
+    for rated in rate_chunks(get_unrated_games(), chunk_size):
+        if progress is not None:
+            progress(rated)
+    return rated
 
 
 def update_bookmark(game):
@@ -109,9 +257,46 @@ def update_bookmark(game):
     bookmark.save()
 
 
+def truncate_ratings(since_game_id=None):
+    """
+    Delete the ratings for games from since_game_id on, or all of them, and move the bookmark back to
+    the last game that is still rated, so the deleted ratings are re-rated by the next run.
+    """
+    check_bookmark_initialized()
+    with transaction.atomic():
+        bookmark = PlayerRatingBookmark.objects.select_for_update().get(pk=1)
+        # anything already marked dirty has to be replayed too
+        if since_game_id is not None and bookmark.dirty_from_game is not None:
+            since_game_id = min(since_game_id, bookmark.dirty_from_game)
+        ratings = PlayerRating.objects.all()
+        if since_game_id is not None:
+            ratings = ratings.filter(game_id__gte=since_game_id)
+        truncated_players = set(ratings.values_list('player_id', flat=True).distinct())
+        ratings.delete()
+        # players with no games left to replay would otherwise keep the deleted rating
+        update_summary_ratings(truncated_players)
+        bookmark.game_id = PlayerRating.objects.aggregate(models.Max('game_id'))['game_id__max']
+        bookmark.dirty_from_game = None
+        bookmark.save()
+
+
+def rebuild_ratings(since_game_id=None, chunk_size=RATING_CHUNK_SIZE):
+    """
+    Throw away the ratings from since_game_id on (all of them, if None), and re-rate those games.
+    The bookmark is moved after each chunk, so an interrupted rebuild can be resumed by rate_games(),
+    or by iterating over rate_chunks(get_unrated_games()).
+    :return: a generator of the count of games re-rated, after each chunk is written
+    """
+    truncate_ratings(since_game_id)
+    return rate_chunks(get_unrated_games(), chunk_size)
+
+
 class PlayerRatingBookmark(SingletonModel):
 
-    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    # the last game considered for rating; null when nothing has been rated yet
+    game = models.ForeignKey(Game, null=True, blank=True, on_delete=models.CASCADE)
+    # the earliest rated game that has been corrected since it was rated
+    dirty_from_game = models.IntegerField(null=True, blank=True)
 
 
 class PlayerRating(models.Model):
@@ -2,9 +2,9 @@ from django.conf import settings
 from django.db import models
 
 from .game import Game
-from .lineup import GameOrder
+from .league_config import league_config
 from .player import Player
-from .player_rating import PlayerRating
+from .player_rating import PlayerRating, get_latest_player_ratings
 from .season import Season
 from .scoresheet import ScoreSheet
 from .team import Team
@@ -22,6 +22,10 @@ class PlayerSeasonSummary(models.Model):
     win_percentage = models.FloatField(verbose_name='Win Percentage', default=0.0, null=True)
     ranking = models.IntegerField(null=True)
     last_rated_game = models.IntegerField(null=True)
+    # the player's latest rating, kept up to date by player_rating.rate_chunks()
+    current_mu = models.FloatField(null=True, blank=True)
+    current_sigma = models.FloatField(null=True, blank=True)
+    rating_game_id = models.IntegerField(null=True, blank=True)
 
     def __str__(self):
         return "{} {}".format(self.player, self.season)
@@ -30,8 +34,31 @@ class PlayerSeasonSummary(models.Model):
         ordering = ['-win_percentage']
 
     def team(self):
+        # use the player's teams if they were prefetched, see with_teams()
+        season_teams = getattr(self.player, 'season_teams', None)
+        if season_teams is not None:
+            return season_teams[0] if len(season_teams) else None
         return self.player.team_set.filter(season=self.season).first()
 
+    @classmethod
+    def with_teams(cls, queryset, season_id):
+        """
+        Fetch the players, seasons and players' teams with the summaries, so listing them
+        costs a fixed number of queries.
+        """
+        return queryset.select_related('player', 'season').prefetch_related(
+            models.Prefetch(
+                'player__team_set',
+                queryset=Team.objects.filter(season_id=season_id),
+                to_attr='season_teams',
+            )
+        )
+
+    def set_rating(self, player_rating):
+        self.current_mu = player_rating.mu if player_rating else None
+        self.current_sigma = player_rating.sigma if player_rating else None
+        self.rating_game_id = player_rating.game_id if player_rating else None
+
     def update_sweeps(self):
         # the occasional player may have played for more than one
         # team in a season ...
@@ -43,7 +70,7 @@ class PlayerSeasonSummary(models.Model):
 
         sweeps = 0
         # this should work for leagues with one or zero extra/tie-breaker games in playoffs
-        games_per_player = int(len(GameOrder.objects.all()) / settings.LEAGUE['game_group_size'])
+        games_per_player = int(len(league_config.game_orders()) / settings.LEAGUE['game_group_size'])
 
         for score_sheet in score_sheets:
             for ah in away_home:
@@ -64,6 +91,7 @@ class PlayerSeasonSummary(models.Model):
         all_summaries = cls.objects.filter(season=season_id).order_by('-win_percentage', '-wins')
         # remove the players with < the minimum number of games in the current season
         summaries = []
+        unranked = []
         if minimum_games is None:
             minimum_games = Season.objects.get(id=season_id).standings_minimum_games()
         for summary in all_summaries:
@@ -71,7 +99,7 @@ class PlayerSeasonSummary(models.Model):
                 summaries.append(summary)
             else:
                 summary.ranking = 0
-                summary.save()
+                unranked.append(summary)
         inc = 0
         while inc < len(summaries):
             tie_count = 0
@@ -85,16 +113,16 @@ class PlayerSeasonSummary(models.Model):
                     break
             for i in range(0, tie_count + 1):
                 summaries[inc+i].ranking = inc + 1
-                summaries[inc+i].save()
             inc += tie_count + 1
+        cls.objects.bulk_update(summaries + unranked, ['ranking'])
 
     def update(self):
         games = Game.objects.filter(
-            scoresheet__match__season_id=self.season
+            score_sheet__match__season_id=self.season
         ).filter(
-            scoresheet__official=True
+            score_sheet__official=True
         ).filter(
-            scoresheet__match__playoff=False
+            score_sheet__match__playoff=False
         ).filter(
             forfeit=False
         )
@@ -125,21 +153,41 @@ class PlayerSeasonSummary(models.Model):
         rating = PlayerRating.objects.filter(
             game__forfeit=False,
             player_id=self.player_id
-        ).order_by('game__scoresheet__match__season_id', 'game_id').last()
+        ).order_by('game__score_sheet__match__season_id', 'game_id').last()
         if rating is not None:
             return rating
         else:
             return None
 
+    @classmethod
+    def create_missing(cls, season_id):
+        """
+        Create summaries for the players on teams in the season that don't have one yet.
+        """
+        team_player_ids = set(Team.players.through.objects.filter(
+            team__season_id=season_id
+        ).values_list('player_id', flat=True))
+        existing_player_ids = set(cls.objects.filter(season_id=season_id).values_list('player_id', flat=True))
+        cls.create_for_players(season_id, sorted(team_player_ids - existing_player_ids))
+
+    @classmethod
+    def create_for_players(cls, season_id, player_ids):
+        """
+        Create summaries, with the players' current ratings, in bulk
+        :return: the new summaries
+        """
+        latest_ratings = get_latest_player_ratings(player_ids)
+        summaries = []
+        for player_id in player_ids:
+            summary = cls(season_id=season_id, player_id=player_id)
+            summary.set_rating(latest_ratings.get(player_id))
+            summaries.append(summary)
+        return cls.objects.bulk_create(summaries)
+
     @classmethod
     def update_all(cls, season_id, minimum_games=None):
         # find all the players on teams in this season
-        teams = Team.objects.filter(season=season_id)
-        for team in teams:
-            for player in team.players.all():
-                summaries = cls.objects.filter(season=season_id, player=player)
-                if not len(summaries):
-                    cls(season=Season.objects.get(id=season_id), player=player).save()
+        cls.create_missing(season_id)
 
         for summary in cls.objects.filter(season=season_id):
             summary.update()
@@ -1,12 +1,45 @@
-from django.db import models
+import uuid
 
-from .game import Game, GameOrder
-from .match import Match
-from .lineup import AwayLineupEntry, HomeLineupEntry, AwaySubstitution, HomeSubstitution
-from .player import AwayPlayer, HomePlayer
-from .playposition import PlayPosition
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Count, Max, Q
 
-from .globals import away_home, logger
+from ..fragments import invalidate, season_tag
+from .game import Game
+from .league_config import league_config
+from .match import Match
+from .lineup import AwayLineupEntry, HomeLineupEntry, AwaySubstitution, HomeSubstitution, Substitution
+
+from .globals import away_home
+
+
+LINEUP_ENTRY_CLASSES = {'away': AwayLineupEntry, 'home': HomeLineupEntry}
+SUBSTITUTION_CLASSES = {'away': AwaySubstitution, 'home': HomeSubstitution}
+
+
+def bulk_create_with_ids(model, objects):
+    """
+    bulk_create() objects whose ids are needed after, eg to add them to a many-to-many field. On databases that
+    can't return the ids of bulk inserted rows, like MySQL, the rows after the last one there was are read back,
+    in order; if that finds rows another connection inserted in the meantime, the insert is rolled back, and
+    the objects inserted one at a time instead.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects)
+    with transaction.atomic():
+        last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        savepoint = transaction.savepoint()
+        model.objects.bulk_create(objects)
+        ids = list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+        if len(ids) == len(objects):
+            transaction.savepoint_commit(savepoint)
+            for o, i in zip(objects, ids):
+                o.pk = i
+            return objects
+        transaction.savepoint_rollback(savepoint)
+        for o in objects:
+            o.save()
+    return objects
 
 
 class ScoreSheet(models.Model):
@@ -30,7 +63,6 @@ class ScoreSheet(models.Model):
         blank=True,
         related_name='home_lineup',
     )
-    games = models.ManyToManyField(Game, blank=True)
     away_substitutions = models.ManyToManyField(
         AwaySubstitution,
         related_name='away_substitution',
@@ -41,228 +73,406 @@ class ScoreSheet(models.Model):
     )
     comment = models.TextField(max_length=500, blank=True)
     complete = models.BooleanField(default=False)
+    # totals of the games; kept up to date as the games are saved, see update_wins()
+    away_wins = models.IntegerField(default=0)
+    home_wins = models.IntegerField(default=0)
+    away_forfeit_wins = models.IntegerField(default=0)
+    home_forfeit_wins = models.IntegerField(default=0)
+
+    WINS_FIELDS = ['away_wins', 'home_wins', 'away_forfeit_wins', 'home_forfeit_wins']
+    # the stats this score sheet added to its teams' and players' while official, as score_sheet_deltas()
+    # returns them, so they can be taken off as they were added; only written by apply_score_sheet()
+    applied_stats = models.JSONField(null=True, blank=True, editable=False)
+
+    # how long content versions, and the self_check() results cached by them, are kept
+    CONTENT_VERSION_TIMEOUT = 7 * 24 * 60 * 60
+
+    __original_official = None
+
+    def __init__(self, *args, **kwargs):
+        super(ScoreSheet, self).__init__(*args, **kwargs)
+        self.__original_official = self.official
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+
+        # complete is worked out from the content, so saving only it doesn't change the content
+        content_changed = update_fields is None or list(update_fields) != ['complete']
+
+        # the win totals are only written by update_wins(), so an instance loaded before its games were saved
+        # doesn't overwrite them
+        if not self._state.adding and update_fields is None and not force_insert:
+            update_fields = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.WINS_FIELDS + ['applied_stats']
+            ]
+        was_official = self.__original_official == 1 and not self._state.adding
+
+        super(ScoreSheet, self).save(
+            force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields
+        )
+        if content_changed:
+            ScoreSheet.content_changed([self.id])
+
+        # becoming official, or no longer being official, changes the teams' and players' stats, and ratings;
+        # imported here as these modules depend on most of the models, including this one.
+        if (self.official == 1) != was_official:
+            from .player_rating import mark_score_sheet_changed
+            from .season_stats import apply_score_sheet
+            apply_score_sheet(self, was_official)
+            mark_score_sheet_changed(self)
+            invalidate([season_tag(self.match.season_id)])
+        self.__original_official = self.official
+
+    def games_changed(self):
+        """
+        Bring the season's stats in line with this score sheet's games, if it's official; call this after
+        changing the games' results or players, other than through set_games() or update_games(), which do it
+        themselves.
+        """
+        if self.official != 1:
+            return
+        from .season_stats import apply_score_sheet
+        apply_score_sheet(self, was_official=True)
+        invalidate([season_tag(self.match.season_id)])
 
     def __str__(self):
         return "{}".format(self.match)
 
-    def away_wins(self):
-        return len(self.games.filter(winner='away'))
+    @classmethod
+    def with_matches(cls, queryset):
+        """
+        Fetch score sheets' matches, and the matches' teams and weeks, with them, so a list of them can be shown
+        with their scores without a query per row.
+        """
+        return queryset.select_related('match__away_team', 'match__home_team', 'match__week')
+
+    @classmethod
+    def update_wins_for(cls, queryset):
+        """
+        Recount the win totals of a set of score sheets from their games, with one aggregate query.
+        :return: how many score sheets were updated
+        """
+        totals = queryset.order_by().values('id').annotate(
+            away=Count('games', filter=Q(games__winner='away')),
+            home=Count('games', filter=Q(games__winner='home')),
+            away_forfeit=Count('games', filter=Q(games__winner='away', games__forfeit=True)),
+            home_forfeit=Count('games', filter=Q(games__winner='home', games__forfeit=True)),
+        )
+        score_sheets = [
+            cls(
+                id=t['id'], away_wins=t['away'], home_wins=t['home'],
+                away_forfeit_wins=t['away_forfeit'], home_forfeit_wins=t['home_forfeit'],
+            ) for t in totals
+        ]
+        cls.objects.bulk_update(score_sheets, cls.WINS_FIELDS, batch_size=500)
+        cls.content_changed([s.id for s in score_sheets])
+        return len(score_sheets)
+
+    @staticmethod
+    def content_version_key(score_sheet_id):
+        return 'score_sheet.{}.content_version'.format(score_sheet_id)
+
+    @classmethod
+    def content_changed(cls, score_sheet_ids):
+        """
+        Give score sheets new content versions; call this after saving any of their games, lineups or
+        substitutions, other than through save() or set_games(), which do it themselves.
+        """
+        cache.set_many(
+            {cls.content_version_key(i): uuid.uuid4().hex for i in score_sheet_ids}, cls.CONTENT_VERSION_TIMEOUT
+        )
+
+    def content_version(self):
+        """
+        :return: a value that changes whenever this score sheet, or any of its games, lineups or substitutions,
+        is saved; one that has expired, or been cleared, is replaced by a new value.
+        """
+        key = ScoreSheet.content_version_key(self.id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, self.CONTENT_VERSION_TIMEOUT)
+            version = cache.get(key)
+        return version
+
+    def load_content(self):
+        """
+        Load the games, lineups and substitutions, with their players, in one query each, so they can be
+        summarized and checked without a query per game or player.
+        """
+        content = {'games': list(self.games.select_related('away_player', 'home_player').order_by('id'))}
+        for ah in away_home:
+            content['{}_lineup'.format(ah)] = list(
+                getattr(self, '{}_lineup'.format(ah)).select_related('player', 'position').order_by('id')
+            )
+            content['{}_substitutions'.format(ah)] = list(
+                getattr(self, '{}_substitutions'.format(ah)).select_related('player').order_by('id')
+            )
+        return content
 
-    def home_wins(self):
-        return len(self.games.filter(winner='home'))
+    def update_wins(self):
+        ScoreSheet.update_wins_for(ScoreSheet.objects.filter(id=self.id))
+        # not refresh_from_db(), which would load official too, for __init__()
+        for field, value in ScoreSheet.objects.filter(id=self.id).values(*self.WINS_FIELDS).get().items():
+            setattr(self, field, value)
 
     def forfeit_wins(self, ah):
-        return len(self.games.filter(winner=ah).filter(forfeit=True))
+        return getattr(self, '{}_forfeit_wins'.format(ah))
 
     def wins(self, away_home):
-        return len(self.games.filter(winner=away_home))
+        return getattr(self, '{}_wins'.format(away_home))
+
+    def add_to_many(self, field_name, objects):
+        """
+        Add objects to one of this score sheet's many-to-many fields, with one insert into its through table.
+        """
+        field = self._meta.get_field(field_name)
+        through = field.remote_field.through
+        through.objects.bulk_create([
+            through(**{field.m2m_field_name(): self, field.m2m_reverse_field_name(): o}) for o in objects
+        ])
 
     def initialize_lineup(self):
-        lineup_positions = PlayPosition.objects.filter(tiebreaker=False)
-        if self.match.playoff:
-            lineup_positions = PlayPosition.objects.all()
-        for lineup_position in lineup_positions:
-            ale = AwayLineupEntry(position=lineup_position)
-            ale.save()
-            hle = HomeLineupEntry(position=lineup_position)
-            hle.save()
-            self.away_lineup.add(ale)
-            self.home_lineup.add(hle)
-        self.save()
+        lineup_positions = league_config.play_positions(tiebreaker=None if self.match.playoff else False)
+        with transaction.atomic():
+            for ah in away_home:
+                entry_class = LINEUP_ENTRY_CLASSES[ah]
+                entries = bulk_create_with_ids(entry_class, [entry_class(position=p) for p in lineup_positions])
+                self.add_to_many('{}_lineup'.format(ah), entries)
 
     def initialize_games(self):
         # now create games, per the game order table
-        for g in GameOrder.objects.filter(tiebreaker=False):
-            game = Game()
-            game.order = g
-            game.save()
-            self.games.add(game)
+        game_orders = league_config.game_orders(tiebreaker=False)
         if self.match.playoff:
-            game = Game()
-            game.order = GameOrder.objects.get(tiebreaker=True)
-            game.save()
-            self.games.add(game)
-
-        self.save()
+            game_orders += league_config.game_orders(tiebreaker=True)[:1]
+        Game.objects.bulk_create([Game(score_sheet=self, order=g) for g in game_orders])
 
     def copy_game_orders_to_positions(self):
         """
         This ugly hack allows substitutions to be set by just game order, instead of
          also specifying the play position.
+        :return: {'away': [substitutions], 'home': [substitutions]}, with their play positions set
         """
+        substitutions = {}
+        changed = []
         for ah in away_home:
-            list_subs = getattr(self, '{}_substitutions'.format(ah))
-            for substitution in list_subs.all():
-                position_m = getattr(substitution.game_order, '{}_position'.format(ah))
-                substitution.play_position = position_m
-                substitution.save()
+            substitutions[ah] = list(
+                getattr(self, '{}_substitutions'.format(ah)).select_related('game_order').order_by('id')
+            )
+            for substitution in substitutions[ah]:
+                position_id = getattr(substitution.game_order, '{}_position_id'.format(ah))
+                if substitution.play_position_id != position_id:
+                    substitution.play_position_id = position_id
+                    changed.append(substitution)
+        if len(changed):
+            Substitution.objects.bulk_update(changed, ['play_position'])
+        return substitutions
 
     def set_games(self):
-        self.copy_game_orders_to_positions()
-        for game in self.games.all():
-            logger.debug("working on game {} from {}".format(game.order, self.match))
-
-            # set the players for the game; have to convert Player instances to Home/AwayPlayer instances
-            away_player_position = self.away_lineup.filter(position_id__exact=game.order.away_position.id)[0]
-            if away_player_position.player is not None:
-                game.away_player = AwayPlayer.objects.get(id=away_player_position.player.id)
-            home_player_position = self.home_lineup.filter(position_id__exact=game.order.home_position.id)[0]
-            if home_player_position.player is not None:
-                game.home_player = HomePlayer.objects.get(id=home_player_position.player.id)
-
-            # check substitutions based on their being for <= this lineup position; over-ride the player
-            for away_substitution in self.away_substitutions.all():
-                if away_substitution.game_order.id <= game.order.id and \
-                        away_substitution.play_position == game.order.away_position:
-                    game.away_player = AwayPlayer.objects.get(id=away_substitution.player.id)
-            for home_substitution in self.home_substitutions.all():
-                if home_substitution.game_order.id <= game.order.id and \
-                        home_substitution.play_position == game.order.home_position:
-                    game.home_player = HomePlayer.objects.get(id=home_substitution.player.id)
-            game.save()
-
-    # def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-    #     super(ScoreSheet, self).save(*args, **kwargs)
-    #
-    def copy(self, session_id):
         """
+        Set the players of every game from the lineups and substitutions, which are loaded once; the games
+        whose players changed are written with one bulk update.
+        """
+        with transaction.atomic():
+            substitutions = self.copy_game_orders_to_positions()
+            lineups = {}
+            for ah in away_home:
+                lineups[ah] = {}
+                for entry in getattr(self, '{}_lineup'.format(ah)).order_by('id'):
+                    lineups[ah].setdefault(entry.position_id, entry.player_id)
+
+            changed_games = []
+            for game in self.games.select_related('order'):
+                players = {}
+                for ah in away_home:
+                    position_id = getattr(game.order, '{}_position_id'.format(ah))
+                    player_id = lineups[ah].get(position_id) or getattr(game, '{}_player_id'.format(ah))
+                    # substitutions for this position, from this game on, over-ride the lineup; the last one wins
+                    for substitution in substitutions[ah]:
+                        if substitution.game_order_id <= game.order_id and \
+                                substitution.play_position_id == position_id and substitution.player_id is not None:
+                            player_id = substitution.player_id
+                    players[ah] = player_id
+                if players['away'] != game.away_player_id or players['home'] != game.home_player_id:
+                    game.away_player_id = players['away']
+                    game.home_player_id = players['home']
+                    changed_games.append(game)
+
+            if len(changed_games):
+                Game.objects.bulk_update(changed_games, ['away_player', 'home_player'])
+                # the games' players changed, so their ratings, if they have them, are stale
+                from .player_rating import mark_game_changed
+                mark_game_changed(min(changed_games, key=lambda g: g.id))
+                self.games_changed()
+        # this is called after the lineups or substitutions are saved, so the content has changed even if
+        # the games' players have not
+        ScoreSheet.content_changed([self.id])
+
+    def update_games(self, changes):
+        """
+        Set the results of some of this score sheet's games, in one transaction, with one bulk update; the
+        timestamps, win totals, content version and ratings follow as they do when a game is saved.
+        :param changes: [{'game_id': id, 'winner': 'away', 'home' or '', 'forfeit': bool, 'table_run': bool}]
+        :return: the games, changed or not, in the order of the changes
+        """
+        fields = ['winner', 'forfeit', 'table_run']
+        with transaction.atomic():
+            games = self.games.select_for_update().in_bulk([c['game_id'] for c in changes])
+            missing = [c['game_id'] for c in changes if c['game_id'] not in games]
+            if len(missing):
+                raise Game.DoesNotExist('games {} are not on score sheet {}'.format(missing, self.id))
+
+            changed_games = {}
+            for change in changes:
+                game = games[change['game_id']]
+                if all([getattr(game, f) == change[f] for f in fields]):
+                    continue
+                for f in fields:
+                    setattr(game, f, change[f])
+                game.update_timestamp()
+                changed_games[game.id] = game
+
+            changed_games = list(changed_games.values())
+            if len(changed_games):
+                Game.objects.bulk_update(changed_games, fields + ['timestamp'])
+                # update_wins() also gives this score sheet a new content version
+                self.update_wins()
+                rated_games = [g for g in changed_games if g.rated_values_changed()]
+                if len(rated_games):
+                    from .player_rating import mark_game_changed
+                    mark_game_changed(min(rated_games, key=lambda g: g.id))
+                self.games_changed()
+        return [games[c['game_id']] for c in changes]
 
+    def copy(self, session_id):
+        """
+        Copy this score sheet, with its lineups, substitutions and games, in one transaction
         :param session_id:
         :return: new scoresheet id
         """
 
-        old_ss = self
-
-        new_ss = ScoreSheet(
-            match=old_ss.match,
-            comment=old_ss.comment,
-            creator_session=session_id,
-        )
-        new_ss.save()
-
-        for ah in away_home:
-            lineup_entries = getattr(self, '{}_lineup'.format(ah))
-            new_lineup = getattr(new_ss, '{}_lineup'.format(ah))
-            for lineup_entry in lineup_entries.all():
-                le = eval('{}LineupEntry'.format(ah.capitalize()))(
-                    player=lineup_entry.player,
-                    position=lineup_entry.position,
-                )
-                le.save()
-                new_lineup.add(le)
-            old_substitutions = getattr(self, '{}_substitutions'.format(ah))
-            new_subs = getattr(new_ss, '{}_substitutions'.format(ah))
-            for old_substitution in old_substitutions.all():
-                new_sub = eval('{}Substitution'.format(ah.capitalize()))(
-                    game_order=old_substitution.game_order,
-                    player=old_substitution.player,
-                    play_position=old_substitution.play_position,
-                )
-                new_sub.save()
-                new_subs.add(new_sub)
-
-        for old_game in old_ss.games.all():
-            new_game = Game(
-                away_player=old_game.away_player,
-                home_player=old_game.home_player,
-                winner=old_game.winner,
-                order=old_game.order,
-                table_run=old_game.table_run,
-                forfeit=old_game.forfeit,
-                timestamp=old_game.timestamp,
+        with transaction.atomic():
+            new_ss = ScoreSheet(
+                match_id=self.match_id,
+                comment=self.comment,
+                creator_session=session_id,
+                **{f: getattr(self, f) for f in self.WINS_FIELDS}
             )
-            new_game.save()
-            new_ss.games.add(new_game)
-
-        new_ss.save()
+            new_ss.save()
+
+            for ah in away_home:
+                entry_class = LINEUP_ENTRY_CLASSES[ah]
+                new_ss.add_to_many('{}_lineup'.format(ah), bulk_create_with_ids(entry_class, [
+                    entry_class(player_id=e.player_id, position_id=e.position_id)
+                    for e in getattr(self, '{}_lineup'.format(ah)).order_by('id')
+                ]))
+                substitution_class = SUBSTITUTION_CLASSES[ah]
+                new_ss.add_to_many('{}_substitutions'.format(ah), bulk_create_with_ids(substitution_class, [
+                    substitution_class(
+                        game_order_id=sub.game_order_id, player_id=sub.player_id, play_position_id=sub.play_position_id,
+                    )
+                    for sub in getattr(self, '{}_substitutions'.format(ah)).order_by('id')
+                ]))
+
+            Game.objects.bulk_create([
+                Game(
+                    score_sheet=new_ss,
+                    away_player_id=g.away_player_id,
+                    home_player_id=g.home_player_id,
+                    winner=g.winner,
+                    order_id=g.order_id,
+                    table_run=g.table_run,
+                    forfeit=g.forfeit,
+                    timestamp=g.timestamp,
+                ) for g in self.games.order_by('id')
+            ])
         return new_ss.id
 
-    def player_summary(self, a_player):
-
-        away_wins = self.games.filter(winner='away', away_player=a_player, forfeit=False)
-        away_losses = self.games.filter(winner='home', away_player=a_player, forfeit=False)
-
-        home_wins = self.games.filter(winner='home', home_player=a_player, forfeit=False)
-        home_losses = self.games.filter(winner='away', home_player=a_player, forfeit=False)
-
-        return {
-            'wins': len(away_wins.all()) + len(home_wins.all()),
-            'losses': len(away_losses.all()) + len(home_losses.all()),
-            'table_runs': len(away_wins.filter(table_run=True)) + len(home_wins.filter(table_run=True)),
-        }
-
-    def player_summaries(self, away_home, as_dict=False):
-
+    @staticmethod
+    def player_summary(a_player, games):
+
+        summary = {'wins': 0, 'losses': 0, 'table_runs': 0}
+        for game in games:
+            if game.forfeit or game.winner not in away_home:
+                continue
+            for ah in away_home:
+                if getattr(game, '{}_player_id'.format(ah)) == a_player.id:
+                    if game.winner == ah:
+                        summary['wins'] += 1
+                        if game.table_run:
+                            summary['table_runs'] += 1
+                    else:
+                        summary['losses'] += 1
+        return summary
+
+    def player_summaries(self, away_home, as_dict=False, content=None):
+
+        content = content or self.load_content()
         player_score_sheet_summaries = []
 
-        lineup_entries = getattr(self, '{}_lineup'.format(away_home)).\
-            filter(
-                position__tiebreaker=False).\
-            exclude(
-                player__isnull=True
-            )
-        substitutions = getattr(self, '{}_substitutions'.format(away_home)).all()
-
-        players = [x.player for x in lineup_entries]
-        [players.append(y.player) for y in substitutions]
+        players = [
+            x.player for x in content['{}_lineup'.format(away_home)]
+            if not x.position.tiebreaker and x.player is not None
+        ]
+        players += [y.player for y in content['{}_substitutions'.format(away_home)] if y.player is not None]
         for player in players:
             summary = {
                 'player': player.as_dict() if as_dict else player,
             }
-            summary.update(self.player_summary(
-                a_player=player
-            ))
+            summary.update(self.player_summary(a_player=player, games=content['games']))
             player_score_sheet_summaries.append(summary)
         return player_score_sheet_summaries
 
-    def summary(self):
+    def summary(self, content=None, version=None):
+        """
+        The teams, their players' wins and losses, and the issues found by self_check(), from one load of
+        the content; see self_check() for the parameters.
+        """
+        version = version or self.content_version()
+        content = content or self.load_content()
         _summary = {}
         for ah in away_home:
             _summary.update({ah: getattr(self.match, '{}_team'.format(ah)).as_dict()})
-            _summary[ah].update({'players': self.player_summaries(ah, True)})
-            _summary[ah].update({'wins': getattr(self, '{}_wins'.format(ah))()})
+            _summary[ah].update({'players': self.player_summaries(ah, True, content=content)})
+            _summary[ah].update({'wins': self.wins(ah)})
 
-        return {'teams': _summary, 'issues': self.self_check()}
+        return {'teams': _summary, 'issues': self.self_check(content=content, version=version)}
 
-    def check_wins_regular_season(self):
+    def check_wins_regular_season(self, content):
 
         issues = []
 
         # for non-playoff matches, check for there being lineup length * lineup length wins
         wins = dict.fromkeys(away_home, 0)
-        losses = dict.fromkeys(away_home, 0)
 
-        # expected_wins = len(self.home_lineup.exclude(player=None)) * len(self.away_lineup.exclude(player=None))
-        away_lineup_player_count = len(self.away_lineup.exclude(player=None))
-        home_lineup_player_count = len(self.home_lineup.exclude(player=None))
-        away_lineup_length = len(self.away_lineup.all())
-        home_lineup_length = len(self.home_lineup.all())
+        away_lineup_player_count = len([e for e in content['away_lineup'] if e.player_id is not None])
+        home_lineup_player_count = len([e for e in content['home_lineup'] if e.player_id is not None])
+        away_lineup_length = len(content['away_lineup'])
+        home_lineup_length = len(content['home_lineup'])
 
         # if there are missing players on *both* teams, then reduce the expected wins by the multiple of the 2
         expected_wins = away_lineup_length * home_lineup_length - \
             (away_lineup_length - away_lineup_player_count) * \
             (home_lineup_length - home_lineup_player_count)
 
-        for game in self.games.all():
+        for game in content['games']:
             if game.winner:
                 wins[game.winner] += 1
-            other = [x for x in away_home if x != game.winner]
-            losses[other[0]] += 1
 
         if expected_wins != wins['away'] + wins['home']:
             issues += ['expected {} non-forfeit wins, found {}'.format(expected_wins, wins['away'] + wins['home'])]
         return issues
 
-    def check_unmarked_forfeits(self):
+    def check_unmarked_forfeits(self, content):
 
         from operator import xor
         issues = []
 
         # check for games where a player is None, but it is not marked as a forfeit
         unmarked_forfeit_games = []
-        for game in self.games.all():
-            if xor(bool(game.away_player), bool(game.home_player)) and not game.forfeit:
-                unmarked_forfeit_games.append(game.order)
+        for game in content['games']:
+            if xor(game.away_player_id is not None, game.home_player_id is not None) and not game.forfeit:
+                unmarked_forfeit_games.append(league_config.game_order(game.order_id))
         if unmarked_forfeit_games:
             issues += ["{} is/are missing a player, but not marked as a forfeit".format(', '.join(
                     [str(x) for x in unmarked_forfeit_games]
@@ -277,32 +487,42 @@ class ScoreSheet(models.Model):
 
         issues = []
 
-        win_count = 1 + int(len(GameOrder.objects.filter(tiebreaker=False)) / 2)
-        home_wins = self.home_wins()
-        away_wins = self.away_wins()
-        if win_count != home_wins and win_count != away_wins:
+        win_count = 1 + int(len(league_config.game_orders(tiebreaker=False)) / 2)
+        if win_count != self.home_wins and win_count != self.away_wins:
             issues += ["Playoff matches should have exactly {} wins".format(win_count)]
 
         return issues
 
-    def self_check(self, mark_for_review=False):
+    def self_check(self, mark_for_review=False, content=None, version=None):
 
         """
-
+        The issues are cached by content version, so checking a score sheet that hasn't changed doesn't load
+        it again; complete is only saved when it changes.
+        :param content: from load_content(), if it has already been loaded
+        :param version: the content version, read before the content was loaded
         :return: a list of issues with the score sheet
         """
 
-        issues = []
-        issues += self.check_unmarked_forfeits()
-        if self.match.playoff:
-            issues += self.check_playoff_win_count()
-        else:
-            issues += self.check_wins_regular_season()
-
-        self.complete = True
+        # the version is read before the content, so issues are never cached under a newer version than theirs
+        version = version or self.content_version()
+        key = 'score_sheet.{}.issues.{}'.format(self.id, version)
+        issues = cache.get(key)
+        if issues is None:
+            content = content or self.load_content()
+            issues = []
+            issues += self.check_unmarked_forfeits(content)
+            if self.match.playoff:
+                issues += self.check_playoff_win_count()
+            else:
+                issues += self.check_wins_regular_season(content)
+            cache.set(key, issues, self.CONTENT_VERSION_TIMEOUT)
+
+        complete = True
         if len(issues):
             if mark_for_review:
                 self.status = 2  # needs changes
-            self.complete = False
-        self.save()
+            complete = False
+        if complete != self.complete:
+            self.complete = complete
+            self.save(update_fields=['complete'])
         return issues
@@ -0,0 +1,345 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from ..instrumentation import QueryCounter
+from .game import Game
+from .league_config import league_config
+from .player_rating import rate_games
+from .playersummary import PlayerSeasonSummary
+from .team import Team, ScoreAdjustment
+
+from .globals import away_home, logger
+
+
+def other_side(ah):
+    return away_home[1 - away_home.index(ah)]
+
+
+def official_games(season_id):
+    return Game.objects.filter(
+        score_sheet__match__season_id=season_id,
+        score_sheet__official=1,
+    )
+
+
+def team_records(season_id):
+    """
+    Wins and losses for every team with official, non-playoff games in the season, from one
+    GROUP BY query per side. Forfeits count for teams.
+    :return: {team_id: {'wins': w, 'losses': l}}
+    """
+    records = {}
+    games = official_games(season_id).filter(score_sheet__match__playoff=False)
+    for ah in away_home:
+        team_field = 'score_sheet__match__{}_team_id'.format(ah)
+        rows = games.order_by().values(team_field).annotate(
+            wins=Count('id', filter=Q(winner=ah)),
+            losses=Count('id', filter=Q(winner=other_side(ah))),
+        )
+        for row in rows:
+            record = records.setdefault(row[team_field], {'wins': 0, 'losses': 0})
+            record['wins'] += row['wins']
+            record['losses'] += row['losses']
+    return records
+
+
+def team_adjustments(season_id):
+    """
+    :return: {team_id: {'wins': w, 'losses': l}} for the teams with score adjustments
+    """
+    rows = ScoreAdjustment.objects.filter(team__season_id=season_id).order_by().values('team_id').annotate(
+        wins=Sum('wins'),
+        losses=Sum('losses'),
+    )
+    return {row['team_id']: {'wins': row['wins'], 'losses': row['losses']} for row in rows}
+
+
+def player_records(season_id):
+    """
+    Wins, losses and table runs for every player in official, non-playoff, non-forfeit games in the season.
+    :return: {player_id: {'wins': w, 'losses': l, 'table_runs': t}}
+    """
+    records = {}
+    games = official_games(season_id).filter(score_sheet__match__playoff=False, forfeit=False)
+    for ah in away_home:
+        player_field = '{}_player_id'.format(ah)
+        rows = games.filter(**{'{}__isnull'.format(player_field): False}).order_by().values(player_field).annotate(
+            wins=Count('id', filter=Q(winner=ah)),
+            losses=Count('id', filter=Q(winner=other_side(ah))),
+            table_runs=Count('id', filter=Q(winner=ah, table_run=True)),
+        )
+        for row in rows:
+            record = records.setdefault(row[player_field], {'wins': 0, 'losses': 0, 'table_runs': 0})
+            for stat in ['wins', 'losses', 'table_runs']:
+                record[stat] += row[stat]
+    return records
+
+
+def games_per_player():
+    # this should work for leagues with one or zero extra/tie-breaker games in playoffs
+    return int(len(league_config.game_orders()) / settings.LEAGUE['game_group_size'])
+
+
+def player_sweeps(season_id, sweep_length=None):
+    """
+    Count the 4-0s (or whatever the game group size makes them) for every player in the season;
+    a sweep is winning every game you play on a score sheet, not counting forfeits.
+    :return: {player_id: sweep count}
+    """
+    if sweep_length is None:
+        sweep_length = games_per_player()
+    sweeps = {}
+    games = official_games(season_id).filter(forfeit=False)
+    for ah in away_home:
+        player_field = '{}_player_id'.format(ah)
+        rows = games.filter(winner=ah).exclude(**{player_field: None}).order_by().values(
+            'score_sheet_id', player_field
+        ).annotate(
+            game_wins=Count('id')
+        ).filter(game_wins=sweep_length)
+        for row in rows:
+            sweeps[row[player_field]] = sweeps.get(row[player_field], 0) + 1
+    return sweeps
+
+
+def win_percentage(wins, losses):
+    return wins / (wins + losses) if wins + losses else None
+
+
+class SeasonStatsRecompute(object):
+    """
+    Recompute a season's team and player stats with a handful of aggregate queries, and write them
+    back in bulk. Each phase is timed and its queries counted; see report(). If given, progress is called
+    with the name of each phase as it starts, and how many phases came before it; the ratings phase, which
+    can take a while, calls it again after each chunk of games it rates.
+    """
+
+    def __init__(self, season_id, minimum_games=None, rate=True, progress=None):
+        self.season_id = season_id
+        self.minimum_games = minimum_games
+        self.rate = rate
+        self.progress = progress
+        self.phases = []
+
+    def planned_phases(self):
+        """
+        :return: [(whether in a transaction, [(phase name, function)])], the phases run() runs, in order; the
+        ratings are rated in transactions of their own
+        """
+        phases = [(True, [('teams', self.update_teams)])]
+        if self.rate:
+            phases.append((False, [('ratings', lambda: rate_games(progress=self.rating_progress))]))
+        phases.append((True, [
+            ('players', self.update_players),
+            ('player rankings', lambda: PlayerSeasonSummary.update_rankings(self.season_id, self.minimum_games)),
+            ('team rankings', lambda: Team.rank_season(self.season_id)),
+        ]))
+        return phases
+
+    def phase_count(self):
+        return sum([len(group) for _, group in self.planned_phases()])
+
+    def rating_progress(self, rated):
+        if self.progress is not None:
+            self.progress('ratings, {} games rated'.format(rated), len(self.phases))
+
+    @contextmanager
+    def phase(self, name):
+        if self.progress is not None:
+            self.progress(name, len(self.phases))
+        start = time.monotonic()
+        with QueryCounter() as counter:
+            yield
+        self.phases.append({
+            'name': name,
+            'seconds': time.monotonic() - start,
+            'queries': counter.count,
+        })
+
+    def update_teams(self):
+        records = team_records(self.season_id)
+        adjustments = team_adjustments(self.season_id)
+        teams = list(Team.objects.filter(season_id=self.season_id))
+        for team in teams:
+            record = records.get(team.id, {'wins': 0, 'losses': 0})
+            adjustment = adjustments.get(team.id, {'wins': 0, 'losses': 0})
+            # the win percentage is from games played only, adjustments don't count towards it
+            team.win_percentage = win_percentage(record['wins'], record['losses']) or 0.0
+            team.wins = record['wins'] + adjustment['wins']
+            team.losses = record['losses'] + adjustment['losses']
+        Team.objects.bulk_update(teams, ['wins', 'losses', 'win_percentage'])
+
+    def update_players(self):
+        PlayerSeasonSummary.create_missing(self.season_id)
+        records = player_records(self.season_id)
+        sweeps = player_sweeps(self.season_id)
+        summaries = list(PlayerSeasonSummary.objects.filter(season_id=self.season_id))
+        for summary in summaries:
+            record = records.get(summary.player_id, {'wins': 0, 'losses': 0, 'table_runs': 0})
+            summary.wins = record['wins']
+            summary.losses = record['losses']
+            summary.table_runs = record['table_runs']
+            summary.win_percentage = win_percentage(record['wins'], record['losses'])
+            summary.four_ohs = sweeps.get(summary.player_id, 0)
+        PlayerSeasonSummary.objects.bulk_update(
+            summaries, ['wins', 'losses', 'table_runs', 'win_percentage', 'four_ohs']
+        )
+
+    def run(self):
+        self.phases = []
+        for atomic, group in self.planned_phases():
+            with transaction.atomic() if atomic else nullcontext():
+                for name, function in group:
+                    with self.phase(name):
+                        function()
+        report = self.report()
+        logger.info('season {season_id} stats updated in {seconds:.2f}s with {queries} queries'.format(**report))
+        return report
+
+    def report(self):
+        return {
+            'season_id': self.season_id,
+            'seconds': sum([p['seconds'] for p in self.phases]),
+            'queries': sum([p['queries'] for p in self.phases]),
+            'phases': self.phases,
+        }
+
+
+def recompute_season(season_id, minimum_games=None, rate=True, progress=None):
+    return SeasonStatsRecompute(season_id, minimum_games=minimum_games, rate=rate, progress=progress).run()
+
+
+def score_sheet_deltas(score_sheet):
+    """
+    The stats one score sheet contributes to its teams and players, from one pass over its games.
+    :return: ({team_id: {'wins': w, 'losses': l}},
+    {player_id: {'wins': w, 'losses': l, 'table_runs': t, 'four_ohs': s}})
+    """
+    match = score_sheet.match
+    team_deltas = {getattr(match, '{}_team_id'.format(ah)): {'wins': 0, 'losses': 0} for ah in away_home}
+    player_deltas = {}
+    sweep_wins = {}
+    for game in score_sheet.games.values('winner', 'forfeit', 'table_run', 'away_player_id', 'home_player_id'):
+        if game['winner'] not in away_home:
+            continue
+        if not match.playoff:
+            for ah in away_home:
+                team_delta = team_deltas[getattr(match, '{}_team_id'.format(ah))]
+                team_delta['wins' if game['winner'] == ah else 'losses'] += 1
+        if game['forfeit']:
+            continue
+        for ah in away_home:
+            player_id = game['{}_player_id'.format(ah)]
+            if player_id is None:
+                continue
+            if game['winner'] == ah:
+                sweep_wins[player_id] = sweep_wins.get(player_id, 0) + 1
+            if match.playoff:
+                continue
+            player_delta = player_deltas.setdefault(
+                player_id, {'wins': 0, 'losses': 0, 'table_runs': 0, 'four_ohs': 0}
+            )
+            if game['winner'] == ah:
+                player_delta['wins'] += 1
+                player_delta['table_runs'] += int(game['table_run'])
+            else:
+                player_delta['losses'] += 1
+    sweep_length = games_per_player()
+    for player_id, wins in sweep_wins.items():
+        if wins == sweep_length:
+            player_deltas.setdefault(
+                player_id, {'wins': 0, 'losses': 0, 'table_runs': 0, 'four_ohs': 0}
+            )['four_ohs'] += 1
+    return team_deltas, player_deltas
+
+
+def difference(current, applied):
+    """
+    :return: {id: {stat: current - applied}} for two sets of deltas; applied ones were stored as JSON, so their
+    ids are strings
+    """
+    applied = {int(i): stats for i, stats in applied.items()}
+    return {
+        i: {
+            stat: current.get(i, {}).get(stat, 0) - applied.get(i, {}).get(stat, 0)
+            for stat in set(current.get(i, {})).union(applied.get(i, {}))
+        } for i in set(current).union(applied)
+    }
+
+
+def apply_score_sheet(score_sheet, was_official):
+    """
+    Bring one score sheet's teams' and players' season stats in line with it: take off the stats it was last
+    applied with, stored on it as applied_stats, and add what it contributes now, if it is official; then re-rank
+    the season's players and teams. Called when a score sheet becomes official, or stops being official, or its
+    games change while it is.
+    A score sheet made official before applied_stats were stored has its season's stats recomputed instead.
+    """
+    # imported here, as the score sheet module imports this one when saving
+    from .scoresheet import ScoreSheet
+
+    season_id = score_sheet.match.season_id
+    with transaction.atomic():
+        official, applied_stats = ScoreSheet.objects.select_for_update().values_list(
+            'official', 'applied_stats'
+        ).get(id=score_sheet.id)
+        official = official == 1
+        if not official and not was_official:
+            return
+        if was_official and applied_stats is None:
+            recompute_season(season_id, rate=False)
+            team_deltas, player_deltas = score_sheet_deltas(score_sheet) if official else ({}, {})
+            ScoreSheet.objects.filter(id=score_sheet.id).update(
+                applied_stats={'teams': team_deltas, 'players': player_deltas} if official else None
+            )
+            logger.info('recomputed season {} stats for score sheet {}'.format(season_id, score_sheet.id))
+            return
+
+        team_deltas, player_deltas = score_sheet_deltas(score_sheet) if official else ({}, {})
+        applied_stats = applied_stats or {'teams': {}, 'players': {}}
+        team_changes = difference(team_deltas, applied_stats['teams'])
+        player_changes = difference(player_deltas, applied_stats['players'])
+
+        teams = list(Team.objects.filter(id__in=team_changes.keys()).annotate(
+            adjusted_wins=Sum('scoreadjustment__wins'),
+            adjusted_losses=Sum('scoreadjustment__losses'),
+        ))
+        for team in teams:
+            team.wins += team_changes[team.id]['wins']
+            team.losses += team_changes[team.id]['losses']
+            # as in update_teams, the win percentage does not include adjustments
+            team.win_percentage = win_percentage(
+                team.wins - (team.adjusted_wins or 0), team.losses - (team.adjusted_losses or 0)
+            ) or 0.0
+        Team.objects.bulk_update(teams, ['wins', 'losses', 'win_percentage'])
+
+        # bulk_create doesn't set primary keys on MySQL, so re-fetch the summaries after creating the missing ones
+        existing_player_ids = set(PlayerSeasonSummary.objects.filter(
+            season_id=season_id, player_id__in=player_changes.keys()
+        ).values_list('player_id', flat=True))
+        PlayerSeasonSummary.create_for_players(
+            season_id, [player_id for player_id in player_changes if player_id not in existing_player_ids]
+        )
+        summaries = {
+            s.player_id: s for s in PlayerSeasonSummary.objects.filter(
+                season_id=season_id, player_id__in=player_changes.keys()
+            )
+        }
+        for summary in summaries.values():
+            for stat, change in player_changes[summary.player_id].items():
+                setattr(summary, stat, getattr(summary, stat) + change)
+            summary.win_percentage = win_percentage(summary.wins, summary.losses)
+        PlayerSeasonSummary.objects.bulk_update(
+            summaries.values(), ['wins', 'losses', 'table_runs', 'win_percentage', 'four_ohs']
+        )
+        ScoreSheet.objects.filter(id=score_sheet.id).update(
+            applied_stats={'teams': team_deltas, 'players': player_deltas} if official else None
+        )
+
+        PlayerSeasonSummary.update_rankings(season_id)
+        Team.rank_season(season_id)
+    logger.debug('{} stats for score sheet {}'.format('applied' if official else 'reversed', score_sheet.id))
@@ -1,8 +1,11 @@
 import json
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.urls import reverse
 
+from ..fragments import invalidate, player_tag, season_tag, team_tag
+
 from .division import Division
 from .player import Player
 from .scoresheet import ScoreSheet
@@ -95,8 +98,7 @@ class Team(models.Model):
             home_ss = ScoreSheet.objects.filter(official=1).filter(match__season=self.season).filter(
                 **ss_filter_args
             )
-            for s in home_ss:
-                forfeit_wins += s.forfeit_wins(ah=home_away)
+            forfeit_wins += sum(home_ss.values_list('{}_forfeit_wins'.format(home_away), flat=True))
         return forfeit_wins
 
     def find_score_sheets_against(self, other_teams, official=1):
@@ -108,108 +110,201 @@ class Team(models.Model):
             models.Q(match__home_team__in=other_teams) & models.Q(match__away_team__id=self.id)
         )
 
+    @classmethod
+    def head_to_head(cls, season_id):
+        """
+        The net game wins between every pair of teams that have played each other in a season, on official
+        score sheets, from one query.
+        :param season_id:
+        :return: {(team_id, opponent_id): team_id's game wins less opponent_id's}
+        """
+        net_wins = {}
+        rows = ScoreSheet.objects.filter(official=1, match__season_id=season_id).values(
+            'match__away_team_id', 'match__home_team_id', 'away_wins', 'home_wins'
+        )
+        for row in rows:
+            away_team_id, home_team_id = row['match__away_team_id'], row['match__home_team_id']
+            away_net_wins = row['away_wins'] - row['home_wins']
+            net_wins[(away_team_id, home_team_id)] = net_wins.get((away_team_id, home_team_id), 0) + away_net_wins
+            net_wins[(home_team_id, away_team_id)] = net_wins.get((home_team_id, away_team_id), 0) - away_net_wins
+        return net_wins
+
+    def net_game_wins_from(self, head_to_head, other_teams):
+        """
+        :param head_to_head: see head_to_head()
+        :param other_teams: the teams to count net game wins against; this team is skipped if it is one of them
+        :return:
+        """
+        return sum([head_to_head.get((self.id, t.id), 0) for t in other_teams if t.id != self.id])
+
     def net_game_wins_against(self, tie, score_sheets=None):
-        net_wins = 0
 
-        # we need a shallow copy of other_teams here, so we can both call this function as a lambda, and
-        # not alter the list in the calling context
-        local_other_teams = [x for x in tie.teams.all() if x != self.id]
-        if score_sheets is None:  # this is just here to allow passing in score sheets for tests
-            score_sheets = self.find_score_sheets_against(local_other_teams)
+        if score_sheets is None:
+            return self.net_game_wins_from(Team.head_to_head(self.season_id), tie.teams.all())
 
-        # find all the score sheets where this team is home, and one of the others is away, and vice versa
+        # this is just here to allow passing in score sheets for tests
+        net_wins = 0
         for score_sheet in score_sheets:
             away_match = 1 if score_sheet.match.away_team == self else -1
-            net_wins += score_sheet.away_wins() * away_match - score_sheet.home_wins() * away_match
+            net_wins += score_sheet.away_wins * away_match - score_sheet.home_wins * away_match
 
         return net_wins
 
     @classmethod
     def update_rankings(cls, season_id):
         Team.update_teams_stats(season_id)
-        for division in Division.objects.filter(season_id=season_id).exclude(team__isnull=True):
-            Team.rank_teams(Team.objects.filter(division=division), divisional=True)
-        Team.rank_teams(Team.objects.filter(season_id=season_id).exclude(division_id=None))
+        Team.rank_season(season_id)
+
+    @classmethod
+    def forfeit_wins_by_team(cls, season_id):
+        """
+        forfeit_wins() for every team in a season, from one query
+        :param season_id:
+        :return: {team_id: forfeit wins}; teams without forfeit wins are not included
+        """
+        forfeit_wins = {}
+        rows = ScoreSheet.objects.filter(official=1, match__season_id=season_id).values(
+            'match__away_team_id', 'match__home_team_id', 'away_forfeit_wins', 'home_forfeit_wins'
+        )
+        for row in rows:
+            for ah in away_home:
+                team_id = row['match__{}_team_id'.format(ah)]
+                if row['{}_forfeit_wins'.format(ah)]:
+                    forfeit_wins[team_id] = forfeit_wins.get(team_id, 0) + row['{}_forfeit_wins'.format(ah)]
+        return forfeit_wins
+
+    @classmethod
+    def rank_season(cls, season_id):
+        """
+        Rank the teams in each division, then in the whole season. The teams are ranked in memory, and
+        saved with one bulk update; the ties and tie-breaker results are saved for the record.
+        :param season_id:
+        :return:
+        """
+        teams = list(Team.objects.filter(season_id=season_id).exclude(division_id=None))
+        if not teams:
+            return
+        head_to_head = Team.head_to_head(season_id)
+        forfeit_wins = Team.forfeit_wins_by_team(season_id)
+
+        divisions = {}
+        for team in teams:
+            divisions.setdefault(team.division_id, []).append(team)
+        the_ties = []
+        for division_teams in divisions.values():
+            the_ties += Team.rank_teams(division_teams, True, head_to_head, forfeit_wins)
+        the_ties += Team.rank_teams(teams, False, head_to_head, forfeit_wins)
+
+        with transaction.atomic():
+            Tie.objects.filter(season_id=season_id).delete()
+            Team.objects.bulk_update(teams, ['ranking', 'division_ranking'])
+            tie_breaker_results = []
+            for tie, tie_teams, results in the_ties:
+                tie.save()
+                tie.teams.add(*tie_teams)
+                for result in results:
+                    result.tie = tie
+                tie_breaker_results += results
+            TieBreakerResult.objects.bulk_create(tie_breaker_results)
 
     def get_ranking(self, divisional):
         attribute = 'division_ranking' if divisional else 'ranking'
         return getattr(self, attribute)
 
-    def set_ranking(self, value, divisional):
+    def set_ranking(self, value, divisional, save=True):
         attribute = 'division_ranking' if divisional else 'ranking'
         setattr(self, attribute, value)
-        self.save()
+        if save:
+            self.save()
+
+    @staticmethod
+    def group_ties(teams, attribute):
+        """
+        Sort teams on an attribute, best first, and group the ones that are tied on it
+        :param teams: a list of teams
+        :param attribute:
+        :return: a list of lists of teams
+        """
+        groups = []
+        for team in sorted(teams, key=lambda t: getattr(t, attribute), reverse=attribute == 'win_percentage'):
+            if len(groups) and getattr(groups[-1][0], attribute) == getattr(team, attribute):
+                groups[-1].append(team)
+            else:
+                groups.append([team])
+        return groups
 
     @classmethod
     def find_ties(cls, queryset, attribute, divisional=False, set_rankings=False):
-        inc = 0
+        teams = list(queryset.order_by('%s%s' % ('-' if attribute == 'win_percentage' else '', attribute)))
+        groups = Team.group_ties(teams, attribute)
+        if set_rankings:
+            ranking = 1
+            for group in groups:
+                for team in group:
+                    team.set_ranking(ranking, divisional, save=False)
+                ranking += len(group)
+            Team.objects.bulk_update(teams, ['division_ranking' if divisional else 'ranking'])
         the_ties = []
-        queryset = queryset.order_by('%s%s' % ('-' if attribute == 'win_percentage' else '', attribute))
-        while inc < len(queryset):
-            offset = 1
-            this_tie_teams = [queryset[inc]]
-            if inc == (len(queryset) - 1) or \
-                    getattr(queryset[inc], attribute) != getattr(queryset[inc + offset], attribute):
-                if set_rankings:
-                    queryset[inc].set_ranking(inc + 1, divisional)
-            while inc + offset < len(queryset) \
-                    and getattr(queryset[inc], attribute) == getattr(queryset[inc + offset], attribute):
-                this_tie_teams.append(queryset[inc + offset])
-                if set_rankings:
-                    queryset[inc].set_ranking(inc + 1, divisional)
-                    queryset[inc + offset].set_ranking(inc + 1, divisional)
-                offset += 1
-            if len(this_tie_teams) > 1:
+        for group in groups:
+            if len(group) > 1:
                 tie = Tie(
-                    season=this_tie_teams[0].season,
+                    season_id=group[0].season_id,
                     attribute=attribute,
                 )
                 tie.save()
-                for t in this_tie_teams:
-                    tie.teams.add(Team.objects.get(id=t.id))
-                tie.save()
+                tie.teams.add(*group)
                 the_ties.append(tie)
-            inc += offset
         return the_ties
 
     @classmethod
-    def rank_teams(cls, queryset, divisional=False):
-
-        # we need the team IDs, because we have to re-find the teams to get the updated
-        # rankings between tie-breakers
-        team_ids = [t.id for t in queryset]
+    def rank_teams(cls, teams, divisional=False, head_to_head=None, forfeit_wins=None):
+        """
+        Rank a list of teams in place, without saving them.
+        :param teams: the teams in a division, or a season
+        :param divisional: set the division ranking? or the overall ranking?
+        :param head_to_head: the teams' season's head_to_head()
+        :param forfeit_wins: the teams' season's forfeit_wins_by_team()
+        :return: a list of (unsaved Tie, its teams, its unsaved TieBreakerResults)
+        """
+        attribute = 'division_ranking' if divisional else 'ranking'
+        the_ties = []
 
-        # clear previous ties, using the first team in the queryset to get the season
-        this_season = queryset[0].season
-        old_ties = Tie.objects.filter(season=this_season)
-        for old_tie in old_ties:
-            old_tie.delete()
+        def break_ties(tied_on, tie_breaker, get_value, reverse_order=False):
+            for group in Team.group_ties(teams, tied_on):
+                if len(group) < 2:
+                    continue
+                tie = Tie(season_id=group[0].season_id, attribute=tied_on)
+                # sort the tied teams as the database would have, by name
+                tie_teams = sorted(group, key=lambda t: t.name)
+                values = {team.id: get_value(team, tie_teams) for team in tie_teams}
+                results = tie.apply_tie_breaker(tie_teams, tie_breaker, values, divisional, reverse_order)
+                the_ties.append((tie, tie_teams, results))
 
         # first-order ordering
-        the_ties = Team.find_ties(queryset, 'win_percentage', divisional, set_rankings=True)
-        # now take the ties, the teams in them are ranked.
-        # if a tie can be broken by the net game wins in matches against tied teams,
-        # set/save the new ranking, then delete the ties
-        for a_tie in the_ties:
-            a_tie.break_it('net_game_wins_against', divisional, tie_arg=True, reverse_order=True)
-
-        # there ought to be a way to preserve the ties, but it seems I am going to re-find them
-        # to tie-break based on divisional rankings
+        ranking = 1
+        for group in Team.group_ties(teams, 'win_percentage'):
+            for team in group:
+                team.set_ranking(ranking, divisional, save=False)
+            ranking += len(group)
+
+        # if a tie can be broken by the net game wins in matches against tied teams, that is the new ranking
+        break_ties(
+            'win_percentage', 'net_game_wins_against',
+            lambda team, tie_teams: team.net_game_wins_from(head_to_head, tie_teams),
+            reverse_order=True,
+        )
+
+        # then by divisional rankings
         if not divisional:
-            the_ties = Team.find_ties(Team.objects.filter(id__in=team_ids), 'ranking')
-            for a_tie in the_ties:
-                a_tie.break_it('division_ranking')
+            break_ties('ranking', 'division_ranking', lambda team, tie_teams: team.division_ranking)
 
         # OK now, this is the last automatic tie-breaker.
-        attribute = 'division_ranking' if divisional else 'ranking'
-        the_ties = Team.find_ties(Team.objects.filter(id__in=team_ids), attribute, divisional)
-        for a_tie in the_ties:
-            a_tie.break_it('forfeit_wins', divisional)
+        break_ties(attribute, 'forfeit_wins', lambda team, tie_teams: forfeit_wins.get(team.id, 0))
 
         # norly, the last tie breaker is the rank_tie_breaker, which is populated manually, ie on a coin toss
-        the_ties = Team.find_ties(Team.objects.filter(id__in=team_ids), attribute, divisional)
-        for a_tie in the_ties:
-            a_tie.break_it('rank_tie_breaker', divisional)
+        break_ties(attribute, 'rank_tie_breaker', lambda team, tie_teams: team.rank_tie_breaker)
+
+        return the_ties
 
     @property
     def score_adjustment(self):
@@ -243,7 +338,7 @@ class Tie(models.Model):
     season = models.ForeignKey(Season, on_delete=models.CASCADE)
     attribute = models.CharField(max_length=64)
 
-    def break_it(self, attribute, divisional=False, tie_arg=False, reverse_order=False):
+    def break_it(self, attribute, divisional=False, tie_arg=False, reverse_order=False, head_to_head=None):
         """
 
         :param attribute: the attribute or method name we'll use to sort/break this tie
@@ -251,19 +346,46 @@ class Tie(models.Model):
         :param tie_arg: does the method need the tie passed to it as an argument? really just for net_game_wins_against.
         :param reverse_order: does this tie-breaker sort people in the reverse order we want?
             it should be true for net_game_wins_against.
+        :param head_to_head: the season's Team.head_to_head(), for net_game_wins_against; found if not passed
         :return: nothing. apply new rankings in-place.
         """
 
-        def get_value(team):
-            if tie_arg:
+        the_teams = list(self.teams.all())
+
+        def find_value(team):
+            if attribute == 'net_game_wins_against':
+                return team.net_game_wins_from(head_to_head, the_teams)
+            elif tie_arg:
                 return getattr(team, attribute)(self)
             elif attribute == 'forfeit_wins':
                 return team.forfeit_wins()
             else:
                 return getattr(team, attribute)
 
+        if attribute == 'net_game_wins_against' and head_to_head is None:
+            head_to_head = Team.head_to_head(self.season_id)
+        # find each team's value once; some of them take queries
+        values = {team.id: find_value(team) for team in the_teams}
+
+        results = self.apply_tie_breaker(the_teams, attribute, values, divisional, reverse_order)
+        Team.objects.bulk_update(the_teams, ['division_ranking' if divisional else 'ranking'])
+        TieBreakerResult.objects.bulk_create(results)
+
+    def apply_tie_breaker(self, the_teams, attribute, values, divisional=False, reverse_order=False):
+        """
+        Re-rank tied teams in place, without saving them.
+        :param the_teams: the tied teams
+        :param attribute: the name of the tie-breaker
+        :param values: {team_id: tie-breaker value}
+        :param divisional: are we setting divisional rankings? or overall?
+        :param reverse_order: should the teams be ranked highest value first?
+        :return: a list of unsaved TieBreakerResults, for the teams whose rankings changed
+        """
+
+        def get_value(team):
+            return values[team.id]
+
         # print('breaking ties based on {}'.format(attribute))
-        the_teams = list(self.teams.all())
         sorted_teams = sorted(the_teams, key=lambda team: get_value(team))
         tie_breaker_values = {}
         if reverse_order:
@@ -286,19 +408,21 @@ class Tie(models.Model):
                 offset += 1
             inc += offset
 
+        results = []
         rank_set_inc = 0
         for (rank_change, value) in de_tying_array:
             if rank_change:
-                TieBreakerResult(
+                results.append(TieBreakerResult(
                     tie=self, rank_change=rank_change,
                     team_id=sorted_teams[rank_set_inc].id,
                     attribute=attribute,
                     divisional=divisional,
                     summary='; '.join(['%s: %s' % (x, tie_breaker_values[x]) for x in tie_breaker_values])
-                ).save()
+                ))
                 prev_rank = sorted_teams[rank_set_inc].get_ranking(divisional)
-                sorted_teams[rank_set_inc].set_ranking(prev_rank + rank_change, divisional)
+                sorted_teams[rank_set_inc].set_ranking(prev_rank + rank_change, divisional, save=False)
             rank_set_inc += 1
+        return results
 
 
 class TieBreakerResult(models.Model):
@@ -323,3 +447,31 @@ class ScoreAdjustment(models.Model):
 
     def __str__(self):
         return "{}/{}/w/{}/l".format(self.team.season, self.team, self.wins, self.losses)
+
+
+def invalidate_team(sender, instance, **kwargs):
+    # the season's divisions and teams pages list its teams, outside any fragment
+    invalidate([team_tag(instance.id), season_tag(instance.season_id)])
+
+
+def invalidate_roster(sender, instance, action, pk_set, **kwargs):
+    """
+    Invalidate the fragments showing the teams and players whose memberships change; for a clear, the ones
+    they are about to lose.
+    """
+    if action not in ['post_add', 'post_remove', 'pre_clear']:
+        return
+    if action == 'pre_clear':
+        pk_set = instance.team_set.values_list('id', flat=True) if kwargs['reverse'] else \
+            instance.players.values_list('id', flat=True)
+    team_ids, player_ids = (pk_set, [instance.id]) if kwargs['reverse'] else ([instance.id], pk_set)
+    season_ids = set(Team.objects.filter(id__in=team_ids).values_list('season_id', flat=True)) if \
+        kwargs['reverse'] else [instance.season_id]
+    invalidate(
+        [team_tag(t) for t in team_ids] + [player_tag(p) for p in player_ids] + [season_tag(s) for s in season_ids]
+    )
+
+
+post_save.connect(invalidate_team, sender=Team, dispatch_uid='team_fragments_save')
+post_delete.connect(invalidate_team, sender=Team, dispatch_uid='team_fragments_delete')
+m2m_changed.connect(invalidate_roster, sender=Team.players.through, dispatch_uid='team_fragments_roster')
@@ -112,6 +112,27 @@ class Tournament(models.Model):
             losers_bracket, created = Bracket.objects.get_or_create(tournament=self, type='l')
             losers_bracket.save()
 
+    def build_brackets(self):
+        """
+        Create the brackets, and their rounds and matchups, for the tournament's participants
+        """
+        finals_rounds = ['first', 'second']
+        self.create_brackets()
+        self.create_rounds()
+
+        for b in self.bracket_set.all():
+            for r in b.round_set.all():
+                r.create_matchups()
+        if self.elimination == 'double':
+            winners_bracket = self.bracket_set.get(type='w')
+            i = 0
+            for _round in winners_bracket.round_set.filter(number__gt=self.round_count()).order_by('number'):
+                _round.create_finals_matchup(finals_rounds[i])
+                i += 1
+        else:
+            if self.third_place:
+                self.create_third_place_matchup()
+
     def round_count(self):
         participant_count = len(self.participant_set.all())
         if participant_count > 0:
@@ -391,7 +412,7 @@ class Round(models.Model):
         return '{}-{}'.format(self.bracket.type, self.number)
 
     def matchup_count(self):
-        if self.bracket.type is 'w':
+        if self.bracket.type == 'w':
             return int(self.bracket.tournament.bracket_size() / 2 ** self.number)
         else:
             # LS round sizes from bracket of 64: 16, 16, 8, 8, 4, 4, 2, 2, 1
@@ -462,7 +483,7 @@ class Round(models.Model):
             matchup_args['round'] = self
             matchup_args['number'] = i + 1
             if self.number == 1:
-                if self.bracket.type is 'w':
+                if self.bracket.type == 'w':
                     for p in PARTICIPANT_LETTERS:
                         matchup_args['participant_{}'.format(p)] = self.get_first_round_winners_participant(p, i)
                 else:
@@ -473,7 +494,7 @@ class Round(models.Model):
                         matchup_args['{}_want_winner'.format(p)] = False
 
             else:
-                if self.bracket.type is 'w':
+                if self.bracket.type == 'w':
                     for p in PARTICIPANT_LETTERS:
                         matchup_args['source_match_{}'.format(p)] = self.get_winners_bracket_source_matchup(p, i)
                 elif self.number % 2 == 0:
@@ -15,14 +15,11 @@ class Week(models.Model):
     @classmethod
     def get_weeks_in_season(cls, before_after, week):
         comp_args = {
-            'season_id': week.season,
+            'season_id': week.season_id,
             'date__{}'.format('lt' if before_after == 'before' else 'gt'): week.date
         }
         weeks = cls.objects.filter(**comp_args).order_by('date')
-        if before_after == 'before':
-            return list(weeks)[-1] if weeks else None
-        else:
-            return weeks[0] if weeks else None
+        return weeks.last() if before_after == 'before' else weeks.first()
 
     def next(self):
         return self.get_weeks_in_season(before_after='after', week=self)
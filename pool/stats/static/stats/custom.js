@@ -24,6 +24,32 @@ function reset_last_game(){
 }
 
 
+/*
+  Keeps the scores on a page up to date, from a stream of server-sent events; the
+  elements showing a score sheet's score have its id as their data-score-sheet. Each
+  time the stream opens, the scores are read again from pageUrl, for the changes made
+  before it first opened, or while it was reconnecting.
+*/
+function followScores(liveUrl, pageUrl) {
+    if (!window.EventSource) {
+        return;
+    }
+    let source = new EventSource(liveUrl);
+    source.onopen = function () {
+        $.get(pageUrl, function (page) {
+            // parseHTML leaves out the page's scripts
+            $('<div>').append($.parseHTML(page)).find('[data-score-sheet]').each(function () {
+                $('[data-score-sheet="' + $(this).data('score-sheet') + '"]').text($(this).text());
+            });
+        });
+    };
+    source.onmessage = function (event) {
+        let change = JSON.parse(event.data);
+        $('[data-score-sheet="' + change.score_sheet + '"]').text(change.away_wins + '-' + change.home_wins);
+    };
+}
+
+
 function csrfSafeMethod(method) {
     // these HTTP methods do not require CSRF protection
     return (/^(GET|HEAD|OPTIONS|TRACE)$/.test(method));
@@ -53,6 +79,7 @@ function ScoreSheet(args) {
             commentUrl: args.commentUrl,
             gameFormUrl: args.gameUpdateUrl,
             dataUrl: args.dataUrl,
+            liveUrl: args.liveUrl,
             weekUrl: args.weekUrl,
             gameGroupSize: args.gameGroupSize,
             csrfToken: args.csrfToken,
@@ -74,7 +101,13 @@ function ScoreSheet(args) {
                     $.ajax({
                         url: this.dataUrl,
                         dataType: 'json',
-                        success: function (data) {
+                        // sends If-None-Match; nothing has changed if the response is a 304
+                        ifModified: true,
+                        success: function (data, status) {
+                            if (status === 'notmodified') {
+                                resolve();
+                                return;
+                            }
                             self.comment = data.comment;
                             self.complete = data.complete;
                             self.teams = data.teams;
@@ -90,6 +123,53 @@ function ScoreSheet(args) {
                     });
                 });
             },
+            follow: function () {
+                // apply the games' results as they are published, rather than reloading the summary
+                let self = this;
+                let source = new EventSource(this.liveUrl);
+                // catch up on what changed before the stream first opened, or while it was reconnecting
+                source.onopen = () => self.updateData();
+                source.onmessage = function (event) {
+                    let change = JSON.parse(event.data);
+                    if (change.type !== 'games') {
+                        self.updateData();
+                        return;
+                    }
+                    change.games.forEach(function (changed) {
+                        let game = self.games.find(g => g.id === changed.id);
+                        if (game) {
+                            Object.assign(game, changed);
+                        }
+                    });
+                    self.teams.away.wins = change.away_wins;
+                    self.teams.home.wins = change.home_wins;
+                    self.countPlayerWins();
+                };
+            },
+            countPlayerWins: function () {
+                // the same counts as ScoreSheet.player_summary()
+                let self = this;
+                ['away', 'home'].forEach(function (team) {
+                    self.teams[team].players.forEach(function (summary) {
+                        summary.wins = summary.losses = summary.table_runs = 0;
+                        self.games.filter(g => !g.forfeit && (g.winner === 'away' || g.winner === 'home')).forEach(function (game) {
+                            ['away', 'home'].forEach(function (side) {
+                                let player = game[side + '_player'];
+                                if (player && player.url === summary.player.url) {
+                                    if (game.winner === side) {
+                                        summary.wins += 1;
+                                        if (game.table_run) {
+                                            summary.table_runs += 1;
+                                        }
+                                    } else {
+                                        summary.losses += 1;
+                                    }
+                                }
+                            });
+                        });
+                    });
+                });
+            },
             displayDate: function (dateString) {
                 let timestamp = new Date(dateString);
                 return timestamp.toLocaleTimeString('en-GB', {hour: '2-digit', minute: '2-digit'});
@@ -236,6 +316,9 @@ function ScoreSheet(args) {
         },
         mounted: function () {
             this.updateData();
+            if (this.liveUrl && window.EventSource) {
+                this.follow();
+            }
         },
     });
 }
\ No newline at end of file
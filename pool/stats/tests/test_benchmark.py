@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from ..management.commands.generate_league import SPONSOR_NAME
+from ..models import Participant, PlayerRating, ScoreSheet, Season, Sponsor, Team
+from ..models.globals import away_home
+
+
+class BenchmarkTests(TestCase):
+
+    fixtures = ['sample_game_setup']
+
+    def setUp(self):
+        super(BenchmarkTests, self).setUp()
+        # the rating bookmark is cached
+        cache.clear()
+        call_command(
+            'generate_league', seasons=1, divisions=1, teams=4, weeks=2, tournaments=1, seed=1, default=True,
+            stdout=StringIO(),
+        )
+        self.season = Season.objects.get(is_default=True)
+
+    def tearDown(self):
+        cache.clear()
+        super(BenchmarkTests, self).tearDown()
+
+    def test_generate_league(self):
+
+        self.assertEqual(Team.objects.filter(season=self.season).count(), 4)
+        score_sheets = ScoreSheet.objects.filter(match__season=self.season)
+        # two matches a week, all of them played and official
+        self.assertEqual(score_sheets.count(), 4)
+        self.assertEqual(score_sheets.filter(official=1).count(), 4)
+        for score_sheet in score_sheets:
+            self.assertEqual(score_sheet.games.filter(winner__in=away_home).count(), score_sheet.games.count())
+        self.assertTrue(PlayerRating.objects.exists())
+        self.assertEqual(Team.objects.filter(season=self.season, wins=0, losses=0).count(), 0)
+        self.assertTrue(Participant.objects.filter(tournament__season=self.season, place=1).exists())
+
+    def test_benchmark_and_compare(self):
+
+        output = os.path.join(tempfile.mkdtemp(), 'benchmark.json')
+        call_command('benchmark', repeat=1, output=output, stdout=StringIO())
+        with open(output) as f:
+            results = json.load(f)
+        self.assertEqual(results['season_id'], self.season.id)
+        for name in ['update_season_stats', 'rate_games', 'Team.update_rankings', 'view:players', 'view:matchup']:
+            self.assertIn(name, results['cases'])
+            self.assertGreater(results['cases'][name]['queries'], 0)
+
+        out = StringIO()
+        call_command(
+            'benchmark', repeat=1, output=output + '.2', compare=output, cases=['view:teams'], stdout=out
+        )
+        self.assertRegex(out.getvalue(), r'view:teams +[0-9.]+s +[0-9.]+s')
+
+    def test_real_database_refused(self):
+
+        Sponsor.objects.filter(name=SPONSOR_NAME).delete()
+        ratings = PlayerRating.objects.count()
+        with self.assertRaises(CommandError):
+            call_command('benchmark', repeat=1, output=os.devnull, stdout=StringIO())
+        self.assertEqual(PlayerRating.objects.count(), ratings)
+        call_command('benchmark', repeat=1, output=os.devnull, cases=['view:teams'], destructive=True,
+                     stdout=StringIO())
@@ -0,0 +1,95 @@
+import datetime
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from ..fragments import wait_for_refreshes
+from ..models import PlayerSeasonSummary, ScoreSheet, Season, Team
+from ..models.player_rating import update_summary_ratings
+from ..utils import expire_caches, update_season_stats
+from .base_cases import BasePoolStatsTestCase
+
+
+class DownstreamCachingTests(BasePoolStatsTestCase):
+
+    def setUp(self):
+        super(DownstreamCachingTests, self).setUp()
+        cache.clear()
+        expire_caches()
+
+    def tearDown(self):
+        cache.clear()
+        expire_caches()
+        super(DownstreamCachingTests, self).tearDown()
+
+    def players(self, season_id, **headers):
+        return self.client.get(reverse('players', kwargs={'season_id': season_id}), **headers)
+
+    def test_current_season(self):
+        response = self.players(self.default_season)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        etag = response['ETag']
+
+        # the view isn't run to answer a conditional GET
+        not_modified = self.players(self.default_season, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.query_stats['queries'], 1)
+        self.assertEqual(not_modified['ETag'], etag)
+
+        # until the season's stats are updated; the stale table served while it's rendered again isn't cached
+        update_season_stats(self.default_season)
+        response = self.players(self.default_season, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertFalse(response.has_header('ETag'))
+        wait_for_refreshes()
+        response = self.players(self.default_season, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_team_changes(self):
+        response = self.client.get(reverse('teams', kwargs={'season_id': self.default_season}))
+        etag = response['ETag']
+        self.assertEqual(self.client.get(
+            reverse('teams', kwargs={'season_id': self.default_season}), HTTP_IF_NONE_MATCH=etag
+        ).status_code, 304)
+        Team.objects.create(season_id=self.default_season, name='new team')
+        response = self.client.get(reverse('teams', kwargs={'season_id': self.default_season}), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('new team', response.content.decode())
+
+    def test_ratings(self):
+        update_season_stats(self.default_season)
+        self.client.get(reverse('feature_set', kwargs={'feature': 'rating', 'setting': 1}))
+        etag = self.players(self.default_season)['ETag']
+        self.assertEqual(self.players(self.default_season, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # rating players changes the ratings shown, in every season
+        summary = PlayerSeasonSummary.objects.filter(season_id=self.default_season).first()
+        update_summary_ratings([summary.player_id])
+        self.players(self.default_season)
+        wait_for_refreshes()
+        response = self.players(self.default_season, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_archived_season(self):
+        other_season = Season.objects.get(id=5)
+        other_season.pub_date = datetime.date(2009, 1, 1)
+        other_season.save()
+        response = self.players(other_season.id)
+        self.assertIn('max-age=86400', response['Cache-Control'])
+        # the session's rating setting changes the page, so it changes the ETag
+        self.client.get(reverse('feature_set', kwargs={'feature': 'rating', 'setting': 1}))
+        self.assertEqual(self.players(other_season.id, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_private_pages(self):
+        response = self.client.post(reverse('score_sheet_create'), data={'match_id': self.DEFAULT_TEST_MATCH_ID})
+        score_sheet = ScoreSheet.objects.get(id=int(response.url.split('/')[-2]))
+        response = self.client.get(reverse('score_sheet', kwargs={'score_sheet_id': score_sheet.id}))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertFalse(response.has_header('ETag'))
@@ -0,0 +1,202 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+
+from ..fragments import (
+    Fragment, invalidate, lock_key, page_cache, player_tag, season_tag, tag_key, wait_for_refreshes
+)
+from ..models import Player, PlayerSeasonSummary, ScoreSheet, Team
+from ..models.player_rating import update_summary_ratings
+from ..utils import expire_caches, update_season_stats
+from .base_cases import BasePoolStatsTestCase
+from .test_unit import populate_lineup_entries
+
+
+class FragmentTests(BasePoolStatsTestCase):
+
+    other_season = 5
+
+    def setUp(self):
+        super(FragmentTests, self).setUp()
+        cache.clear()
+        expire_caches()
+        score_sheet = ScoreSheet(match_id=self.DEFAULT_TEST_MATCH_ID)
+        score_sheet.save()
+        score_sheet.initialize_lineup()
+        score_sheet.initialize_games()
+        populate_lineup_entries(score_sheet)
+        score_sheet.set_games()
+        score_sheet.games.update(winner='away')
+        self.score_sheet = score_sheet
+
+    def tearDown(self):
+        cache.clear()
+        expire_caches()
+        super(FragmentTests, self).tearDown()
+
+    @staticmethod
+    def players_table(season_id):
+        return Fragment('players_table.{}.False'.format(season_id)).get()
+
+    def view_players(self, *season_ids):
+        for season_id in season_ids:
+            self.client.get(reverse('players', kwargs={'season_id': season_id}))
+        # stale tables are rendered again in the background
+        wait_for_refreshes()
+
+    def test_tagged_invalidation(self):
+        self.view_players(self.default_season, self.other_season)
+        self.assertIsNotNone(self.players_table(self.default_season))
+
+        # another season's change leaves this season's table
+        invalidate([season_tag(self.other_season)])
+        self.assertIsNone(self.players_table(self.other_season))
+        self.assertIsNotNone(self.players_table(self.default_season))
+
+        # becoming official changes this season's table, only
+        self.view_players(self.other_season)
+        self.score_sheet.official = 1
+        self.score_sheet.save()
+        self.assertIsNone(self.players_table(self.default_season))
+        self.assertIsNotNone(self.players_table(self.other_season))
+
+        # as does a stats update
+        self.view_players(self.default_season)
+        update_season_stats(self.default_season)
+        self.assertIsNone(self.players_table(self.default_season))
+        self.assertIsNotNone(self.players_table(self.other_season))
+
+    def test_rating_invalidates_players(self):
+        self.score_sheet.official = 1
+        self.score_sheet.save()
+        self.view_players(self.default_season)
+        listed = PlayerSeasonSummary.objects.filter(season_id=self.default_season, ranking__gt=0).first()
+        self.assertIsNotNone(self.players_table(self.default_season))
+
+        update_summary_ratings([0])
+        self.assertIsNotNone(self.players_table(self.default_season))
+        update_summary_ratings([listed.player_id])
+        self.assertIsNone(self.players_table(self.default_season))
+
+    def test_team_changes(self):
+        team = Team.objects.get(id=self.DEFAULT_TEST_AWAY_TEAM_ID)
+        player = Player.objects.exclude(team=team).first()
+
+        def team_players_table():
+            self.client.get(reverse('team', kwargs={'team_id': team.id}))
+            wait_for_refreshes()
+            return Fragment('players_table.team.{}.False'.format(team.id)).get()
+
+        self.assertIsNotNone(team_players_table())
+        team.players.add(player)
+        self.assertIsNone(Fragment('players_table.team.{}.False'.format(team.id)).get())
+        self.assertIsNotNone(team_players_table())
+        player.team_set.remove(team)
+        self.assertIsNone(Fragment('players_table.team.{}.False'.format(team.id)).get())
+        self.assertIsNotNone(team_players_table())
+        team.name = 'renamed'
+        team.save()
+        self.assertIsNone(Fragment('players_table.team.{}.False'.format(team.id)).get())
+
+    def test_rating_table(self):
+        response = self.client.get(reverse('rating', kwargs={'player_id': 1}))
+        self.assertEqual(response.status_code, 200)
+        # just the table is cached, not the page around it, which is the session's
+        table = Fragment('rating.1').get()
+        self.assertTrue(table.startswith('<table'))
+        self.assertIn(table, response.content.decode())
+
+    def test_forgotten_tags(self):
+        fragment = Fragment('fragment')
+        fragment.set('cached', [player_tag(1)])
+        self.assertEqual(Fragment('fragment').get(), 'cached')
+        # with its tags gone, nothing says the fragment is still good
+        page_cache.delete(tag_key(player_tag(1)))
+        self.assertIsNone(Fragment('fragment').get())
+
+    def test_clock_independent(self):
+        fragment = Fragment('fragment')
+        fragment.set('cached', [player_tag(1)])
+        # another process, whose clock is behind this one's, invalidates the fragment
+        with mock.patch('time.time', return_value=0):
+            invalidate([player_tag(1)])
+        self.assertIsNone(Fragment('fragment').get())
+        # one rendered after is fresh
+        Fragment('fragment').set('cached again', [player_tag(1)])
+        self.assertEqual(Fragment('fragment').get(), 'cached again')
+
+    def test_single_flight(self):
+        renders = []
+        rendering = threading.Event()
+
+        def render():
+            renders.append(1)
+            rendering.set()
+            time.sleep(0.2)
+            return 'rendered', [player_tag(1)]
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            first = executor.submit(lambda: Fragment('fragment').get_or_render(render))
+            rendering.wait(timeout=1)
+            # the others wait for the first to render it
+            others = [executor.submit(lambda: Fragment('fragment').get_or_render(render)) for _ in range(3)]
+            values = [first.result()] + [o.result() for o in others]
+        self.assertEqual(values, ['rendered'] * 4)
+        self.assertEqual(len(renders), 1)
+        self.assertIsNone(page_cache.get(lock_key('fragment')))
+
+    @override_settings(FRAGMENT_RENDERING=dict(settings.FRAGMENT_RENDERING, wait=0.1))
+    def test_locked_fragment(self):
+        Fragment('fragment').set('stale', [player_tag(1)])
+        invalidate([player_tag(1)])
+        page_cache.add(lock_key('fragment'), 'another request')
+
+        # while another request renders it, the stale copy is served
+        self.assertEqual(Fragment('fragment').get_or_render(lambda: ('rendered', [player_tag(1)])), 'stale')
+        # and without one, after waiting for it, the fragment is rendered anyway
+        page_cache.delete('fragment')
+        self.assertEqual(Fragment('fragment').get_or_render(lambda: ('rendered', [player_tag(1)])), 'rendered')
+        self.assertEqual(page_cache.get(lock_key('fragment')), 'another request')
+
+    def test_stale_while_revalidate(self):
+        rendering = threading.Event()
+
+        def render():
+            rendering.wait(timeout=1)
+            return 'rendered', [player_tag(1)]
+
+        Fragment('fragment').set('stale', [player_tag(1)])
+        invalidate([player_tag(1)])
+        # the stale copy is served without waiting for it to be rendered again
+        fragment = Fragment('fragment')
+        self.assertEqual(fragment.get_or_render(render), 'stale')
+        # as it is to the requests that come while it is
+        self.assertEqual(Fragment('fragment').get_or_render(lambda: self.fail('rendered twice')), 'stale')
+        rendering.set()
+        fragment.refresh.result(timeout=1)
+        self.assertEqual(Fragment('fragment').get(), 'rendered')
+
+        # unless a stale copy won't do
+        invalidate([player_tag(1)])
+        self.assertEqual(Fragment('fragment').get_or_render(lambda: ('again', [player_tag(1)]), stale=False), 'again')
+
+    def test_soft_expiry_and_version(self):
+        rendering = dict(settings.FRAGMENT_RENDERING, soft_timeout=3600, version=1)
+        with override_settings(FRAGMENT_RENDERING=dict(rendering, soft_timeout=0)):
+            Fragment('fragment').set('expired', [player_tag(1)])
+        with override_settings(FRAGMENT_RENDERING=rendering):
+            self.assertIsNone(Fragment('fragment').get())
+            Fragment('fragment').set('current', [player_tag(1)])
+            self.assertEqual(Fragment('fragment').get(), 'current')
+        with override_settings(FRAGMENT_RENDERING=dict(rendering, version=2)):
+            self.assertIsNone(Fragment('fragment').get())
+            fragment = Fragment('fragment')
+            self.assertEqual(fragment.get_or_render(lambda: ('new version', [player_tag(1)])), 'current')
+            fragment.refresh.result(timeout=1)
+            self.assertEqual(Fragment('fragment').get(), 'new version')
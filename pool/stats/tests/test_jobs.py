@@ -0,0 +1,120 @@
+import datetime
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from ..fragments import Fragment
+from ..models import Job, ScoreSheet, Team
+from ..models.season_stats import SeasonStatsRecompute
+from .base_cases import BasePoolStatsTestCase
+from .test_unit import populate_lineup_entries
+
+
+class JobTests(BasePoolStatsTestCase):
+
+    def setUp(self):
+        super(JobTests, self).setUp()
+        cache.clear()
+        User.objects.create_superuser('test_admin', 'test.admin@example.com', 'test_ad$m!in_Pa55')
+        self.admin_client = Client()
+        self.admin_client.login(username='test_admin', password='test_ad$m!in_Pa55')
+
+    def tearDown(self):
+        cache.clear()
+        super(JobTests, self).tearDown()
+
+    def test_enqueue_merges_requests(self):
+        job, created = Job.enqueue(self.default_season)
+        self.assertTrue(created)
+        same_job, created = Job.enqueue(self.default_season)
+        self.assertFalse(created)
+        self.assertEqual(same_job.id, job.id)
+        self.assertEqual(same_job.requests, 2)
+
+        # once a job is running, a new request gets a new job
+        self.assertEqual(Job.claim().id, job.id)
+        self.assertIsNone(Job.claim())
+        next_job, created = Job.enqueue(self.default_season)
+        self.assertTrue(created)
+        self.assertNotEqual(next_job.id, job.id)
+
+    def test_stale_job_is_queued_again(self):
+        job, _ = Job.enqueue(self.default_season)
+        self.assertEqual(Job.claim().id, job.id)
+        # its worker was killed, a while ago
+        Job.objects.filter(id=job.id).update(heartbeat=timezone.now() - datetime.timedelta(hours=1))
+
+        next_job = Job.claim()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertNotEqual(next_job.id, job.id)
+        self.assertEqual((next_job.season_id, next_job.status), (self.default_season, Job.RUNNING))
+        self.assertIsNone(Job.claim())
+
+    def test_rating_reports_progress(self):
+        score_sheet = ScoreSheet(match_id=self.DEFAULT_TEST_MATCH_ID)
+        score_sheet.save()
+        score_sheet.initialize_lineup()
+        score_sheet.initialize_games()
+        populate_lineup_entries(score_sheet)
+        score_sheet.set_games()
+        score_sheet.games.update(winner='away')
+        score_sheet.official = 1
+        score_sheet.save()
+        job, _ = Job.enqueue(self.default_season)
+        job = Job.claim()
+        progress = []
+        job.set_progress = lambda name, done, count: progress.append((name, done))
+        job.run()
+        self.assertEqual(job.status, Job.DONE)
+        # the ratings phase reports after each chunk, so a long one isn't taken for a stopped worker
+        self.assertIn(('ratings, {} games rated'.format(score_sheet.games.count()), 1), progress)
+
+    def test_admin_action_queues_and_worker_runs(self):
+        score_sheet = ScoreSheet(match_id=self.DEFAULT_TEST_MATCH_ID)
+        score_sheet.save()
+        score_sheet.initialize_lineup()
+        score_sheet.initialize_games()
+        populate_lineup_entries(score_sheet)
+        score_sheet.set_games()
+        score_sheet.games.update(winner='away')
+        score_sheet.official = 1
+        score_sheet.save()
+        Team.objects.filter(season_id=self.default_season).update(wins=0, losses=0)
+
+        for _ in range(2):
+            response = self.admin_client.post(reverse('admin:stats_season_changelist'), {
+                'action': 'update_stats', '_selected_action': (self.default_season,)
+            })
+            self.assertEqual(response.status_code, 302)
+        job = Job.objects.get(season_id=self.default_season)
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.requests, 2)
+        # nothing has been updated yet
+        self.assertEqual(Team.objects.get(id=score_sheet.match.away_team_id).wins, 0)
+
+        call_command('run_jobs', once=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        # teams' wins are game wins
+        self.assertEqual(Team.objects.get(id=score_sheet.match.away_team_id).wins, score_sheet.games.count())
+        self.assertEqual([p['name'] for p in job.report['phases']][0], 'teams')
+        self.assertEqual(len(job.report['phases']), SeasonStatsRecompute(self.default_season).phase_count())
+        self.assertIsNotNone(job.took())
+
+        # the season's pages were rendered into the page cache, with and without ratings
+        team_count = Team.objects.filter(season_id=self.default_season).count()
+        self.assertEqual(len(job.report['warming']), 3 + 2 * team_count)
+        self.assertEqual([p for p in job.report['warming'] if p['error']], [])
+        for rating in [False, True]:
+            self.assertIsNotNone(Fragment('players_table.{}.{}'.format(self.default_season, rating)).get())
+        self.assertIsNotNone(Fragment('divisions.{}'.format(self.default_season)).get())
+
+        response = self.admin_client.get(reverse('admin:stats_job_change', args=(job.id,)))
+        self.assertContains(response, 'player rankings')
+        self.assertContains(response, 'players with ratings')
@@ -0,0 +1,60 @@
+from unittest import mock
+
+from django.core.cache import cache
+
+from ..instrumentation import QueryCounter
+from ..models import GameOrder, PlayPosition, league_config
+from ..models.league_config import VERSION_KEY
+from .base_cases import BasePoolStatsTestCase
+
+
+class LeagueConfigTests(BasePoolStatsTestCase):
+
+    def setUp(self):
+        super(LeagueConfigTests, self).setUp()
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+        super(LeagueConfigTests, self).tearDown()
+
+    def test_loaded_once(self):
+        self.assertEqual(
+            [g.id for g in league_config.game_orders(tiebreaker=False)],
+            list(GameOrder.objects.filter(tiebreaker=False).values_list('id', flat=True))
+        )
+        with QueryCounter() as counter:
+            league_config.game_orders()
+            league_config.play_positions(tiebreaker=True)
+            [g.away_position.away_name for g in league_config.game_orders()]
+        self.assertEqual(counter.count, 0)
+
+    def test_reloaded_after_save(self):
+        position = league_config.play_positions(tiebreaker=False)[0]
+        PlayPosition.objects.filter(id=position.id).update(name='not yet')
+        self.assertNotEqual(league_config.play_positions(tiebreaker=False)[0].name, 'not yet')
+
+        position = PlayPosition.objects.get(id=position.id)
+        position.name = 'changed'
+        position.save()
+        self.assertEqual(league_config.play_positions(tiebreaker=False)[0].name, 'changed')
+
+        # a cleared cache is a new version, too, once it's checked
+        PlayPosition.objects.filter(id=position.id).update(name='cleared')
+        cache.clear()
+        with self.settings(LEAGUE_CONFIG_CHECK_INTERVAL=0):
+            self.assertEqual(league_config.play_positions(tiebreaker=False)[0].name, 'cleared')
+
+    def test_version_checked_at_intervals(self):
+        league_config.invalidate()
+        config = league_config.load()
+        with mock.patch.object(cache, 'get', wraps=cache.get) as get:
+            for _ in range(3):
+                self.assertIs(league_config.load(), config)
+            self.assertEqual(get.call_count, 0)
+            # another process changes the version
+            cache.set(VERSION_KEY, 'changed', timeout=None)
+            self.assertIs(league_config.load(), config)
+            with self.settings(LEAGUE_CONFIG_CHECK_INTERVAL=0):
+                self.assertIsNot(league_config.load(), config)
+            self.assertEqual(league_config.load().version, 'changed')
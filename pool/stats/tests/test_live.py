@@ -0,0 +1,61 @@
+import json
+
+from django.test import override_settings
+from django.urls import reverse
+
+from .. import live
+from ..models import ScoreSheet
+from .base_cases import BasePoolStatsTestCase
+
+
+@override_settings(LIVE_UPDATES={'broker': 'stats.live.LocalBroker', 'keepalive': 1, 'max_age': 2})
+class LiveUpdateTests(BasePoolStatsTestCase):
+
+    def setUp(self):
+        super(LiveUpdateTests, self).setUp()
+        response = self.client.post(reverse('score_sheet_create'), data={'match_id': self.DEFAULT_TEST_MATCH_ID})
+        self.score_sheet = ScoreSheet.objects.get(id=int(response.url.split('/')[-2]))
+
+    def test_game_update_is_published(self):
+        subscription = live.get_broker().subscribe([
+            live.score_sheet_channel(self.score_sheet.id), live.week_channel(self.DEFAULT_TEST_WEEK_ID)
+        ])
+        game = self.score_sheet.games.order_by('id').first()
+        self.client.post(reverse('game_update'), data={
+            'game_id': game.id, 'winner': 'home', 'forfeit': 'false', 'table_run': 'false'
+        })
+        messages = [json.loads(subscription.get(timeout=1)) for _ in range(2)]
+        subscription.close()
+
+        self.assertEqual([m['type'] for m in messages], ['games', 'score'])
+        self.assertEqual(messages[0]['games'][0]['id'], game.id)
+        self.assertEqual(messages[0]['games'][0]['winner'], 'home')
+        self.assertEqual((messages[1]['away_wins'], messages[1]['home_wins']), (0, 1))
+        self.assertIsNone(subscription.get(timeout=0))
+
+    def test_stream(self):
+        response = self.client.get(reverse('score_sheet_live', kwargs={'score_sheet_id': self.score_sheet.id}))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = iter(response.streaming_content)
+        self.assertTrue(next(events).startswith(b'retry: '))
+
+        live.publish_lineup(self.score_sheet)
+        self.assertEqual(
+            json.loads(next(events).decode()[len('data: '):]), {'type': 'lineup', 'score_sheet': self.score_sheet.id}
+        )
+        # nothing more is published, so there are keep-alives until the stream ends
+        self.assertTrue(all([e.startswith(b': keepalive') for e in events]))
+        self.assertEqual(live.get_broker().subscriptions, {})
+
+    def test_pages_follow_only_when_turned_on(self):
+        week_url = reverse('week', kwargs={'week_id': self.DEFAULT_TEST_WEEK_ID})
+        score_sheet_url = reverse('score_sheet', kwargs={'score_sheet_id': self.score_sheet.id})
+        live_urls = [
+            reverse('week_live', kwargs={'week_id': self.DEFAULT_TEST_WEEK_ID}),
+            reverse('score_sheet_live', kwargs={'score_sheet_id': self.score_sheet.id}),
+        ]
+        for url, live_url in zip([week_url, score_sheet_url], live_urls):
+            self.assertNotIn(live_url, self.client.get(url).content.decode())
+        self.client.get(reverse('feature_set', kwargs={'feature': 'live_updates', 'setting': 1}))
+        for url, live_url in zip([week_url, score_sheet_url], live_urls):
+            self.assertIn(live_url, self.client.get(url).content.decode())
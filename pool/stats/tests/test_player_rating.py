@@ -0,0 +1,270 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from trueskill import Rating, rate_1vs1
+
+from ..models import Match, PlayerRating, PlayerSeasonSummary, ScoreSheet
+from ..models.player_rating import PlayerRatingBookmark, get_current_ratings, get_unrated_games, rate_games, \
+    rebuild_ratings
+from ..utils import expire_caches
+from ..views.matchup import get_match_ups, win_probability
+from .base_cases import BasePoolStatsTestCase
+from .test_unit import populate_lineup_entries
+
+
+class PlayerRatingTests(BasePoolStatsTestCase):
+
+    def setUp(self):
+        super(PlayerRatingTests, self).setUp()
+        # the bookmark is cached, make sure it isn't left over from another test
+        cache.clear()
+        response = self.client.post(reverse('score_sheet_create'), data={'match_id': self.DEFAULT_TEST_MATCH_ID})
+        self.score_sheet = ScoreSheet.objects.get(id=int(response.url.split('/')[-2]))
+        populate_lineup_entries(self.score_sheet)
+        self.score_sheet.set_games()
+        for game in self.score_sheet.games.all():
+            game.winner = 'away' if game.order.order % 3 else 'home'
+            game.save()
+        self.score_sheet.official = 1
+        self.score_sheet.save()
+        PlayerRatingBookmark(game=self.score_sheet.games.order_by('id').first()).save()
+
+    @staticmethod
+    def expected_ratings(games):
+        ratings = {}
+        for game in games:
+            away = ratings.get(game.away_player_id, Rating())
+            home = ratings.get(game.home_player_id, Rating())
+            if game.winner == 'away':
+                away, home = rate_1vs1(away, home)
+            else:
+                home, away = rate_1vs1(home, away)
+            ratings[game.away_player_id] = away
+            ratings[game.home_player_id] = home
+        return ratings
+
+    def test_rate_games_in_chunks(self):
+
+        games = list(get_unrated_games())
+        expected = self.expected_ratings(games)
+
+        progress = []
+        self.assertEqual(rate_games(chunk_size=3, progress=progress.append), len(games))
+        # reported after each chunk
+        self.assertEqual(progress, list(range(3, len(games), 3)) + [len(games)])
+        self.assertEqual(PlayerRating.objects.count(), 2 * len(games))
+        self.assertEqual(PlayerRatingBookmark.load().game.id, games[-1].id)
+
+        current = get_current_ratings(expected.keys())
+        for player_id, rating in expected.items():
+            self.assertAlmostEqual(current[player_id].mu, rating.mu)
+            self.assertAlmostEqual(current[player_id].sigma, rating.sigma)
+
+        # nothing left to rate
+        self.assertEqual(rate_games(), 0)
+
+    def ratings_snapshot(self):
+        return [
+            (game_id, player_id, round(mu, 6)) for (game_id, player_id, mu) in
+            PlayerRating.objects.order_by('game_id', 'player_id').values_list('game_id', 'player_id', 'mu')
+        ]
+
+    def test_rebuild_ratings(self):
+
+        rate_games()
+        for _ in rebuild_ratings(chunk_size=4):
+            pass
+
+        # with no bookmark to start from, the first game is rated too
+        games = list(self.score_sheet.games.order_by('id'))
+        self.assertEqual(PlayerRatingBookmark.load().game_id, games[-1].id)
+        self.assertEqual(PlayerRating.objects.count(), 2 * len(games))
+        current = get_current_ratings([g.away_player_id for g in games] + [g.home_player_id for g in games])
+        for player_id, rating in self.expected_ratings(games).items():
+            self.assertAlmostEqual(current[player_id].mu, rating.mu)
+
+    def test_rebuild_ratings_since_game(self):
+
+        rate_games()
+        expected = self.ratings_snapshot()
+        since_game_id = expected[len(expected) // 2][0]
+
+        PlayerRating.objects.filter(game_id__gte=since_game_id).update(mu=0)
+        for _ in rebuild_ratings(since_game_id=since_game_id, chunk_size=4):
+            pass
+        self.assertEqual(self.ratings_snapshot(), expected)
+
+    def test_rate_command_rebuild(self):
+
+        rate_games()
+        expected = self.ratings_snapshot()
+        since_game_id = expected[-4][0]
+
+        out = StringIO()
+        call_command('rate', rebuild=True, since_game=since_game_id, chunk_size=1, stdout=out)
+        self.assertIn('rated 2 of 2 games', out.getvalue())
+        self.assertEqual(self.ratings_snapshot(), expected)
+
+    def test_corrected_game_replayed(self):
+
+        rate_games()
+        corrected_game = self.score_sheet.games.order_by('id')[5]
+        corrected_game.winner = 'home' if corrected_game.winner == 'away' else 'away'
+        corrected_game.save()
+        self.assertEqual(PlayerRatingBookmark.load().dirty_from_game, corrected_game.id)
+
+        # a later correction doesn't raise the watermark, and a table run doesn't change ratings
+        later_game = self.score_sheet.games.order_by('id')[8]
+        later_game.winner = 'home' if later_game.winner == 'away' else 'away'
+        later_game.save()
+        corrected_game.table_run = True
+        corrected_game.save()
+        self.assertEqual(PlayerRatingBookmark.load().dirty_from_game, corrected_game.id)
+
+        stale = self.ratings_snapshot()
+        replayed_count = len([g for g in stale if g[0] >= corrected_game.id]) // 2
+        self.assertEqual(rate_games(), replayed_count)
+        self.assertIsNone(PlayerRatingBookmark.load().dirty_from_game)
+        replayed = self.ratings_snapshot()
+
+        # ratings before the corrected game are untouched, and the replay matches a full re-rating
+        self.assertEqual(
+            [r for r in replayed if r[0] < corrected_game.id], [r for r in stale if r[0] < corrected_game.id]
+        )
+        self.assertNotEqual(replayed, stale)
+        current = get_current_ratings([r[1] for r in replayed])
+        for player_id, rating in self.expected_ratings(list(self.score_sheet.games.order_by('id'))[1:]).items():
+            self.assertAlmostEqual(current[player_id].mu, rating.mu)
+
+    def test_rate_command_replays_corrections(self):
+
+        rate_games()
+        corrected_game = self.score_sheet.games.order_by('id')[5]
+        corrected_game.winner = 'home' if corrected_game.winner == 'away' else 'away'
+        corrected_game.save()
+        stale = self.ratings_snapshot()
+        replayed_count = len([g for g in stale if g[0] >= corrected_game.id]) // 2
+
+        out = StringIO()
+        call_command('rate', stdout=out)
+        self.assertIn('rated {} games'.format(replayed_count), out.getvalue())
+        self.assertIsNone(PlayerRatingBookmark.load().dirty_from_game)
+        current = get_current_ratings([r[1] for r in stale])
+        for player_id, rating in self.expected_ratings(list(self.score_sheet.games.order_by('id'))[1:]).items():
+            self.assertAlmostEqual(current[player_id].mu, rating.mu)
+
+    def test_unofficial_score_sheet_ratings_removed(self):
+
+        rate_games()
+        self.score_sheet.official = 2
+        self.score_sheet.save()
+        self.assertEqual(PlayerRatingBookmark.load().dirty_from_game, self.score_sheet.games.order_by('id')[0].id)
+        rate_games()
+        self.assertEqual(PlayerRating.objects.count(), 0)
+
+    def test_summaries_have_current_ratings(self):
+
+        rate_games(chunk_size=5)
+        summaries = PlayerSeasonSummary.objects.filter(season_id=self.default_season)
+        current = get_current_ratings([s.player_id for s in summaries])
+        self.assertEqual(len(current), len(summaries))
+        for summary in summaries:
+            self.assertAlmostEqual(summary.current_mu, current[summary.player_id].mu)
+            self.assertAlmostEqual(summary.current_sigma, current[summary.player_id].sigma)
+
+        # ratings that are removed are removed from the summaries too
+        self.score_sheet.official = 2
+        self.score_sheet.save()
+        rate_games()
+        self.assertFalse(PlayerSeasonSummary.objects.filter(current_mu__isnull=False).exists())
+
+    def test_players_table_queries(self):
+
+        rate_games()
+        cache.clear()
+        # a stale table would be served from the page cache, and rendered in the background
+        expire_caches()
+        # the summaries come with their players, seasons, teams and ratings in two queries;
+        # the rest is the season and the menu, none of it per player
+        with self.assertNumQueries(5):
+            self.client.get(reverse('players', kwargs={'season_id': self.default_season}))
+
+    def test_rating_table_queries(self):
+
+        rate_games()
+        player_ratings = PlayerRating.objects.order_by().values('player_id').annotate(count=Count('id'))
+        fewest, most = min(player_ratings, key=lambda r: r['count']), max(player_ratings, key=lambda r: r['count'])
+        self.assertLess(fewest['count'], most['count'])
+        counts = []
+        for player_ratings in [fewest, most]:
+            cache.clear()
+            expire_caches()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('rating', kwargs={'player_id': player_ratings['player_id']}))
+            counts.append(len(queries))
+            opponent_game = PlayerRating.objects.filter(player_id=player_ratings['player_id']).first().game
+            opponent_id = opponent_game.home_player_id if \
+                opponent_game.away_player_id == player_ratings['player_id'] else opponent_game.away_player_id
+            opponent_mu = PlayerSeasonSummary.objects.filter(player_id=opponent_id).first().current_mu
+            self.assertContains(response, '({:.0f})'.format(opponent_mu))
+        # none of them per rating
+        self.assertEqual(counts[0], counts[1])
+
+    def test_matchup_probabilities(self):
+
+        rate_games()
+        match = Match.objects.get(id=self.DEFAULT_TEST_MATCH_ID)
+        with self.assertNumQueries(3):
+            # the match, and each side's summaries
+            match_ups, expected_wins = get_match_ups('match', match.id)
+        # only the players who have been rated are matched up
+        rated = PlayerSeasonSummary.objects.filter(current_mu__isnull=False)
+        self.assertEqual(
+            len(match_ups),
+            rated.filter(player__team=match.away_team).count() * rated.filter(player__team=match.home_team).count()
+        )
+        for match_up in match_ups:
+            away, home = match_up['away'], match_up['home']
+            self.assertAlmostEqual(match_up['pct'], 100 * win_probability(
+                Rating(mu=away.current_mu, sigma=away.current_sigma),
+                Rating(mu=home.current_mu, sigma=home.current_sigma),
+            ))
+        self.assertAlmostEqual(expected_wins['away'] + expected_wins['home'], len(match_ups))
+
+        # the match ups are cached until more games are rated
+        with self.assertNumQueries(0):
+            self.assertEqual(len(get_match_ups('match', match.id)[0]), len(match_ups))
+
+        match_ups, _ = get_match_ups('scoresheet', self.score_sheet.id)
+        self.assertEqual(len(match_ups), self.score_sheet.games.filter(
+            away_player__isnull=False, home_player__isnull=False
+        ).count())
+
+    def test_matchups_follow_lineups(self):
+
+        rate_games()
+
+        def pairs(match_ups):
+            return sorted([(m['away'].player_id, m['home'].player_id) for m in match_ups])
+
+        def game_pairs():
+            return sorted(self.score_sheet.games.filter(
+                away_player__isnull=False, home_player__isnull=False
+            ).values_list('away_player_id', 'home_player_id'))
+
+        match_ups, _ = get_match_ups('scoresheet', self.score_sheet.id)
+        self.assertEqual(pairs(match_ups), game_pairs())
+        # swapping two players in the lineup changes who plays whom
+        first, second = self.score_sheet.away_lineup.filter(player__isnull=False).order_by('id')[:2]
+        first.player_id, second.player_id = second.player_id, first.player_id
+        first.save()
+        second.save()
+        self.score_sheet.set_games()
+        match_ups, _ = get_match_ups('scoresheet', self.score_sheet.id)
+        self.assertEqual(pairs(match_ups), game_pairs())
@@ -0,0 +1,117 @@
+import re
+
+from django.core.cache import cache
+from django.urls import URLPattern, reverse
+
+from .. import urls
+from ..models import ScoreSheet, Tournament
+from ..models.player_rating import rate_games
+from ..utils import expire_caches
+from .base_cases import BasePoolStatsTestCase
+from .test_unit import populate_lineup_entries
+
+
+class QueryBudgetTestCase(BasePoolStatsTestCase):
+    """
+    assertQueryBudget() fetches a page and checks how many queries it took, as counted by the
+    QueryBudget middleware.
+    """
+
+    def assertQueryBudget(self, url, budget, data=None):
+        response = self.client.get(url, data)
+        self.assertLess(response.status_code, 400, url)
+        stats = response.query_stats
+        self.assertLessEqual(
+            stats['queries'], budget,
+            '{} ({}) ran {} queries, over its budget of {}; the slowest was: {}'.format(
+                url, stats['view'], stats['queries'], budget, stats['slowest_sql']
+            )
+        )
+        return response
+
+
+class QueryBudgetTests(QueryBudgetTestCase):
+
+    # GET views in stats/urls.py, by URL name: (budget, kwargs, query string); every named URL has to have a
+    # budget here, or be listed in NOT_BUDGETED.
+    BUDGETS = {
+        'index': (0, {}, None),
+        'feature': (3, {}, None),
+        'feature_set': (0, {'feature': 'rating', 'setting': 'on'}, None),
+        'divisions': (7, {'season_id': BasePoolStatsTestCase.default_season}, None),
+        'team': (13, {'team_id': BasePoolStatsTestCase.DEFAULT_TEST_AWAY_TEAM_ID}, None),
+        'register': (3, {}, None),
+        'teams': (6, {'season_id': BasePoolStatsTestCase.default_season}, None),
+        'week': (11, {'week_id': BasePoolStatsTestCase.DEFAULT_TEST_WEEK_ID}, None),
+        'week_live': (0, {'week_id': BasePoolStatsTestCase.DEFAULT_TEST_WEEK_ID}, None),
+        'weeks': (5, {}, None),
+        'nextweek': (2, {'today_date': '2010-08-03'}, None),
+        'matchup': (15, {}, {'kind': 'match', 'thing': BasePoolStatsTestCase.DEFAULT_TEST_MATCH_ID}),
+        'players': (6, {'season_id': BasePoolStatsTestCase.default_season}, None),
+        'player': (7, {'player_id': 1, 'season_id': BasePoolStatsTestCase.default_season}, None),
+        'player_create': (4, {}, None),
+        'rating': (5, {'player_id': 1}, None),
+        'sponsors': (4, {}, None),
+        'sponsor': (4, {'sponsor_id': 4}, None),
+        'score_sheet': (15, {'score_sheet_id': None}, None),
+        'score_sheet_summary': (7, {'score_sheet_id': None}, None),
+        'score_sheet_live': (0, {'score_sheet_id': None}, None),
+        'score_sheet_lineup': (5, {'score_sheet_id': None, 'away_home': 'away'}, None),
+        'score_sheet_substitutions': (10, {'score_sheet_id': None, 'away_home': 'away'}, None),
+        'seasons': (3, {}, None),
+        'set_season': (0, {'season_id': BasePoolStatsTestCase.default_season}, None),
+        'tournaments': (4, {'season_id': BasePoolStatsTestCase.default_season}, None),
+        'tournament': (6, {'tournament_id': None}, None),
+        'tournament_json': (3, {'tournament_id': None}, None),
+        'tournament_edit': (4, {'tournament_id': None}, None),
+        'tournament_participants': (19, {'tournament_id': None}, None),
+        'tournament_controls': (0, {'tournament_id': None}, None),
+    }
+
+    # these change things, and are POST only, or redirect after changing things
+    NOT_BUDGETED = [
+        'game_update', 'game_update_batch', 'score_sheet_create', 'score_sheet_copy', 'score_sheet_comment',
+        'tournament_brackets', 'tournament_mark_winner',
+    ]
+
+    def setUp(self):
+        super(QueryBudgetTests, self).setUp()
+        cache.clear()
+        response = self.client.post(reverse('score_sheet_create'), data={'match_id': self.DEFAULT_TEST_MATCH_ID})
+        self.score_sheet = ScoreSheet.objects.get(id=int(response.url.split('/')[-2]))
+        populate_lineup_entries(self.score_sheet)
+        self.score_sheet.set_games()
+        for game in self.score_sheet.games.all():
+            game.winner = 'away' if game.order.order % 3 else 'home'
+            game.save()
+        self.score_sheet.official = 1
+        self.score_sheet.save()
+        rate_games()
+
+        response = self.client.post(reverse('tournament_edit'), data={
+            'name': 'query budget tournament',
+            'type': 'singles',
+            'elimination': 'single',
+            'show_places': 1,
+        })
+        self.tournament = Tournament.objects.get(id=int(re.findall(r'\d+', response.url)[-1]))
+
+    def tearDown(self):
+        cache.clear()
+        super(QueryBudgetTests, self).tearDown()
+
+    def test_every_view_has_a_budget(self):
+        url_names = set([p.name for p in urls.urlpatterns if isinstance(p, URLPattern) and p.name])
+        self.assertEqual(url_names - set(self.BUDGETS.keys()) - set(self.NOT_BUDGETED), set())
+
+    def test_query_budgets(self):
+        for url_name, (budget, kwargs, data) in self.BUDGETS.items():
+            kwargs = dict(kwargs)
+            object_ids = [('score_sheet_id', self.score_sheet.id), ('tournament_id', self.tournament.id)]
+            for object_key, object_id in object_ids:
+                if object_key in kwargs:
+                    kwargs[object_key] = object_id
+            with self.subTest(url_name=url_name):
+                # the pages are cached; count the queries to build them
+                expire_caches()
+                self.assertQueryBudget(reverse(url_name, kwargs=kwargs), budget, data)
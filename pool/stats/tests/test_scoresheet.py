@@ -1,7 +1,13 @@
 import json
+from unittest import mock
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from ..models import AwayLineupEntry, LineupEntry, ScoreSheet
+from ..models.scoresheet import bulk_create_with_ids
+
 from .base_cases import BasePoolStatsTestCase
 
 
@@ -45,3 +51,62 @@ class ScoreSheetTests(BasePoolStatsTestCase):
         # and the last game position should br 'TB'
         self.assertEqual(score_sheet_summary['games'][-1]['order']['away_position'], 'TB')
         self.assertEqual(score_sheet_summary['games'][-1]['order']['home_position'], 'TB')
+
+    def test_summary_not_modified(self):
+
+        score_sheet_id = self.score_sheet_create()
+        url = reverse('score_sheet_summary', kwargs={'score_sheet_id': score_sheet_id})
+        etag = self.client.get(url)['ETag']
+
+        # reading the summary doesn't write anything
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual([q['sql'] for q in queries if not q['sql'].startswith('SELECT')], [])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # saving a game changes the summary
+        game = ScoreSheet.objects.get(id=score_sheet_id).games.first()
+        self.client.post(reverse('game_update'), data={
+            'game_id': game.id, 'winner': 'away', 'forfeit': 'false', 'table_run': 'true'
+        })
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['games'][0]['winner'], 'away')
+
+        # as does someone else looking at it, who can't edit it
+        self.assertEqual(self.client_class().get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class BulkCreateWithIdsTests(BasePoolStatsTestCase):
+
+    def create(self, count):
+        entries = [AwayLineupEntry(position_id=1 + i % 4) for i in range(count)]
+        with CaptureQueriesContext(connection) as queries:
+            bulk_create_with_ids(AwayLineupEntry, entries)
+        self.assertEqual(
+            [(e.id, e.position_id) for e in entries],
+            list(AwayLineupEntry.objects.filter(id__in=[e.id for e in entries]).order_by('id').values_list(
+                'id', 'position_id'
+            ))
+        )
+        return len(queries)
+
+    def test_without_returned_ids(self):
+        # as on MySQL; the queries don't depend on how many rows there are
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            self.assertEqual(self.create(2), self.create(8))
+
+    def test_interleaved_insert(self):
+        bulk_create = AwayLineupEntry.objects.bulk_create
+
+        def bulk_create_and_another(objects):
+            # another connection's insert, read back with this one's
+            LineupEntry.objects.create(position_id=1)
+            return bulk_create(objects)
+
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False), \
+                mock.patch.object(AwayLineupEntry.objects, 'bulk_create', bulk_create_and_another):
+            self.create(3)
@@ -0,0 +1,152 @@
+from django.urls import reverse
+
+from ..models import GameOrder, PlayerSeasonSummary, ScoreSheet, Team
+from ..models.season_stats import recompute_season
+from .base_cases import BasePoolStatsTestCase
+from .test_unit import populate_lineup_entries
+
+
+class SeasonStatsRecomputeTests(BasePoolStatsTestCase):
+
+    def setUp(self):
+        super(SeasonStatsRecomputeTests, self).setUp()
+        response = self.client.post(reverse('score_sheet_create'), data={'match_id': self.DEFAULT_TEST_MATCH_ID})
+        self.score_sheet = ScoreSheet.objects.get(id=int(response.url.split('/')[-2]))
+        populate_lineup_entries(self.score_sheet)
+        self.score_sheet.set_games()
+        for game in self.score_sheet.games.all():
+            # the first away player sweeps, there is a forfeit and a table run
+            game.winner = 'away' if game.order.away_position_id == 1 or game.order.order % 3 else 'home'
+            game.forfeit = game.order.away_position_id == 2 and game.order.home_position_id == 2
+            game.table_run = game.order.order == 5
+            game.save()
+
+    def make_official(self):
+        self.score_sheet.official = 1
+        self.score_sheet.save()
+
+    @staticmethod
+    def snapshot():
+        teams = {
+            t.id: (t.wins, t.losses, t.win_percentage, t.ranking, t.division_ranking)
+            for t in Team.objects.filter(season_id=BasePoolStatsTestCase.default_season)
+        }
+        players = {
+            s.player_id: (s.wins, s.losses, s.win_percentage, s.table_runs, s.four_ohs, s.ranking)
+            for s in PlayerSeasonSummary.objects.filter(season_id=BasePoolStatsTestCase.default_season)
+        }
+        return teams, players
+
+    def test_recompute_matches_per_object_updates(self):
+
+        self.make_official()
+        Team.update_rankings(season_id=self.default_season)
+        PlayerSeasonSummary.update_all(season_id=self.default_season, minimum_games=2)
+        expected = self.snapshot()
+
+        Team.objects.filter(season_id=self.default_season).update(wins=0, losses=0, win_percentage=0.0)
+        PlayerSeasonSummary.objects.all().delete()
+
+        report = recompute_season(self.default_season, minimum_games=2, rate=False)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(
+            [p['name'] for p in report['phases']],
+            ['teams', 'players', 'player rankings', 'team rankings']
+        )
+        self.assertEqual(report['queries'], sum([p['queries'] for p in report['phases']]))
+
+    def test_recompute_sweeps(self):
+
+        self.make_official()
+        recompute_season(self.default_season, minimum_games=2, rate=False)
+        sweeper = self.score_sheet.away_lineup.get(position_id=1).player
+        summary = PlayerSeasonSummary.objects.get(season_id=self.default_season, player=sweeper)
+        self.assertEqual(summary.wins, len(GameOrder.objects.filter(away_position_id=1)))
+        self.assertEqual(summary.four_ohs, 1)
+
+
+class IncrementalStatsTests(SeasonStatsRecomputeTests):
+
+    def test_official_score_sheet_applied(self):
+
+        self.make_official()
+        incremental_teams, incremental_players = self.snapshot()
+        recompute_season(self.default_season, rate=False)
+        teams, players = self.snapshot()
+        self.assertEqual(teams, incremental_teams)
+        # the full recompute adds summaries for the players on the teams' rosters that did not play
+        self.assertEqual({p: players[p] for p in incremental_players}, incremental_players)
+
+    def test_unofficial_score_sheet_reversed(self):
+
+        self.make_official()
+        self.score_sheet.official = 2
+        self.score_sheet.save()
+        teams, players = self.snapshot()
+        for team_id in [self.DEFAULT_TEST_AWAY_TEAM_ID, self.DEFAULT_TEST_HOME_TEAM_ID]:
+            self.assertEqual(teams[team_id][:3], (0, 0, 0.0))
+        for player_stats in players.values():
+            self.assertEqual(player_stats[:5], (0, 0, None, 0, 0))
+
+    def test_official_score_sheet_saved_again(self):
+
+        self.make_official()
+        incremental = self.snapshot()
+        self.score_sheet.comment = 'no change to the stats'
+        self.score_sheet.save()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_game_edited_while_official(self):
+
+        self.make_official()
+        game = self.score_sheet.games.filter(winner='home', forfeit=False).first()
+        game.winner = 'away'
+        game.table_run = True
+        game.save()
+        incremental_teams, incremental_players = self.snapshot()
+        recompute_season(self.default_season, rate=False)
+        teams, players = self.snapshot()
+        self.assertEqual(teams, incremental_teams)
+        self.assertEqual({p: players[p] for p in incremental_players}, incremental_players)
+
+    def test_game_edited_then_unofficial(self):
+
+        self.make_official()
+        game = self.score_sheet.games.filter(winner='home', forfeit=False).first()
+        self.score_sheet.update_games([{'game_id': game.id, 'winner': 'away', 'forfeit': False, 'table_run': True}])
+        self.score_sheet.official = 0
+        self.score_sheet.save()
+        teams, players = self.snapshot()
+        for team_id in [self.DEFAULT_TEST_AWAY_TEAM_ID, self.DEFAULT_TEST_HOME_TEAM_ID]:
+            self.assertEqual(teams[team_id][:3], (0, 0, 0.0))
+        for player_stats in players.values():
+            self.assertEqual(player_stats[:5], (0, 0, None, 0, 0))
+
+    def test_created_official(self):
+
+        created = ScoreSheet(match_id=self.DEFAULT_TEST_MATCH_ID, official=1)
+        created.save()
+        # as the admin does, the games are added after the score sheet is saved
+        for game in self.score_sheet.games.order_by('id'):
+            game.pk = None
+            game.score_sheet = created
+            game.save()
+        incremental_teams, incremental_players = self.snapshot()
+        self.assertNotEqual(incremental_teams[self.DEFAULT_TEST_AWAY_TEAM_ID][:2], (0, 0))
+        recompute_season(self.default_season, rate=False)
+        teams, players = self.snapshot()
+        self.assertEqual(teams, incremental_teams)
+        self.assertEqual({p: players[p] for p in incremental_players}, incremental_players)
+
+    def test_official_before_applied_stats(self):
+
+        self.make_official()
+        # as for a score sheet made official before its applied stats were stored
+        ScoreSheet.objects.filter(id=self.score_sheet.id).update(applied_stats=None)
+        self.score_sheet.official = 2
+        self.score_sheet.save()
+        teams, players = self.snapshot()
+        for team_id in [self.DEFAULT_TEST_AWAY_TEAM_ID, self.DEFAULT_TEST_HOME_TEAM_ID]:
+            self.assertEqual(teams[team_id][:3], (0, 0, 0.0))
+        for player_stats in players.values():
+            self.assertEqual(player_stats[:5], (0, 0, None, 0, 0))
@@ -1,8 +1,10 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from .base_cases import BasePoolStatsTestCase
 from .test_unit import populate_lineup_entries
-from ..models import Team, ScoreSheet
+from ..models import Team, ScoreSheet, Tie, TieBreakerResult
 
 
 class TieBreakerTestCase(BasePoolStatsTestCase):
@@ -46,6 +48,30 @@ class TieBreakerTestCase(BasePoolStatsTestCase):
         self.assertEqual(Team.objects.get(id=score_sheet.match.home_team.id).ranking, 1)
         self.assertEqual(Team.objects.get(id=score_sheet.match.away_team.id).ranking, 2)
 
+    def test_head_to_head(self):
+        score_sheet = ScoreSheet.objects.get(id=self.create_score_sheet(self.DEFAULT_TEST_MATCH_ID))
+        populate_lineup_entries(score_sheet)
+        score_sheet.set_games()
+        # 9 - 7 for the home team
+        for inc, game in enumerate(score_sheet.games.all()):
+            game.winner = 'home' if inc < 9 else 'away'
+            game.save()
+        score_sheet.official = 1
+        score_sheet.save()
+
+        away_team_id, home_team_id = score_sheet.match.away_team_id, score_sheet.match.home_team_id
+        with self.assertNumQueries(1):
+            head_to_head = Team.head_to_head(self.default_season)
+        self.assertEqual(head_to_head, {(home_team_id, away_team_id): 2, (away_team_id, home_team_id): -2})
+
+        # the same as counting the wins on the score sheets
+        teams = Team.objects.filter(id__in=[away_team_id, home_team_id])
+        for team in teams:
+            self.assertEqual(
+                team.net_game_wins_from(head_to_head, teams),
+                team.net_game_wins_against(None, score_sheets=team.find_score_sheets_against(teams)),
+            )
+
     def test_forfeit_wins_tie_break(self):
         score_sheet_id = self.create_score_sheet(self.DEFAULT_TEST_MATCH_ID)
         score_sheet = ScoreSheet.objects.get(id=score_sheet_id)
@@ -64,9 +90,33 @@ class TieBreakerTestCase(BasePoolStatsTestCase):
             inc += 1
         score_sheet.official = 1
         score_sheet.save()
+        score_sheet.refresh_from_db()
         self.assertEqual(score_sheet.forfeit_wins('away'), 0)
         self.assertEqual(score_sheet.forfeit_wins('home'), 1)
 
         Team.update_rankings(season_id=self.default_season)
         self.assertEqual(Team.objects.get(id=score_sheet.match.home_team.id).ranking, 2)
         self.assertEqual(Team.objects.get(id=score_sheet.match.away_team.id).ranking, 1)
+
+    def test_rank_season_in_memory(self):
+        # every team in the season is tied on win percentage, and rank_tie_breaker decides
+        teams = list(Team.objects.filter(season_id=self.default_season).exclude(division_id=None))
+        for inc, team in enumerate(teams):
+            team.win_percentage = 0.5
+            team.rank_tie_breaker = len(teams) - inc
+            team.save()
+
+        with CaptureQueriesContext(connection) as context:
+            Team.rank_season(self.default_season)
+        team_updates = [q for q in context.captured_queries if q['sql'].startswith('UPDATE "stats_team"')]
+        self.assertEqual(len(team_updates), 1)
+
+        rankings = dict(Team.objects.filter(id__in=[t.id for t in teams]).values_list('id', 'ranking'))
+        self.assertEqual(rankings, {team.id: len(teams) - inc for inc, team in enumerate(teams)})
+        # the ties are kept, for the record, for the season and each division
+        self.assertEqual(
+            Tie.objects.filter(season_id=self.default_season, attribute='win_percentage').count(),
+            len(set([t.division_id for t in teams])) + 1
+        )
+        self.assertTrue(TieBreakerResult.objects.filter(attribute='rank_tie_breaker', divisional=True).exists())
+        self.assertTrue(TieBreakerResult.objects.filter(attribute='rank_tie_breaker', divisional=False).exists())
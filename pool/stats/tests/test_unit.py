@@ -6,7 +6,9 @@ from django.test import Client
 from django.test import RequestFactory
 from django.contrib.sessions.middleware import SessionMiddleware
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.db.utils import IntegrityError
+from django.test.utils import CaptureQueriesContext
 
 from ..models import Division
 from ..models import Season, PlayerSeasonSummary, ScoreSheet, Game, Match, Table, Team, Week
@@ -173,9 +175,9 @@ class ScoreSheetTests(BasePoolStatsTestCase):
         self.assertEqual(score_sheet.match.away_team.wins, away_wins)
         self.assertEqual(score_sheet.match.home_team.wins, home_wins)
 
-        # there should be zero summaries now
+        # making the score sheet official creates summaries for the players in it
         summaries = PlayerSeasonSummary.objects.all()
-        self.assertEqual(0, len(summaries))
+        self.assertEqual(8, len(summaries))
 
         season_args = {
             'season_id': Season.objects.get(is_default=True).id,
@@ -218,8 +220,107 @@ class ScoreSheetTests(BasePoolStatsTestCase):
             game.winner = 'home' if game.order.order % 2 else 'away'
             game.save()
 
-        self.assertEqual(ss.away_wins(), 7)
-        self.assertEqual(ss.home_wins(), 8)
+        ss.refresh_from_db()
+        self.assertEqual(ss.away_wins, 7)
+        self.assertEqual(ss.home_wins, 8)
+
+    def test_win_totals_follow_games(self):
+        ss = ScoreSheet(match_id=self.sample_match_id)
+        ss.save()
+        ss.initialize_lineup()
+        ss.initialize_games()
+        games = list(ss.games.all())
+        games[0].winner = 'away'
+        games[0].forfeit = True
+        games[0].save()
+        games[1].winner = 'home'
+        games[1].save()
+        # an instance loaded before the games were saved doesn't write over the totals
+        ss.comment = 'a comment'
+        ss.save()
+        ss.refresh_from_db()
+        self.assertEqual([ss.away_wins, ss.home_wins, ss.away_forfeit_wins, ss.home_forfeit_wins], [1, 1, 1, 0])
+
+        games[0].winner = 'home'
+        games[0].save()
+        ss.refresh_from_db()
+        self.assertEqual([ss.away_wins, ss.home_wins, ss.away_forfeit_wins, ss.home_forfeit_wins], [0, 2, 0, 1])
+
+        copied = ScoreSheet.objects.get(id=ss.copy(session_id=None))
+        self.assertEqual([copied.away_wins, copied.home_wins, copied.home_forfeit_wins], [0, 2, 1])
+
+        # the backfill recounts what a queryset update skipped
+        ss.games.update(winner='away', forfeit=False)
+        self.assertEqual(ScoreSheet.update_wins_for(ScoreSheet.objects.filter(id=ss.id)), 1)
+        ss.refresh_from_db()
+        self.assertEqual([ss.away_wins, ss.home_wins, ss.home_forfeit_wins], [len(games), 0, 0])
+
+    def test_create_and_copy_queries(self):
+        ss = ScoreSheet(match_id=self.sample_match_id)
+        ss.save()
+        with CaptureQueriesContext(connection) as queries:
+            ss.initialize_lineup()
+            ss.initialize_games()
+        # a fixed handful, however many positions and games there are
+        self.assertLessEqual(len(queries), 10)
+        self.assertEqual(ss.games.count(), self.game_count)
+        self.assertEqual(ss.away_lineup.count(), len(PlayPosition.objects.filter(tiebreaker=False)))
+
+        populate_lineup_entries(ss)
+        substitution = HomeSubstitution(game_order=GameOrder.objects.get(order=11), player_id=1)
+        substitution.save()
+        ss.home_substitutions.add(substitution)
+        ss.set_games()
+        game = ss.games.order_by('id').first()
+        game.winner = 'home'
+        game.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            copied = ScoreSheet.objects.get(id=ss.copy(session_id='copier'))
+        # a read, an insert and a through table insert for each lineup and substitution list, and the games
+        self.assertLessEqual(len(queries), 16)
+        self.assertEqual(copied.creator_session, 'copier')
+        self.assertEqual(copied.home_wins, 1)
+        for ah in ['away', 'home']:
+            self.assertEqual(
+                [(e.player_id, e.position_id) for e in getattr(copied, '{}_lineup'.format(ah)).order_by('id')],
+                [(e.player_id, e.position_id) for e in getattr(ss, '{}_lineup'.format(ah)).order_by('id')],
+            )
+        self.assertEqual(
+            list(copied.home_substitutions.values_list('game_order_id', 'player_id')),
+            [(substitution.game_order_id, 1)],
+        )
+        self.assertEqual(
+            list(copied.games.order_by('id').values_list('order_id', 'away_player_id', 'home_player_id', 'winner')),
+            list(ss.games.order_by('id').values_list('order_id', 'away_player_id', 'home_player_id', 'winner')),
+        )
+
+    def test_set_games_substitutions(self):
+        ss = ScoreSheet(match_id=self.sample_match_id)
+        ss.save()
+        ss.initialize_lineup()
+        ss.initialize_games()
+        populate_lineup_entries(ss)
+        substitute = ss.match.away_team.players.all()[len(ss.away_lineup.all())]
+        # the play position is set from the game order
+        substitution = AwaySubstitution(game_order=GameOrder.objects.get(order=10), player=substitute)
+        substitution.save()
+        ss.away_substitutions.add(substitution)
+
+        with CaptureQueriesContext(connection) as queries:
+            ss.set_games()
+        # the lineups, substitutions and games are each read once, however many games there are
+        self.assertLessEqual(len(queries), 10)
+
+        substitution.refresh_from_db()
+        self.assertEqual(substitution.play_position_id, substitution.game_order.away_position_id)
+        for game in ss.games.select_related('order'):
+            if game.order.away_position_id == substitution.play_position_id:
+                if game.order_id >= substitution.game_order_id:
+                    self.assertEqual(game.away_player_id, substitute.id)
+                else:
+                    self.assertNotEqual(game.away_player_id, substitute.id)
+            self.assertIsNotNone(game.home_player_id)
 
     def test_player_win_totals(self):
         response = self.client.post(reverse('score_sheet_create'), data={'match_id': self.sample_match_id}, follow=True)
@@ -326,7 +427,8 @@ class ScoreSheetTests(BasePoolStatsTestCase):
                 player_win_counts[ah] += x['wins']
 
         self.assertEqual(player_win_counts['home'], game_count - forfeit_count)
-        self.assertEqual(ss.away_wins() + ss.home_wins(), game_count)
+        ss.refresh_from_db()
+        self.assertEqual(ss.away_wins + ss.home_wins, game_count)
 
     def test_score_sheet_copy_access(self):
         """
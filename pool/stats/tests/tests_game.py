@@ -1,26 +1,94 @@
-from ..models import Game
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Game, ScoreSheet
 from .base_cases import BasePoolStatsTestCase
 
 
 class GameSaveTestCases(BasePoolStatsTestCase):
 
+    def setUp(self):
+        super(GameSaveTestCases, self).setUp()
+        self.score_sheet = ScoreSheet(match_id=self.DEFAULT_TEST_MATCH_ID)
+        self.score_sheet.save()
 
     def test_save_no_winner(self):
-        g = Game()
+        g = Game(score_sheet=self.score_sheet)
         g.save()
         self.assertEqual(g.timestamp, None)
 
     def test_save_winner(self):
-        g = Game()
+        g = Game(score_sheet=self.score_sheet)
         g.winner = 'home'
         g.save()
         self.assertNotEqual(g.timestamp, None)
 
     def test_reset_winner(self):
 
-        g = Game()
+        g = Game(score_sheet=self.score_sheet)
         g.winner = 'home'
         g.save()
         g.winner = ''
         g.save()
-        self.assertEqual(g.timestamp, None)
\ No newline at end of file
+        self.assertEqual(g.timestamp, None)
+
+
+class GameBatchUpdateTestCases(BasePoolStatsTestCase):
+
+    def setUp(self):
+        super(GameBatchUpdateTestCases, self).setUp()
+        response = self.client.post(reverse('score_sheet_create'), data={'match_id': self.DEFAULT_TEST_MATCH_ID})
+        self.score_sheet = ScoreSheet.objects.get(id=int(response.url.split('/')[-2]))
+        self.games = list(self.score_sheet.games.order_by('id'))
+
+    def post(self, games, client=None):
+        return (client or self.client).post(
+            reverse('game_update_batch'),
+            data=json.dumps({'score_sheet_id': self.score_sheet.id, 'games': games}),
+            content_type='application/json',
+        )
+
+    def test_batch_update(self):
+        changes = [
+            {'game_id': g.id, 'winner': 'home' if i % 4 else 'away', 'forfeit': False, 'table_run': i == 1}
+            for i, g in enumerate(self.games)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(changes)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 11)
+
+        data = json.loads(response.content)['data']
+        self.assertEqual(data['wins']['away_wins'], 4)
+        self.assertEqual(data['wins']['home_wins'], len(self.games) - 4)
+        self.assertTrue(all([g['timestamp'] is not None for g in data['games']]))
+        self.score_sheet.refresh_from_db()
+        self.assertEqual(self.score_sheet.home_wins, len(self.games) - 4)
+        self.assertTrue(Game.objects.get(id=self.games[1].id).table_run)
+
+        # changing a winner keeps the first timestamp; clearing it clears the timestamp
+        timestamps = dict([(g['id'], g['timestamp']) for g in data['games']])
+        response = self.post([
+            {'game_id': self.games[0].id, 'winner': 'home'},
+            {'game_id': self.games[1].id, 'winner': ''},
+        ])
+        data = json.loads(response.content)['data']
+        self.assertEqual(data['games'][0]['timestamp'], timestamps[self.games[0].id])
+        self.assertIsNone(data['games'][1]['timestamp'])
+        self.assertEqual(data['wins']['away_wins'], 3)
+
+    def test_batch_update_rejected(self):
+        # another session can't edit the score sheet
+        response = self.post([{'game_id': self.games[0].id, 'winner': 'away'}], client=self.client_class())
+        self.assertEqual(response.status_code, 403)
+        # games from other score sheets, and unknown winners, are refused, and nothing is saved
+        other_game = Game.objects.exclude(score_sheet=self.score_sheet).values_list('id', flat=True).first()
+        for games in [
+            [{'game_id': self.games[0].id, 'winner': 'away'}, {'game_id': other_game or 0, 'winner': 'away'}],
+            [{'game_id': self.games[0].id, 'winner': 'nobody'}],
+        ]:
+            self.assertEqual(self.post(games).status_code, 400)
+        self.assertEqual(Game.objects.get(id=self.games[0].id).winner, '')
@@ -30,6 +30,7 @@ urlpatterns = [
     url(r'^divisions/', division.divisions, name='divisions'),
 
     url(r'^game_update/$', game.update, name='game_update'),
+    url(r'^game_update/batch/$', game.update_batch, name='game_update_batch'),
 
     # the 'after' parameter is really just to make it testable
     url(r'^team/(?P<team_id>[0-9]+)/(?P<after>[0-9-]+)?$', team.team, name='team'),
@@ -42,6 +43,7 @@ urlpatterns = [
     url(r'^teams/', views.team.teams, name='teams'),
 
     url(r'^week/(?P<week_id>[0-9]+)/$', week.week, name='week'),
+    url(r'^week/(?P<week_id>[0-9]+)/live/$', week.week_live, name='week_live'),
     url(r'^weeks/', week.weeks, name='weeks'),
     url(r'^nextweek/(?P<today_date>[0-9-]+)', week.get_current_week, name='nextweek'),
     url(r'^nextweek/', week.get_current_week, name='nextweek'),
@@ -70,6 +72,7 @@ urlpatterns = [
         score_sheet.score_sheet_substitutions, name='score_sheet_substitutions'),
     url(r'^score_sheet/(?P<score_sheet_id>[0-9]+)/$', score_sheet.score_sheet, name='score_sheet'),
     url(r'^score_sheet/summary/(?P<score_sheet_id>[0-9]+)/$', score_sheet.score_sheet_summary, name='score_sheet_summary'),
+    url(r'^score_sheet/live/(?P<score_sheet_id>[0-9]+)/$', score_sheet.score_sheet_live, name='score_sheet_live'),
     url(r'^score_sheet/comment/', score_sheet.comment, name='score_sheet_comment'),
 
     url(r'^seasons/', season.seasons, name='seasons'),
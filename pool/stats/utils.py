@@ -1,14 +1,10 @@
 import time
 
 from django.core.cache import cache
-from django.core.cache import caches
 from django.utils.cache import get_cache_key
 
-from .models import Season, PlayerSeasonSummary, Team
-from .models.player_rating import rate_games
-
-
-page_cache = caches['page']
+from .fragments import invalidate, page_cache, season_tag
+from .models.season_stats import recompute_season
 
 
 def session_uid(request):
@@ -42,15 +38,22 @@ def expire_page(request, path=None, query_string=None, method='GET'):
         cache.delete(key)
 
 
-def update_season_stats(season_id):
-    for team in Season.objects.get(id=season_id).team_set.all():
-        team.count_games()
-    rate_games()
-    PlayerSeasonSummary.update_all(season_id=season_id)
-    Team.update_rankings(season_id=season_id)
+def update_season_stats(season_id, progress=None):
+    """
+    Recompute the stats for a season, and invalidate the cached fragments that show them
+    :param progress: called as each phase of the recompute starts, see SeasonStatsRecompute
+    :return: a report of the time taken and queries run, see SeasonStatsRecompute.report()
+    """
+    report = recompute_season(season_id, progress=progress)
+    invalidate([season_tag(season_id)])
+    return report
 
 
 def expire_caches():
+    """
+    Clear the whole page cache; changes to the stats, and to teams and their rosters, invalidate just the
+    fragments they affect, see stats.fragments, so this is for anything else, like renaming a player.
+    """
     page_cache.clear()
 
 
@@ -1,35 +1,42 @@
 from django.shortcuts import render
+from django.template import loader
 
+from ..fragments import Fragment, season_tag, team_tag
 from ..models import Division, Team
-from ..utils import page_cache as cache
 from ..views.season import CheckSeason
 
 
-@CheckSeason()
-def divisions(request, season_id=None):
-
-    divisions_cache_key = '.'.join(['divisions', str(season_id)])
-
-    page = cache.get(divisions_cache_key)
-    if not page:
-        _divisions = Division.objects.filter(season=request.session['season_id']).order_by('name')
+def divisions_table(season_id, stale=True):
+    """
+    The season's divisions, each with its teams' standings, from the page cache, or rendered into it.
+    :param stale: whether a stale copy may be served, see Fragment.get_or_render
+    """
+    def render_divisions_table():
+        _divisions = Division.objects.filter(season=season_id).order_by('name')
         # this wrapper divisions dodge is needed so the teams within each division
         # can be sorted by ranking
         wrapper_divisions = []
         for _division in _divisions:
             _teams = Team.objects.filter(
                 division=_division,
-                season=request.session['season_id']
+                season=season_id
             ).order_by('ranking')
             wrapper_divisions.append({
                 'division': _division,
                 'teams': _teams
             })
-        context = {
-            'divisions': _divisions,
+        table = loader.get_template('stats/divisions_table.html').render(context={
             'wrapper_divisions': wrapper_divisions
+        })
+        return table, [season_tag(season_id)] + [team_tag(t.id) for w in wrapper_divisions for t in w['teams']]
 
-        }
-        page = render(request, 'stats/divisions.html', context)
-        cache.set(divisions_cache_key, page)
-    return page
+    divisions_fragment = Fragment('.'.join(['divisions', str(season_id)]))
+    return divisions_fragment.get_or_render(render_divisions_table, stale=stale)
+
+
+@CheckSeason()
+def divisions(request, season_id=None):
+    return render(request, 'stats/divisions.html', {
+        'divisions': Division.objects.filter(season=season_id).order_by('name'),
+        'divisions_table': divisions_table(season_id),
+    })
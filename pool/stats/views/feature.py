@@ -5,6 +5,8 @@ from str2bool import str2bool
 
 feature_names = [
     'rating',
+    # scores kept up to date on the week and score sheet pages; each page holds a connection open
+    'live_updates',
 ]
 
 
@@ -1,24 +1,30 @@
+import json
+
 from str2bool import str2bool
 
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed
 
-from ..models import Game
+from .. import live
+from ..models import Game, ScoreSheet
 
-from .score_sheet import user_can_edit_scoresheet
+from .score_sheet import score_sheet_editable
 
 
 def update(request):
 
     if request.POST:
 
-        game = get_object_or_404(Game, id=str(request.POST.get('game_id')))
-        score_sheet = game.scoresheet_set.first()
-        if user_can_edit_scoresheet(request, score_sheet.id):
+        game = get_object_or_404(
+            Game.objects.select_related('score_sheet__match'), id=str(request.POST.get('game_id'))
+        )
+        score_sheet = game.score_sheet
+        if score_sheet_editable(request, score_sheet):
             game.winner = request.POST.get('winner')
             game.forfeit = str2bool(request.POST.get('forfeit'))
             game.table_run = str2bool(request.POST.get('table_run'))
             game.save()
+            live.publish_games(score_sheet, [game])
             return JsonResponse({
                 'message': "game {} saved".format(game.id),
                 "data": {
@@ -27,3 +33,52 @@ def update(request):
             })
         else:
             return HttpResponse(status=403)
+
+
+def as_bool(value):
+    return value if isinstance(value, bool) else bool(str2bool(str(value)))
+
+
+def update_batch(request):
+    """
+    Save the results of any number of a score sheet's games at once. The body is JSON, like:
+
+        {"score_sheet_id": 1, "games": [{"game_id": 2, "winner": "away", "forfeit": false, "table_run": true}]}
+
+    The permission check, and the changes, are done once for all of them.
+    """
+
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        data = json.loads(request.body)
+        score_sheet_id = int(data['score_sheet_id'])
+        changes = [{
+            'game_id': int(g['game_id']),
+            'winner': g.get('winner') or '',
+            'forfeit': as_bool(g.get('forfeit', False)),
+            'table_run': as_bool(g.get('table_run', False)),
+        } for g in data['games']]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return HttpResponseBadRequest()
+    if len([c for c in changes if c['winner'] not in ['away', 'home', '']]):
+        return HttpResponseBadRequest()
+
+    score_sheet = get_object_or_404(ScoreSheet.with_matches(ScoreSheet.objects), id=score_sheet_id)
+    if not score_sheet_editable(request, score_sheet):
+        return HttpResponse(status=403)
+
+    try:
+        games = score_sheet.update_games(changes)
+    except Game.DoesNotExist:
+        return HttpResponseBadRequest()
+    live.publish_games(score_sheet, games)
+
+    return JsonResponse({
+        'message': "{} games saved".format(len(games)),
+        'data': {
+            'games': [{'id': g.id, 'timestamp': g.timestamp} for g in games],
+            'wins': {f: getattr(score_sheet, f) for f in ScoreSheet.WINS_FIELDS},
+        },
+    })
@@ -4,10 +4,9 @@ from ..models import Match, PlayerSeasonSummary, ScoreSheet, Week
 from ..models.player_rating import trueskill_env
 
 from ..forms import MatchupForm
+from ..fragments import Fragment, player_tag, ratings_tag, season_tag, team_tag
 from ..views.season import CheckSeason
 
-from trueskill import Rating
-
 import itertools
 import math
 
@@ -24,36 +23,106 @@ def win_probability(p1, p2):
     return trueskill_env.cdf(delta_mu / denominator)
 
 
+def win_probability_matrix(away_ratings, home_ratings):
+    """
+    win_probability() for every away player against every home player, in one pass
+    :param away_ratings: [(mu, sigma), ...]
+    :param home_ratings: [(mu, sigma), ...]
+    :return: a list, for each away player, of their win probabilities against each home player
+    """
+    two_beta_squared = 2 * trueskill_env.beta * trueskill_env.beta
+    cdf = trueskill_env.cdf
+    return [
+        [
+            cdf((away_mu - home_mu) / math.sqrt(two_beta_squared + away_sigma ** 2 + home_sigma ** 2))
+            for home_mu, home_sigma in home_ratings
+        ]
+        for away_mu, away_sigma in away_ratings
+    ]
+
+
+def rated_summaries(season_id, **kwargs):
+    """
+    The rated players' season summaries, with their players, in one query
+    :return: {player_id: PlayerSeasonSummary}
+    """
+    summaries = PlayerSeasonSummary.objects.filter(
+        season_id=season_id, current_mu__isnull=False, **kwargs
+    ).select_related('player').order_by('player__first_name', 'player__last_name')
+    return {s.player_id: s for s in summaries}
+
+
 def get_player_matchups(kind, thing):
-    matchups = []
+    """
+    The away and home players' season summaries for each game on a score sheet, or for every pair of
+    players from a match's teams; players who have not been rated are left out.
+    :return: ([{'away': PlayerSeasonSummary, 'home': PlayerSeasonSummary}], the ids of the match's teams)
+    """
     if kind == 'scoresheet':
-        scoresheets = ScoreSheet.objects.filter(id=thing)
-        if len(scoresheets) == 0:
-            return matchups
-        else:
-            scoresheet = scoresheets[0]
-        for game in scoresheet.games.all():
-            if game.away_player and game.home_player:
-                ap_summary = PlayerSeasonSummary.objects.get(season=scoresheet.match.season, player=game.away_player)
-                hp_summary = PlayerSeasonSummary.objects.get(season=scoresheet.match.season, player=game.home_player)
-                matchups.append({'away': ap_summary, 'home': hp_summary})
+        score_sheet = ScoreSheet.objects.filter(id=thing).select_related('match').first()
+        if score_sheet is None:
+            return [], []
+        match = score_sheet.match
+        season_id = score_sheet.match.season_id
+        pairs = list(score_sheet.games.filter(
+            away_player__isnull=False, home_player__isnull=False
+        ).order_by('order').values_list('away_player_id', 'home_player_id'))
+        away_summaries = rated_summaries(season_id, player_id__in=[p[0] for p in pairs])
+        home_summaries = rated_summaries(season_id, player_id__in=[p[1] for p in pairs])
     elif kind == 'match':
-        matches = Match.objects.filter(id=thing)
-        if len(matches) == 0:
-            return matchups
-        else:
-            match = matches[0]
-        for ap in match.away_team.players.all():
-            for hp in match.home_team.players.all():
-                matchups.append({
-                    'away': PlayerSeasonSummary.objects.get(
-                        season=match.season, player=ap
-                    ),
-                    'home': PlayerSeasonSummary.objects.get(
-                        season=match.season, player=hp
-                    )
-                })
-    return matchups
+        match = Match.objects.filter(id=thing).first()
+        if match is None:
+            return [], []
+        away_summaries = rated_summaries(match.season_id, player__team=match.away_team_id)
+        home_summaries = rated_summaries(match.season_id, player__team=match.home_team_id)
+        pairs = list(itertools.product(away_summaries.keys(), home_summaries.keys()))
+    else:
+        return [], []
+    return [
+        {'away': away_summaries[away_id], 'home': home_summaries[home_id]}
+        for away_id, home_id in pairs if away_id in away_summaries and home_id in home_summaries
+    ], [match.away_team_id, match.home_team_id]
+
+
+def get_match_ups(kind, thing):
+    """
+    The match ups, with the away player's win probability for each, and the expected wins for each side.
+    Cached until players are rated, the teams' rosters change, or, for a score sheet, its lineups or games do.
+    """
+    def render_match_ups():
+        player_matchups, team_ids = get_player_matchups(kind, thing)
+        away_players = {m['away'].player_id: m['away'] for m in player_matchups}
+        home_players = {m['home'].player_id: m['home'] for m in player_matchups}
+        away_index = {player_id: i for i, player_id in enumerate(away_players)}
+        home_index = {player_id: i for i, player_id in enumerate(home_players)}
+        matrix = win_probability_matrix(
+            [(s.current_mu, s.current_sigma) for s in away_players.values()],
+            [(s.current_mu, s.current_sigma) for s in home_players.values()],
+        )
+
+        match_ups = []
+        expected_wins = {
+            'away': 0.0,
+            'home': 0.0,
+        }
+        for m in player_matchups:
+            away_pct = matrix[away_index[m['away'].player_id]][home_index[m['home'].player_id]]
+            expected_wins['away'] += away_pct
+            expected_wins['home'] += 1 - away_pct
+            match_ups.append({
+                'away': m['away'], 'home': m['home'], 'pct': away_pct * 100
+            })
+        cached = (match_ups, expected_wins)
+        summaries = list(away_players.values()) + list(home_players.values())
+        return cached, [season_tag(s.season_id) for s in summaries] + [player_tag(s.player_id) for s in summaries] + \
+            [team_tag(t) for t in team_ids] + [ratings_tag()]
+
+    key = ['matchup', kind, str(thing)]
+    if kind == 'scoresheet':
+        # the games' players are set from the lineups
+        key.append(ScoreSheet(id=thing).content_version())
+    fragment = Fragment('.'.join(key))
+    return fragment.get_or_render(render_match_ups)
 
 
 def get_match(kind, thing):
@@ -78,12 +147,6 @@ def matchup(request):
     assert kind in ['scoresheet', 'match']
     form = MatchupForm(request.GET)
 
-    match_ups = []
-    expected_wins = {
-        'away': 0.0,
-        'home': 0.0,
-    }
-
     weeks = Week.objects.filter(season_id=request.session['season_id'])
     context = {
         'weeks': weeks,
@@ -91,18 +154,7 @@ def matchup(request):
     }
 
     if kind and thing:
-        for m in get_player_matchups(kind, int(thing)):
-            if not(m['away'].rating and m['home'].rating):
-                continue
-            away_pct = win_probability(
-                m['away'].rating,
-                m['home'].rating,
-            )
-            expected_wins['away'] += away_pct
-            expected_wins['home'] += 1 - away_pct
-            match_ups.append({
-                'away': m['away'], 'home': m['home'], 'pct': away_pct * 100
-            })
+        match_ups, expected_wins = get_match_ups(kind, int(thing))
         context.update({
             'match': get_match(kind, thing),
             'match_ups': match_ups,
@@ -4,7 +4,7 @@ from django.template import loader
 
 from ..forms import PlayerForm
 from ..models import Player, PlayerSeasonSummary, ScoreSheet, Season
-from ..utils import page_cache as cache
+from ..fragments import Fragment, player_tag, season_tag
 from ..views import logger
 from ..views.season import CheckSeason
 
@@ -59,31 +59,37 @@ def player(request, player_id, season_id=None):
     return rendered_page
 
 
-@CheckSeason()
-def players(request, season_id=None):
-
-    rating = request.session.get('rating', False)
-    players_table_cache_key = '.'.join(['players_table', str(season_id), str(rating)])
-    players_table = cache.get(players_table_cache_key)
-
-    if not players_table:
+def players_table(season_id, rating, stale=True):
+    """
+    The season's ranked players, from the page cache, or rendered into it; with their ratings, if rating.
+    :param stale: whether a stale copy may be served, see Fragment.get_or_render
+    """
+    def render_players_table():
         order_by_args = ('-win_percentage', '-wins')
-        _players = PlayerSeasonSummary.objects.filter(
+        _players = PlayerSeasonSummary.with_teams(PlayerSeasonSummary.objects.filter(
             season=season_id,
             ranking__gt=0
-        ).order_by(*order_by_args)
+        ).order_by(*order_by_args), season_id)
 
         template = loader.get_template('stats/player_table.html')
 
-        players_table = template.render(request=request, context={
+        _players_table = template.render(context={
             'players': _players,
             'show_teams': True,
             'rating': rating,
         })
-        cache.set(players_table_cache_key, players_table)
+        return _players_table, [season_tag(season_id)] + [player_tag(p.player_id) for p in _players]
+
+    players_table_fragment = Fragment('.'.join(['players_table', str(season_id), str(rating)]))
+    return players_table_fragment.get_or_render(render_players_table, stale=stale)
 
+
+@CheckSeason()
+def players(request, season_id=None):
+
+    rating = request.session.get('rating', False)
     context = {
-        'players_table':  players_table,
+        'players_table': players_table(season_id, rating),
         'rating': rating,
     }
     view = render(request, 'stats/players.html', context)
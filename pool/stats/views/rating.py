@@ -1,27 +1,46 @@
-from django.shortcuts import get_object_or_404, render, redirect
-
-from ..models import Player, PlayerRating
-from ..utils import page_cache as cache
-
-
-def rating(request, player_id):
-
-    player_rating_cache_key = '.'.join(['rating', str(player_id)])
-    player_ratings = cache.get(player_rating_cache_key)
-
-    if not player_ratings:
-
-        this_player = get_object_or_404(Player, id=player_id)
-        ratings = PlayerRating.objects.filter(player=this_player).order_by(
-            '-game__scoresheet__match__week__date',
+from django.db.models import OuterRef, Subquery
+from django.shortcuts import get_object_or_404, render
+from django.template import loader
+
+from ..models import Player, PlayerRating, PlayerSeasonSummary
+from ..fragments import Fragment, player_tag, ratings_tag
+from ..models.globals import away_home
+
+
+def rating_table(this_player):
+    """
+    The player's ratings, game by game, from the page cache, or rendered into it.
+    """
+    def render_rating_table():
+        # the games come with their players and matches, and the opponents' current ratings, which are the same
+        # on all their season summaries, in one query
+        ratings = PlayerRating.objects.filter(player=this_player).select_related(
+            'game__away_player', 'game__home_player',
+            'game__score_sheet__match__away_team', 'game__score_sheet__match__home_team',
+        ).annotate(**{
+            '{}_current_mu'.format(ah): Subquery(PlayerSeasonSummary.objects.filter(
+                player_id=OuterRef('game__{}_player_id'.format(ah))
+            ).order_by('-id').values('current_mu')[:1]) for ah in away_home
+        }).order_by(
+            '-game__score_sheet__match__week__date',
             '-game__order'
         )
-
-        context = {
+        table = loader.get_template('stats/rating_table.html').render(context={
             'player': this_player,
             'ratings': ratings,
-        }
+        })
+        # the opponents' current ratings are shown too
+        return table, [player_tag(this_player.id), ratings_tag()]
+
+    rating_table_fragment = Fragment('.'.join(['rating', str(this_player.id)]))
+    return rating_table_fragment.get_or_render(render_rating_table)
+
+
+def rating(request, player_id):
 
-        player_ratings = render(request, 'stats/rating.html', context)
-        cache.set(player_rating_cache_key, player_ratings)
-    return player_ratings
+    this_player = get_object_or_404(Player, id=player_id)
+    context = {
+        'player': this_player,
+        'rating_table': rating_table(this_player),
+    }
+    return render(request, 'stats/rating.html', context)
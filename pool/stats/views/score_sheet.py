@@ -2,29 +2,33 @@ import logging
 
 import django.forms
 from django.conf import settings
+from django.db import transaction
 from django.forms import modelformset_factory
 from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 
+from .. import live
 from ..forms import AwayLineupFormSet, HomeLineupFormSet, AwaySubstitutionFormSet, HomeSubstitutionFormSet
-from ..models import ScoreSheet, Match, AwayLineupEntry, HomeLineupEntry, PlayPosition, AwaySubstitution, \
-    HomeSubstitution
+from ..models import ScoreSheet, Match, AwayLineupEntry, HomeLineupEntry, AwaySubstitution, HomeSubstitution, \
+    league_config
 from ..utils import session_uid, is_stats_master
 
 
 def score_sheet(request, score_sheet_id):
-    s = get_object_or_404(ScoreSheet, id=score_sheet_id)
+    s = get_object_or_404(ScoreSheet.with_matches(ScoreSheet.objects), id=score_sheet_id)
 
     # normally, you would populate a formset conditionally on whether the request is a POST or not;
     # in this case, the lineups and substitutions are posted to a different view, so that is not necessary.
-    away_lineup_formset = score_sheet_lineup_formset(
-        score_sheet_id=score_sheet_id, away_home='away')(queryset=s.away_lineup.all())
-    home_lineup_formset = score_sheet_lineup_formset(
-        score_sheet_id=score_sheet_id, away_home='home')(queryset=s.home_lineup.all())
-    away_substitutions_formset = substitutions_formset_factory_builder(
-        score_sheet_id=score_sheet_id, away_home='away')(queryset=s.away_substitutions.all())
-    home_substitutions_formset = substitutions_formset_factory_builder(
-        score_sheet_id=score_sheet_id, away_home='home')(queryset=s.home_substitutions.all())
+    away_lineup_formset = score_sheet_lineup_formset(s, away_home='away')(
+        queryset=s.away_lineup.select_related('position'))
+    home_lineup_formset = score_sheet_lineup_formset(s, away_home='home')(
+        queryset=s.home_lineup.select_related('position'))
+    away_substitutions_formset = substitutions_formset_factory_builder(s, away_home='away')(
+        queryset=s.away_substitutions.all())
+    home_substitutions_formset = substitutions_formset_factory_builder(s, away_home='home')(
+        queryset=s.home_substitutions.all())
 
     context = {
         'score_sheet': s,
@@ -33,6 +37,13 @@ def score_sheet(request, score_sheet_id):
         'home_lineup_formset': home_lineup_formset,
         'away_substitutions_formset': away_substitutions_formset,
         'home_substitutions_formset': home_substitutions_formset,
+        # listed with their players, positions and game orders, for their descriptions
+        'away_substitutions': list(s.away_substitutions.select_related(
+            'player', 'play_position', 'game_order__away_position', 'game_order__home_position'
+        )),
+        'home_substitutions': list(s.home_substitutions.select_related(
+            'player', 'play_position', 'game_order__away_position', 'game_order__home_position'
+        )),
     }
     return render(request, 'stats/score_sheet.html', context)
 
@@ -47,19 +58,36 @@ def score_sheet_games(score_sheet_id):
 
 
 def score_sheet_summary(request, score_sheet_id):
-    s = get_object_or_404(ScoreSheet, id=score_sheet_id)
-    summary = s.summary()
-    game_list = []
-    for game in s.games.all():
-        game_list.append(game.as_dict())
-
-    summary.update({'games': game_list})
-    summary.update({'editable': user_can_edit_scoresheet(request, score_sheet_id)})
-    summary.update({'owner': session_uid(request) == s.creator_session})
-    summary.update({'comment': s.comment})
-    summary.update({'complete': s.complete})
-
-    return JsonResponse(summary)
+    """
+    Polled by the score sheet page; the ETag is the score sheet's content version, and whether this user can
+    edit it, so a poll with nothing new gets a 304, without the score sheet being summarized.
+    """
+    s = get_object_or_404(ScoreSheet.with_matches(ScoreSheet.objects), id=score_sheet_id)
+    editable = score_sheet_editable(request, s)
+    owner = session_uid(request) == s.creator_session
+    version = s.content_version()
+    etag = quote_etag('{}-{:d}{:d}'.format(version, editable, owner))
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content = s.load_content()
+        summary = s.summary(content=content, version=version)
+        summary.update({'games': [game.as_dict() for game in content['games']]})
+        summary.update({'editable': editable})
+        summary.update({'owner': owner})
+        summary.update({'comment': s.comment})
+        summary.update({'complete': s.complete})
+        response = JsonResponse(summary)
+    response['ETag'] = etag
+    return response
+
+
+def score_sheet_live(request, score_sheet_id):
+    """
+    Server-sent events for changes to a score sheet; see stats.live. There are no queries here, not even to
+    check the score sheet exists: there will just never be any events for one that doesn't.
+    """
+    return live.stream([live.score_sheet_channel(score_sheet_id)])
 
 
 def score_sheet_create(request):
@@ -67,9 +95,10 @@ def score_sheet_create(request):
     if request.method == 'POST' and 'match_id' in request.POST:
         s = ScoreSheet(match=Match.objects.get(id=request.POST['match_id']))
         s.creator_session = session_uid(request)
-        s.save()
-        s.initialize_lineup()
-        s.initialize_games()
+        with transaction.atomic():
+            s.save()
+            s.initialize_lineup()
+            s.initialize_games()
 
         return redirect('score_sheet', score_sheet_id=s.id)
     else:
@@ -89,13 +118,21 @@ def score_sheet_copy(request):
         return HttpResponseBadRequest
 
 
-def score_sheet_lineup_formset(score_sheet_id, away_home):
-    s = ScoreSheet.objects.get(id=score_sheet_id)
+def choices(objects):
+    """
+    The choices for a ModelChoiceField, from objects already loaded, so each form in a formset doesn't run the
+    field's query to render them.
+    """
+    return [('', '---------')] + [(o.id, str(o)) for o in objects]
+
+
+def score_sheet_lineup_formset(s, away_home):
 
     # it would be prettier to do this by passing kwargs but,
     # it seems you can't do that with a ModelForm so, the ugly is here.
     lineup_team = getattr(s.match, '{}_team'.format(away_home))
     lineup_model = AwayLineupEntry if away_home == 'away' else HomeLineupEntry
+    player_choices = choices(lineup_team.players.all())
 
     class LineupForm(django.forms.ModelForm):
         # thanks to stack overflow for this, from here:
@@ -105,13 +142,17 @@ def score_sheet_lineup_formset(score_sheet_id, away_home):
             required=False,
         )
 
+        def __init__(self, *args, **kwargs):
+            super(LineupForm, self).__init__(*args, **kwargs)
+            self.fields['player'].choices = player_choices
+
     return modelformset_factory(
         model=lineup_model,
         fields=['player'],
         form=LineupForm,
         formset=AwayLineupFormSet if away_home == 'away' else HomeLineupFormSet,
         extra=0,
-        max_num=len(PlayPosition.objects.all()),
+        max_num=len(league_config.play_positions()),
     )
 
 
@@ -119,15 +160,16 @@ def score_sheet_lineup(request, score_sheet_id, away_home):
     s = ScoreSheet.objects.get(id=score_sheet_id)
 
     lineup_m = getattr(s, '{}_lineup'.format(away_home))
-    lineup_queryset = lineup_m.all()
+    lineup_queryset = lineup_m.select_related('position')
 
-    lineup_formset_f = score_sheet_lineup_formset(score_sheet_id, away_home)
+    lineup_formset_f = score_sheet_lineup_formset(s, away_home)
 
     if request.method == 'POST':
         lineup_formset = lineup_formset_f(request.POST, queryset=lineup_queryset)
         if lineup_formset.is_valid():
             lineup_formset.save()
             s.set_games()
+            live.publish_lineup(s)
             return redirect('score_sheet', score_sheet_id=s.id)
         else:
             logging.debug("validation errors:{}".format(lineup_formset.form.non_field_errors))
@@ -142,17 +184,18 @@ def score_sheet_lineup(request, score_sheet_id, away_home):
     return render(request, 'stats/score_sheet_lineup_edit_standalone.html', context)
 
 
-def substitutions_formset_factory_builder(score_sheet_id, away_home):
-    s = ScoreSheet.objects.get(id=score_sheet_id)
-    already_used_players = []
+def substitutions_formset_factory_builder(s, away_home):
     # first exclude players already in the lineup, but not the player in tiebreaker position
-    for x in getattr(s, '{}_lineup'.format(away_home)).filter(position__tiebreaker=False):
-        if x.player is not None:
-            already_used_players.append(x.player.id)
+    already_used_players = getattr(s, '{}_lineup'.format(away_home)).filter(
+        position__tiebreaker=False, player__isnull=False
+    ).values_list('player_id', flat=True)
 
     score_sheet_team = getattr(s.match, '{}_team'.format(away_home))
     substitution_players_queryset = score_sheet_team.players.all().exclude(id__in=already_used_players)
     substitution_model = AwaySubstitution if away_home == 'away' else HomeSubstitution
+    player_choices = choices(substitution_players_queryset)
+    # the game orders are loaded with their positions, see league_config
+    game_order_choices = choices(league_config.game_orders())
 
     class SubstitutionForm(django.forms.ModelForm):
         player = django.forms.ModelChoiceField(
@@ -161,6 +204,11 @@ def substitutions_formset_factory_builder(score_sheet_id, away_home):
         )
         prefix = '{}_substitutions'.format(away_home)
 
+        def __init__(self, *args, **kwargs):
+            super(SubstitutionForm, self).__init__(*args, **kwargs)
+            self.fields['player'].choices = player_choices
+            self.fields['game_order'].choices = game_order_choices
+
     return modelformset_factory(
         model=substitution_model,
         form=SubstitutionForm,
@@ -168,7 +216,7 @@ def substitutions_formset_factory_builder(score_sheet_id, away_home):
         fields=['game_order', 'player'],
         # this may not work for leagues where the game group size is for some reason not the
         # same as the number of players in a lineup
-        max_num=len(score_sheet_team.players.all()) - settings.LEAGUE['game_group_size'],
+        max_num=score_sheet_team.players.count() - settings.LEAGUE['game_group_size'],
         can_delete=True,
     )
 
@@ -179,7 +227,7 @@ def score_sheet_substitutions(request, score_sheet_id, away_home):
     substitution_queryset = getattr(s, '{}_substitutions'.format(away_home)).all()
     add_substitution_function = getattr(s, '{}_substitutions'.format(away_home))
 
-    substitution_formset_f = substitutions_formset_factory_builder(s.id, away_home)
+    substitution_formset_f = substitutions_formset_factory_builder(s, away_home)
 
     if request.method == 'POST':
         substitution_formset = substitution_formset_f(
@@ -192,6 +240,7 @@ def score_sheet_substitutions(request, score_sheet_id, away_home):
                     substitution.player, substitution.play_position, substitution.game_order))
                 add_substitution_function.add(substitution)
             s.set_games()
+            live.publish_lineup(s)
             return redirect('score_sheet', score_sheet_id=s.id)
         else:
             logging.debug("validation errors:{}".format(substitution_formset.form.non_field_errors))
@@ -207,8 +256,10 @@ def score_sheet_substitutions(request, score_sheet_id, away_home):
 
 
 def user_can_edit_scoresheet(request, score_sheet_id):
+    return score_sheet_editable(request, ScoreSheet.objects.get(id=score_sheet_id))
 
-    s = ScoreSheet.objects.get(id=score_sheet_id)
+
+def score_sheet_editable(request, s):
     # you can edit a score sheet if it is not official and either you created it,
     # or you are an admin
     return s.official != 1 and ((session_uid(request) == s.creator_session) or
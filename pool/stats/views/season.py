@@ -15,6 +15,17 @@ def get_default_season():
     return default_season_id
 
 
+def request_seasons(request):
+    """
+    All the seasons, newest first, read once for each request: by its cache policy, and for the menu.
+    :param request:
+    :return: [Season]
+    """
+    if not hasattr(request, 'seasons'):
+        request.seasons = list(Season.objects.order_by('-pub_date'))
+    return request.seasons
+
+
 def set_season(request, season_id=None):
     """
     Allow the user to set their season to a value other than the default.
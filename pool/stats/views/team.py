@@ -6,7 +6,8 @@ from django.template import loader
 
 from ..forms import TeamRegistrationForm
 from ..models import Team, Tie, TieBreakerResult, Season, PlayerSeasonSummary, ScoreSheet, Match
-from ..utils import page_cache as cache, session_uid
+from ..fragments import Fragment, player_tag, season_tag, team_tag
+from ..utils import session_uid
 from ..views.season import CheckSeason
 
 
@@ -33,34 +34,44 @@ def teams(request, season_id=None):
     return render(request, 'stats/teams.html', context)
 
 
-def team(request, team_id, after=None):
-    _team = get_object_or_404(Team, id=team_id)
-
-    rating = request.session.get('rating', False)
-    players_table_cache_key = '.'.join(['players_table', 'team', str(team_id), str(rating)])
-    players_table = cache.get(players_table_cache_key)
-
-    if not players_table:
-        _players = PlayerSeasonSummary.objects.filter(
+def team_players_table(_team, rating, stale=True):
+    """
+    The team's players, from the page cache, or rendered into it; with their ratings, if rating.
+    :param stale: whether a stale copy may be served, see Fragment.get_or_render
+    """
+    def render_players_table():
+        _players = PlayerSeasonSummary.with_teams(PlayerSeasonSummary.objects.filter(
             player_id__in=list([x.id for x in _team.players.all()]),
-            season_id=_team.season.id,
-        ).order_by('player__last_name')
+            season_id=_team.season_id,
+        ).order_by('player__last_name'), _team.season_id)
 
         template = loader.get_template('stats/player_table.html')
 
-        players_table = template.render(request=request, context={
+        players_table = template.render(context={
             'rating': rating,
             'players': _players,
             'show_teams': False,
         })
-        cache.set(players_table_cache_key, players_table)
+        return (
+            players_table,
+            [season_tag(_team.season_id), team_tag(_team.id)] + [player_tag(p.player_id) for p in _players]
+        )
+
+    players_table_fragment = Fragment('.'.join(['players_table', 'team', str(_team.id), str(rating)]))
+    return players_table_fragment.get_or_render(render_players_table, stale=stale)
+
+
+def team(request, team_id, after=None):
+    _team = get_object_or_404(Team, id=team_id)
+
+    players_table = team_players_table(_team, request.session.get('rating', False))
 
-    official_score_sheets = ScoreSheet.objects.filter(official=True).filter(
+    official_score_sheets = ScoreSheet.with_matches(ScoreSheet.objects.filter(official=True).filter(
         Q(match__away_team=_team) | Q(match__home_team=_team)
-    ).order_by('match__week__date')
-    unofficial_score_sheets = ScoreSheet.objects.filter(official=False).filter(
+    ).order_by('match__week__date'))
+    unofficial_score_sheets = ScoreSheet.with_matches(ScoreSheet.objects.filter(official=False).filter(
         Q(match__away_team=_team) | Q(match__home_team=_team)
-    ).order_by('match__week__date')
+    ).order_by('match__week__date'))
 
     # we don't expect people to actually use the 'after' parameter, it is really to make test data
     # with long-ago dates usable .
@@ -72,7 +83,7 @@ def team(request, team_id, after=None):
     after_date -= datetime.timedelta(days=2)
     _matches = Match.objects.filter(week__date__gt=after_date).filter(
         Q(away_team=_team) | Q(home_team=_team)
-    ).order_by('week__date')
+    ).select_related('week', 'away_team', 'home_team').order_by('week__date')
 
     context = {
         'team': _team,
@@ -147,25 +147,10 @@ def tournament_participants(request, tournament_id):
 
 def tournament_brackets(request, tournament_id):
 
-    finals_rounds = ['first', 'second']
     t = Tournament.objects.get(id=tournament_id)
     if not t.editable(request):
         return redirect('tournament', t.id)
-    t.create_brackets()
-    t.create_rounds()
-
-    for b in t.bracket_set.all():
-        for r in b.round_set.all():
-            r.create_matchups()
-    if t.elimination == 'double':
-        winners_bracket = t.bracket_set.get(type='w')
-        i = 0
-        for _round in winners_bracket.round_set.filter(number__gt=t.round_count()).order_by('number'):
-            _round.create_finals_matchup(finals_rounds[i])
-            i += 1
-    else:
-        if t.third_place:
-            t.create_third_place_matchup()
+    t.build_brackets()
     return redirect('tournament', tournament_id)
 
 
@@ -1,8 +1,10 @@
 import datetime
 
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.cache import never_cache
 
+from .. import live
 from ..models import Week, ScoreSheet, Season
 from ..views.season import CheckSeason
 from ..forms import ScoreSheetCreationForm
@@ -15,13 +17,19 @@ def week(request, week_id):
     unofficial_matches = []
     alternate_tables = []
 
-    for a_match in _week.match_set.all():
+    matches = _week.match_set.select_related(
+        'away_team', 'home_team', 'home_team__table', 'alternate_table',
+    ).prefetch_related(
+        Prefetch('scoresheets', queryset=ScoreSheet.with_matches(ScoreSheet.objects.order_by('id')))
+    )
+    for a_match in matches:
         # an 'official' match has exactly one score sheet, which has been marked official;
         # also in the template, official matches are represented by their score sheet,
         # unofficial matches by the match
-        match_score_sheets = ScoreSheet.objects.filter(match=a_match)
-        if len(match_score_sheets.filter(official=True)) == 1:
-            official_matches.append(match_score_sheets.filter(official=True)[0])
+        match_score_sheets = a_match.scoresheets.all()
+        official_score_sheets = [s for s in match_score_sheets if s.official == 1]
+        if len(official_score_sheets) == 1:
+            official_matches.append(official_score_sheets[0])
         else:
             unofficial_matches.append({
                 'score_sheet_form': ScoreSheetCreationForm(instance=a_match),
@@ -33,6 +41,8 @@ def week(request, week_id):
 
     context = {
         'week': _week,
+        'previous_week': _week.previous(),
+        'next_week': _week.next(),
         'alternate_tables': alternate_tables,
         'unofficial_matches': unofficial_matches,
         'official_matches': official_matches
@@ -40,6 +50,13 @@ def week(request, week_id):
     return render(request, 'stats/week.html', context)
 
 
+def week_live(request, week_id):
+    """
+    Server-sent events for the scores of a week's score sheets, without any queries; see stats.live.
+    """
+    return live.stream([live.week_channel(week_id)])
+
+
 @CheckSeason(do_redirect=False)
 def weeks(request):
     _season = Season.objects.get(id=request.session['season_id'])
@@ -0,0 +1,56 @@
+"""
+Render a season's busiest pages' fragments into the page cache after its stats are updated, so the first
+visitors after league night don't each pay for rendering them.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Team
+from .models.globals import logger
+from .views.division import divisions_table
+from .views.player import players_table
+from .views.team import team_players_table
+
+
+def season_pages(season_id):
+    """
+    :return: [(name, function, args)], the fragments to render for the season
+    """
+    pages = [('players{}'.format(' with ratings' if rating else ''), players_table, (season_id, rating, False))
+             for rating in [False, True]]
+    pages.append(('divisions', divisions_table, (season_id, False)))
+    for team in Team.objects.filter(season_id=season_id).order_by('name'):
+        pages += [
+            ('team {}{}'.format(team, ' with ratings' if rating else ''), team_players_table, (team, rating, False))
+            for rating in [False, True]
+        ]
+    return pages
+
+
+def render_page(name, function, args):
+    start = time.monotonic()
+    error = None
+    try:
+        function(*args)
+    except Exception as e:
+        logger.exception('warming {} failed'.format(name))
+        error = str(e)
+    finally:
+        # each thread has its own database connection
+        connections.close_all()
+    return {'page': name, 'seconds': time.monotonic() - start, 'error': error}
+
+
+def warm_season(season_id, workers=None):
+    """
+    Render the season's players tables, with and without ratings, its divisions, and each of its teams'
+    players tables, on a pool of workers threads; fragments that are already fresh are just read, and stale
+    ones are rendered again, rather than served as they are.
+    :return: [{'page': name, 'seconds': seconds, 'error': None or why it failed}]
+    """
+    pages = season_pages(season_id)
+    with ThreadPoolExecutor(max_workers=workers or settings.CACHE_WARMING_WORKERS) as executor:
+        return list(executor.map(lambda page: render_page(*page), pages))